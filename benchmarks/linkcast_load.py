@@ -0,0 +1,140 @@
+"""Hammers the linkcast server with concurrent keep-alive clients
+
+The server runs in-process against the stub Kodi modules from tests/stubs.
+Each client posts linkcasts to /linkcast.xhp over one keep-alive connection,
+reconnecting whenever the server closes it. Idle keep-alive connections, as
+left open by phones that made one request, can be added alongside with
+--idle, and the builtin that starts the plugin can be slowed down with
+--builtin-ms. The latency percentiles are reported at the end.
+
+    python benchmarks/linkcast_load.py [--clients N] [--requests N]
+        [--idle N] [--builtin-ms MS]
+"""
+import argparse
+import collections
+import contextlib
+import http.client
+import os
+import statistics
+import sys
+import tempfile
+import threading
+import time
+import urllib.parse
+
+REPOSITORY_FOLDER = os.path.dirname(os.path.dirname(os.path.abspath(
+    __file__)))
+sys.path.insert(0, os.path.join(
+    REPOSITORY_FOLDER, 'plugin.program.remote.control.browser'))
+sys.path.append(os.path.join(REPOSITORY_FOLDER, 'tests', 'stubs'))
+
+import service  # noqa: E402
+
+
+CLIENT_TIMEOUT = 30  # seconds
+FORM_HEADERS = {'Content-Type': 'application/x-www-form-urlencoded'}
+
+
+def getPercentile(sortedValues, fraction):
+    return sortedValues[min(
+        len(sortedValues) - 1, int(len(sortedValues) * fraction))]
+
+
+def runClient(port, requestCount, latencies, errors, lock):
+    body = urllib.parse.urlencode({'url': 'https://example.com/'})
+    connection = None
+    try:
+        for _ in range(requestCount):
+            if connection is None:
+                connection = http.client.HTTPConnection(
+                    '127.0.0.1', port, timeout=CLIENT_TIMEOUT)
+            startTime = time.monotonic()
+            try:
+                connection.request(
+                    'POST', '/linkcast.xhp', body, FORM_HEADERS)
+                response = connection.getresponse()
+                response.read()
+            except (OSError, http.client.HTTPException) as e:
+                with lock:
+                    errors.append(e)
+                connection.close()
+                connection = None
+                continue
+            with lock:
+                latencies.append(time.monotonic() - startTime)
+            if response.status != 200:
+                with lock:
+                    errors.append(response.status)
+            if response.will_close:
+                connection.close()
+                connection = None
+    finally:
+        if connection is not None:
+            connection.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--clients', type=int, default=32)
+    parser.add_argument('--requests', type=int, default=200)
+    parser.add_argument('--idle', type=int, default=0)
+    parser.add_argument('--builtin-ms', type=float, default=0)
+    args = parser.parse_args()
+
+    if args.builtin_ms:
+        service.xbmc.executebuiltin = (
+            lambda function, wait=False: time.sleep(args.builtin_ms / 1000))
+    with tempfile.TemporaryDirectory() as profileFolder:
+        os.environ['KODI_STUB_PROFILE'] = profileFolder
+        addon = service.RemoteControlBrowserService()
+        server = service.LinkcastServer(addon, ('127.0.0.1', 0))
+        port = server.server_address[1]
+        serverThread = threading.Thread(target=server.serve_forever)
+        serverThread.start()
+        try:
+            with contextlib.ExitStack() as stack:
+                for _ in range(args.idle):
+                    connection = stack.enter_context(contextlib.closing(
+                        http.client.HTTPConnection('127.0.0.1', port)))
+                    connection.request('GET', '/')
+                    connection.getresponse().read()
+
+                latencies = []
+                errors = []
+                lock = threading.Lock()
+                clients = [
+                    threading.Thread(
+                        target=runClient,
+                        args=(port, args.requests, latencies, errors, lock))
+                    for _ in range(args.clients)]
+                startTime = time.monotonic()
+                for client in clients:
+                    client.start()
+                for client in clients:
+                    client.join()
+                duration = time.monotonic() - startTime
+        finally:
+            server.shutdown()
+            serverThread.join()
+            server.server_close()
+
+    latencies.sort()
+    print('{} clients, {} idle connections: {} requests in {:.2f} s '
+          '({:.0f}/s), {} errors'.format(
+              args.clients, args.idle, len(latencies), duration,
+              len(latencies) / duration, len(errors)))
+    if errors:
+        print('Errors: ' + ', '.join(
+            '{} x {}'.format(count, error) for (error, count)
+            in collections.Counter(
+                error if isinstance(error, int) else type(error).__name__
+                for error in errors).most_common()))
+    if latencies:
+        print('p50 {:.1f} ms, p99 {:.1f} ms, max {:.1f} ms'.format(
+            statistics.median(latencies) * 1000,
+            getPercentile(latencies, 0.99) * 1000,
+            latencies[-1] * 1000))
+
+
+if __name__ == '__main__':
+    main()
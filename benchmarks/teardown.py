@@ -0,0 +1,196 @@
+"""Compares tearing down a forking browser by process group and by tree walk
+
+A stand-in browser forks renderer-like children that ignore SIGTERM, some of
+which fork children of their own, plus one daemonized child that starts its
+own session. The leader exits on SIGTERM, as a browser's main process does.
+
+The current teardown (browse.execBrowser, by process group or cgroup) is
+timed against the psutil tree walk that it replaced, and every process that
+survives each teardown is counted as leaked. Without psutil, the tree walk
+follows parent links through procfs instead.
+
+    python benchmarks/teardown.py [--children N] [--rounds N]
+"""
+import argparse
+import logging
+import os
+import signal
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+ADDON_FOLDER = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+    'plugin.program.remote.control.browser')
+sys.path.insert(0, ADDON_FOLDER)
+
+import browse  # noqa: E402
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+
+STARTUP_TIMEOUT = 10  # seconds
+SETTLE_DELAY = 0.2  # seconds
+STAND_IN_BROWSER = r'''
+import os
+import signal
+import sys
+import time
+
+(pidPath, childCount) = (sys.argv[1], int(sys.argv[2]))
+
+def record():
+    with open(pidPath, 'a') as pidFile:
+        pidFile.write('{}\n'.format(os.getpid()))
+
+def linger():
+    signal.signal(signal.SIGTERM, signal.SIG_IGN)
+    record()
+    while True:
+        time.sleep(60)
+
+for index in range(childCount):
+    if os.fork() == 0:
+        # Every other renderer forks a helper of its own.
+        if index % 2 and os.fork() == 0:
+            linger()
+        linger()
+if os.fork() == 0:
+    os.setsid()
+    if os.fork() == 0:
+        linger()
+    os._exit(0)
+record()
+signal.signal(signal.SIGTERM, lambda signum, frame: os._exit(0))
+while True:
+    time.sleep(60)
+'''
+
+
+def getExpectedCount(childCount):
+    return 1 + childCount + childCount // 2 + 1
+
+
+def getChildPids(pid):
+    """Returns the children of a process, through procfs"""
+    children = []
+    for entry in os.listdir('/proc'):
+        if not entry.isdigit():
+            continue
+        stat = browse.readProcessStat(entry)
+        if stat is not None and stat[1] == pid:
+            children.append(int(entry, 10))
+    return children
+
+
+def getProcessTree(parent):
+    """Lists a process and its descendants, as the old teardown did"""
+    if psutil is not None:
+        try:
+            process = psutil.Process(parent)
+            return [parent] + [
+                child.pid for child in process.children(recursive=True)]
+        except psutil.NoSuchProcess:
+            return []
+    tree = [parent]
+    for pid in tree:
+        tree.extend(getChildPids(pid))
+    return tree
+
+
+def killTree(proc, sig):
+    for pid in getProcessTree(proc.pid):
+        try:
+            os.kill(pid, sig)
+        except OSError:
+            pass
+
+
+def tearDownByTreeWalk(proc):
+    """Mirrors the teardown that preceded process groups and cgroups"""
+    killTree(proc, signal.SIGTERM)
+    terminator = threading.Timer(
+        browse.BROWSER_EXIT_DELAY.total_seconds(),
+        lambda: killTree(proc, signal.SIGKILL))
+    terminator.start()
+    try:
+        proc.wait()
+    finally:
+        terminator.cancel()
+        terminator.join()
+
+
+def waitForStandIn(pidPath, expectedCount):
+    deadline = time.monotonic() + STARTUP_TIMEOUT
+    while time.monotonic() < deadline:
+        with open(pidPath) as pidFile:
+            pids = [int(line) for line in pidFile if line.strip()]
+        if len(pids) >= expectedCount:
+            return pids
+        time.sleep(0.01)
+    raise RuntimeError('The stand-in browser failed to start')
+
+
+def countLeaks(pids):
+    time.sleep(SETTLE_DELAY)
+    leaked = [pid for pid in pids if browse.isProcessRunning(pid)]
+    for pid in leaked:
+        try:
+            os.kill(pid, signal.SIGKILL)
+        except OSError:
+            pass
+    return len(leaked)
+
+
+def runTreeWalk(browserCmd, pidPath, expectedCount):
+    proc = subprocess.Popen(browserCmd, close_fds=True)
+    pids = waitForStandIn(pidPath, expectedCount)
+    startTime = time.monotonic()
+    tearDownByTreeWalk(proc)
+    return (time.monotonic() - startTime, countLeaks(pids))
+
+
+def runGroup(browserCmd, pidPath, expectedCount):
+    with browse.execBrowser(browserCmd):
+        pids = waitForStandIn(pidPath, expectedCount)
+        startTime = time.monotonic()
+    return (time.monotonic() - startTime, countLeaks(pids))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--children', type=int, default=20)
+    parser.add_argument('--rounds', type=int, default=5)
+    args = parser.parse_args()
+    browse.logger.setLevel(logging.WARNING)
+
+    expectedCount = getExpectedCount(args.children)
+    print('Stand-in browser with {} processes, tree walk through {}'.format(
+        expectedCount, 'procfs' if psutil is None else 'psutil'))
+    for (name, run) in (('process group', runGroup),
+                        ('tree walk', runTreeWalk)):
+        durations = []
+        leaks = []
+        for _ in range(args.rounds):
+            with tempfile.TemporaryDirectory() as folder:
+                pidPath = os.path.join(folder, 'pids')
+                open(pidPath, 'w').close()
+                browserCmd = [
+                    sys.executable, '-c', STAND_IN_BROWSER, pidPath,
+                    str(args.children)]
+                (duration, leaked) = run(browserCmd, pidPath, expectedCount)
+            durations.append(duration)
+            leaks.append(leaked)
+        print('{:>14}: median teardown {:7.1f} ms, leaked {}'.format(
+            name, statistics.median(durations) * 1000,
+            '/'.join(str(leaked) for leaked in leaks)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,21 @@
+import contextlib
+import os
+import tempfile
+
+
+@contextlib.contextmanager
+def atomicWrite(path, mode='wb'):
+    """Opens a temporary file that replaces path once it is fully written
+
+    Readers see either the old file or the new one, never a partial write.
+    The temporary file is removed if writing fails.
+    """
+    (fd, tempPath) = tempfile.mkstemp(dir=os.path.dirname(path))
+    try:
+        with os.fdopen(fd, mode) as tempFile:
+            yield tempFile
+        os.replace(tempPath, path)
+        tempPath = None
+    finally:
+        if tempPath is not None:
+            os.remove(tempPath)
@@ -0,0 +1,197 @@
+import collections
+import contextlib
+import os
+import sqlite3
+import uuid
+import xml.etree.ElementTree
+
+import atomicfile
+
+
+SCHEMA_VERSION = 1
+BUSY_TIMEOUT = 10  # seconds
+BOOKMARK_FIELDS = ('id', 'title', 'url', 'lircrc', 'thumb')
+
+
+Bookmark = collections.namedtuple('Bookmark', BOOKMARK_FIELDS)
+
+
+def parseXml(path):
+    tree = xml.etree.ElementTree.parse(path)
+    return [
+        Bookmark(*(element.get(field) for field in BOOKMARK_FIELDS))
+        for element in tree.iter('bookmark')]
+
+
+def repairLegacyBookmark(bookmark):
+    """Fills in the fields that the store requires but old XML may lack"""
+    # INSERT OR IGNORE does not ignore NOT NULL violations.
+    return bookmark._replace(
+        id=bookmark.id or str(uuid.uuid4()),
+        title=bookmark.title or '',
+        url=bookmark.url or '')
+
+
+class BookmarkStore(object):
+    """Keeps bookmarks in SQLite so that each edit only touches its own row
+
+    The database starts out as a copy of the first legacy XML file that can be
+    parsed, which is normally the user's old bookmarks or else the defaults.
+    """
+
+    def __init__(self, path, legacyPaths):
+        self.path = path
+        self.legacyPaths = legacyPaths
+        self.connection = None
+
+    def open(self):
+        # Transactions are managed explicitly, so that a read-modify-write is
+        # never interleaved with another process's write.
+        self.connection = sqlite3.connect(
+            self.path, timeout=BUSY_TIMEOUT, isolation_level=None)
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        # Only the first open takes the write lock, so that readers never
+        # queue behind each other. The version is checked again under the
+        # lock, in case another process created the store in between.
+        if self.getSchemaVersion() >= SCHEMA_VERSION:
+            return
+        with self.transaction():
+            if self.getSchemaVersion() < SCHEMA_VERSION:
+                self.createSchema()
+                self.migrate()
+                self.connection.execute(
+                    'PRAGMA user_version={:d}'.format(SCHEMA_VERSION))
+
+    def getSchemaVersion(self):
+        (version,) = self.connection.execute('PRAGMA user_version').fetchone()
+        return version
+
+    def close(self):
+        if self.connection is not None:
+            self.connection.close()
+            self.connection = None
+
+    @contextlib.contextmanager
+    def transaction(self):
+        self.connection.execute('BEGIN IMMEDIATE')
+        try:
+            yield
+        except BaseException:
+            self.connection.execute('ROLLBACK')
+            raise
+        self.connection.execute('COMMIT')
+
+    def createSchema(self):
+        self.connection.execute(
+            'CREATE TABLE bookmarks ('
+            'position INTEGER PRIMARY KEY, '
+            'id TEXT NOT NULL UNIQUE, '
+            'title TEXT NOT NULL, '
+            'url TEXT NOT NULL, '
+            'lircrc TEXT, '
+            'thumb TEXT)')
+        self.connection.execute(
+            'CREATE INDEX bookmarks_title ON bookmarks (title)')
+        self.connection.execute(
+            'CREATE INDEX bookmarks_thumb ON bookmarks (thumb)')
+        self.connection.execute(
+            'CREATE TABLE metadata ('
+            'key TEXT PRIMARY KEY, '
+            'value INTEGER NOT NULL)')
+        self.connection.execute(
+            'INSERT INTO metadata (key, value) '
+            "VALUES ('generation', 0)")
+
+    def migrate(self):
+        for legacyPath in self.legacyPaths:
+            try:
+                legacyBookmarks = parseXml(legacyPath)
+            except (IOError, xml.etree.ElementTree.ParseError):
+                continue
+            self.connection.executemany(
+                'INSERT OR IGNORE INTO bookmarks (id, title, url, lircrc, thumb) '
+                'VALUES (?, ?, ?, ?, ?)',
+                (repairLegacyBookmark(bookmark)
+                 for bookmark in legacyBookmarks))
+            return
+
+    def getGeneration(self):
+        """Returns a counter that changes whenever any bookmark changes"""
+        (generation,) = self.connection.execute(
+            "SELECT value FROM metadata WHERE key = 'generation'").fetchone()
+        return generation
+
+    def bumpGeneration(self):
+        self.connection.execute(
+            "UPDATE metadata SET value = value + 1 WHERE key = 'generation'")
+
+    def list(self):
+        return [
+            Bookmark(*row) for row in self.connection.execute(
+                'SELECT id, title, url, lircrc, thumb FROM bookmarks '
+                'ORDER BY position')]
+
+    def get(self, bookmarkId):
+        row = self.connection.execute(
+            'SELECT id, title, url, lircrc, thumb FROM bookmarks WHERE id = ?',
+            (bookmarkId,)).fetchone()
+        return None if row is None else Bookmark(*row)
+
+    def countThumbUsers(self, thumbId):
+        """Returns the number of bookmarks that share a thumbnail"""
+        (count,) = self.connection.execute(
+            'SELECT COUNT(*) FROM bookmarks WHERE thumb = ?',
+            (thumbId,)).fetchone()
+        return count
+
+    def add(self, bookmark):
+        with self.transaction():
+            self.connection.execute(
+                'INSERT INTO bookmarks (id, title, url, lircrc, thumb) '
+                'VALUES (?, ?, ?, ?, ?)',
+                bookmark)
+            self.bumpGeneration()
+
+    def update(self, bookmarkId, **fields):
+        """Changes some fields of one bookmark and returns its old version"""
+        for field in fields:
+            if field not in BOOKMARK_FIELDS[1:]:
+                raise ValueError('Unrecognized bookmark field: ' + field)
+        with self.transaction():
+            previous = self.get(bookmarkId)
+            if previous is None:
+                raise ValueError('Unrecognized bookmark ID: ' + bookmarkId)
+            self.connection.execute(
+                'UPDATE bookmarks SET {} WHERE id = ?'.format(', '.join(
+                    field + ' = ?' for field in fields)),
+                tuple(fields.values()) + (bookmarkId,))
+            self.bumpGeneration()
+        return previous
+
+    def remove(self, bookmarkId):
+        """Deletes one bookmark and returns it"""
+        with self.transaction():
+            previous = self.get(bookmarkId)
+            if previous is None:
+                raise ValueError('Unrecognized bookmark ID: ' + bookmarkId)
+            self.connection.execute(
+                'DELETE FROM bookmarks WHERE id = ?', (bookmarkId,))
+            self.bumpGeneration()
+        return previous
+
+    def exportXml(self, path):
+        """Writes a backup in the legacy XML format"""
+        root = xml.etree.ElementTree.Element('bookmarks', {'version': '1.0'})
+        for bookmark in self.list():
+            xml.etree.ElementTree.SubElement(
+                root,
+                'bookmark',
+                dict(
+                    (field, value)
+                    for (field, value) in bookmark._asdict().items()
+                    if value is not None))
+        if hasattr(xml.etree.ElementTree, 'indent'):
+            xml.etree.ElementTree.indent(root, space='    ')
+        with atomicfile.atomicWrite(path) as exportFile:
+            xml.etree.ElementTree.ElementTree(root).write(
+                exportFile, encoding='UTF-8', xml_declaration=True)
@@ -4,16 +4,23 @@ import argparse
 import collections
 import contextlib
 import datetime
-import errno
+import fcntl
+import heapq
+import itertools
 import logging
+import math
 import os
-import select
+import selectors
 import shlex
 import signal
 import socket
+import struct
 import subprocess
 import sys
 import threading
+import time
+
+import keymap
 
 
 logger = logging.getLogger('remotecontrolbrowser')
@@ -28,11 +35,6 @@ try:
 except ImportError:
     logger.debug('Missing Python package: alsaaudio')
     alsaaudio = None
-try:
-    import psutil
-except ImportError:
-    logger.debug('Missing Python package: psutil')
-    psutil = None
 try:
     import pulsectl
 except ImportError:
@@ -43,6 +45,15 @@ try:
 except ImportError:
     logger.debug('Missing Python package: pylirc')
     pylirc = None
+try:
+    import Xlib.X
+    import Xlib.XK
+    import Xlib.display
+    import Xlib.error
+    import Xlib.ext.xtest
+except ImportError:
+    logger.debug('Missing Python package: python-xlib')
+    Xlib = None
 
 
 VOLUME_MIN = 0
@@ -50,11 +61,28 @@ VOLUME_MAX = 100
 DEFAULT_VOLUME = 50
 DEFAULT_VOLUME_STEP = 1
 RELEASE_KEY_DELAY = datetime.timedelta(seconds=1)
+DEFAULT_REPEAT_HORIZON = datetime.timedelta(milliseconds=250)
+POINTER_TICK_INTERVAL = datetime.timedelta(milliseconds=16)
+POINTER_HOLD_TIMEOUT_MIN = datetime.timedelta(milliseconds=50)
+POINTER_HOLD_TIMEOUT_MAX = datetime.timedelta(milliseconds=300)
+POINTER_PRESS_STEP = 4
 BROWSER_EXIT_DELAY = datetime.timedelta(seconds=3)
+BROWSER_REAP_DELAY = datetime.timedelta(seconds=1)
+BROWSER_REAP_INTERVAL = datetime.timedelta(milliseconds=10)
+BROWSER_FORWARD_DELAY = datetime.timedelta(seconds=10)
+CGROUP_PREFIX = 'remotecontrolbrowser-'
+UINPUT_PATH = '/dev/uinput'
+UINPUT_DEVICE_NAME = b'Remote Control Browser'
 
 
 PylircCode = collections.namedtuple('PylircCode', ('config', 'repeat'))
 
+# Abstract input events, which are produced by the LIRC command handlers and
+# consumed by whichever injector is active.
+KeyInput = collections.namedtuple('KeyInput', ('keys',))
+ClickInput = collections.namedtuple('ClickInput', ('button',))
+MoveInput = collections.namedtuple('MoveInput', ('horizontal', 'vertical'))
+
 
 class AlsaMixer(object):
     """Mixer that wraps ALSA"""
@@ -170,12 +198,13 @@ def abortContext():
 
 
 @contextlib.contextmanager
-def suspendParentProcess(isEnabled):
+def suspendParentProcess(isEnabled, kodiPid=None):
     if not isEnabled:
         logger.debug('Not suspending Kodi')
         yield
         return
-    parent = os.getppid()
+    # Kodi is only the parent when the wrapper is not forked by the launcher.
+    parent = os.getppid() if kodiPid is None else kodiPid
     logger.info('Suspending Kodi')
     os.kill(parent, signal.SIGSTOP)
     try:
@@ -201,88 +230,1111 @@ def runPylirc(configuration):
         pylirc.exit()
 
 
-def monitorProcess(proc, exitSocket):
-    proc.wait()
-    exitSocket.shutdown(socket.SHUT_RDWR)
+class ProcessExitSource(object):
+    """Becomes readable when a child process exits
+
+    Where the kernel supports it, a pidfd is polled directly. Elsewhere a
+    SIGCHLD wakes the loop through signal.set_wakeup_fd, and the child is
+    polled to filter out signals that are unrelated to it.
+    """
 
+    def __init__(self, proc, reason):
+        self.proc = proc
+        self.reason = reason
+        self.pidfd = None
+        self.sink = None
+        self.source = None
+        self.previousWakeupFd = None
+        self.previousHandler = None
 
-def getProcessTree(parent):
-    if psutil is None:
-        logger.debug('Not searching for process descendents')
-        return [parent]
+    def open(self):
+        try:
+            self.pidfd = os.pidfd_open(self.proc.pid)
+            logger.debug('Watching the browser with a pidfd')
+            return
+        except (AttributeError, OSError) as e:
+            logger.debug('Falling back to SIGCHLD: ' + str(e))
+
+        (self.sink, self.source) = socket.socketpair()
+        self.sink.setblocking(False)
+        self.source.setblocking(False)
+        # A Python-level handler is needed, or else the signal is ignored
+        # without waking anything.
+        self.previousHandler = signal.signal(
+            signal.SIGCHLD, lambda signal, frame: None)
+        self.previousWakeupFd = signal.set_wakeup_fd(
+            self.source.fileno(), warn_on_full_buffer=False)
+        # The child may have exited before the handler was installed.
+        if self.proc.poll() is not None:
+            self.source.send(b'\0')
+
+    def close(self):
+        if self.pidfd is not None:
+            os.close(self.pidfd)
+            self.pidfd = None
+        if self.source is not None:
+            signal.set_wakeup_fd(self.previousWakeupFd)
+            signal.signal(signal.SIGCHLD, self.previousHandler)
+            self.sink.close()
+            self.source.close()
+            self.sink = None
+            self.source = None
+
+    def fileno(self):
+        return self.pidfd if self.pidfd is not None else self.sink.fileno()
+
+    def onReadable(self, loop):
+        if self.sink is not None:
+            try:
+                while self.sink.recv(4096):
+                    pass
+            except BlockingIOError:
+                pass
+            if self.proc.poll() is None:
+                return
+        logger.info('Exiting because ' + self.reason)
+        loop.stop()
+
+
+def findCgroupRoot():
+    try:
+        with open('/proc/self/mounts') as mountsFile:
+            for line in mountsFile:
+                fields = line.split()
+                if len(fields) > 2 and fields[2] == 'cgroup2':
+                    return fields[1]
+    except IOError:
+        pass
+    return None
+
+
+def findOwnCgroup():
+    root = findCgroupRoot()
+    if root is None:
+        return None
     try:
-        process = psutil.Process(parent)
+        with open('/proc/self/cgroup') as cgroupFile:
+            for line in cgroupFile:
+                (hierarchy, controllers, path) = line.rstrip('\n').split(':', 2)
+                if hierarchy == '0' and not controllers:
+                    return os.path.join(root, path.lstrip('/'))
+    except (IOError, ValueError):
+        pass
+    return None
+
+
+def readProcessStat(pid):
+    """Returns the state, parent and process group of a process"""
+    try:
+        with open(os.path.join('/proc', str(pid), 'stat')) as statFile:
+            stat = statFile.read()
+    except IOError:
+        return None
+    # The command name may contain spaces, so the fields are counted from the
+    # closing parenthesis.
+    (state, ppid, pgrp) = stat[stat.rindex(')') + 2:].split()[:3]
+    return (state, int(ppid, 10), int(pgrp, 10))
+
+
+def isProcessRunning(pid):
+    stat = readProcessStat(pid)
+    return stat is not None and stat[0] != 'Z'
+
+
+class AdoptedProcess(object):
+    """Stands in for the Popen of a browser that was started elsewhere
+
+    The process is not a child of the wrapper, so it can only be watched
+    through a pidfd and polled through procfs.
+    """
+
+    def __init__(self, pid):
+        self.pid = pid
+        self.returncode = None
+
+    def poll(self):
+        if self.returncode is None and not isProcessRunning(self.pid):
+            self.returncode = 0
+        return self.returncode
+
+    def wait(self):
+        while self.poll() is None:
+            time.sleep(BROWSER_REAP_INTERVAL.total_seconds())
+        return self.returncode
+
+
+class BrowserGroup(object):
+    """Holds every process that the browser forks
+
+    The browser leads its own process group, so one killpg reaches all of its
+    descendants. When a delegated cgroup v2 subtree is writable, the browser
+    is also placed in a transient child cgroup, which catches descendants that
+    start a new session as well.
+    """
+
+    def __init__(self):
+        self.pgid = None
+        self.cgroup = None
+
+    def createCgroup(self):
+        parent = findOwnCgroup()
+        if parent is None:
+            return
+        cgroup = os.path.join(parent, CGROUP_PREFIX + str(os.getpid()))
+        try:
+            os.mkdir(cgroup)
+        except OSError as e:
+            logger.debug('Not using a cgroup: ' + str(e))
+            return
+        if not os.access(os.path.join(cgroup, 'cgroup.procs'), os.W_OK):
+            os.rmdir(cgroup)
+            return
+        self.cgroup = cgroup
+        logger.debug('Created cgroup: ' + cgroup)
+
+    def joinCgroup(self):
+        """Runs in the forked child before the browser executes"""
+        if self.cgroup is not None:
+            try:
+                with open(os.path.join(self.cgroup, 'cgroup.procs'),
+                          'w') as procsFile:
+                    procsFile.write('0')
+            except IOError:
+                pass
+
+    def launch(self, browserCmd):
+        self.createCgroup()
+        proc = subprocess.Popen(
+            browserCmd,
+            close_fds=True,
+            start_new_session=True,
+            preexec_fn=self.joinCgroup)
+        self.pgid = proc.pid
+        return proc
+
+    def getCgroupPids(self):
         try:
-            children = process.children
-        except AttributeError:
-            children = process.get_children
-        processes = [process] + children(recursive=True)
-        return [node.pid for node in processes]
-    except psutil.NoSuchProcess:
-        logger.debug('Failed to find process tree')
-        return []
-
-
-def killBrowser(proc, sig):
-    for pid in getProcessTree(proc.pid):
+            with open(os.path.join(self.cgroup, 'cgroup.procs')) as procsFile:
+                return [int(line, 10) for line in procsFile if line.strip()]
+        except (IOError, ValueError):
+            return []
+
+    def adopt(self, pid):
+        """Takes over a spare browser that leads its own process group"""
+        stat = readProcessStat(pid)
+        if stat is None or stat[0] == 'Z' or stat[2] != pid:
+            logger.info('The warm browser is no longer available')
+            return None
+        self.pgid = pid
         try:
-            os.kill(pid, sig)
+            # Without a pidfd, there is no way to learn when a process that
+            # is not a child exits.
+            os.close(os.pidfd_open(pid))
+        except (AttributeError, OSError) as e:
+            logger.info('Discarding the warm browser: ' + str(e))
+            self.kill(signal.SIGKILL)
+            self.pgid = None
+            return None
+        # The spare is kept stopped while it waits.
+        self.kill(signal.SIGCONT)
+        return AdoptedProcess(pid)
+
+    def getGroupPids(self):
+        pids = []
+        for entry in os.listdir('/proc'):
+            if not entry.isdigit():
+                continue
+            stat = readProcessStat(entry)
+            if stat is not None and stat[0] != 'Z' and stat[2] == self.pgid:
+                pids.append(int(entry, 10))
+        return pids
+
+    def getPids(self):
+        if self.cgroup is not None:
+            return self.getCgroupPids()
+        return self.getGroupPids()
+
+    def kill(self, sig):
+        if self.cgroup is not None:
+            if sig == signal.SIGKILL:
+                try:
+                    with open(os.path.join(self.cgroup, 'cgroup.kill'),
+                              'w') as killFile:
+                        killFile.write('1')
+                    return
+                except IOError:
+                    # The cgroup.kill file requires Linux 5.14.
+                    pass
+            for pid in self.getCgroupPids():
+                try:
+                    os.kill(pid, sig)
+                except OSError:
+                    pass
+        try:
+            os.killpg(self.pgid, sig)
         except OSError:
             pass
 
+    def reap(self):
+        """Kills any processes that outlived the browser and counts them"""
+        leftovers = self.getPids()
+        if leftovers:
+            logger.info(
+                'Killing {} processes left over by the browser'.format(
+                    len(leftovers)))
+            self.kill(signal.SIGKILL)
+            deadline = time.monotonic() + BROWSER_REAP_DELAY.total_seconds()
+            while self.getPids() and time.monotonic() < deadline:
+                time.sleep(BROWSER_REAP_INTERVAL.total_seconds())
+        return len(leftovers)
+
+    def close(self):
+        if self.cgroup is not None:
+            try:
+                os.rmdir(self.cgroup)
+            except OSError as e:
+                logger.debug('Failed to remove cgroup: ' + str(e))
+            self.cgroup = None
+
+
+def forwardToBrowser(browserCmd):
+    """Hands the URL to the running browser, which opens it in a window
+
+    A second browser invocation finds the running instance through its
+    profile's singleton socket and exits as soon as the URL is delivered.
+    """
+    startTime = time.monotonic()
+    try:
+        subprocess.run(
+            browserCmd,
+            close_fds=True,
+            timeout=BROWSER_FORWARD_DELAY.total_seconds())
+    except subprocess.TimeoutExpired:
+        logger.info('Timed out handing the URL to the warm browser')
+    logger.debug('Navigated the warm browser in {:.0f} ms'.format(
+        (time.monotonic() - startTime) * 1000))
+
 
 @contextlib.contextmanager
-def execBrowser(browserCmd):
-    (sink, source) = socket.socketpair()
-    with contextlib.closing(sink), contextlib.closing(source):
-        waiter = None
-        try:
+def execBrowser(browserCmd, warmPid=None):
+    group = BrowserGroup()
+    with contextlib.closing(group):
+        proc = None if warmPid is None else group.adopt(warmPid)
+        if proc is None:
             logger.info(
                 'Launching browser: ' +
                 ' '.join(shlex.quote(arg) for arg in browserCmd))
-            proc = subprocess.Popen(browserCmd, close_fds=True)
+            proc = group.launch(browserCmd)
+        else:
+            logger.info(
+                'Navigating warm browser: ' +
+                ' '.join(shlex.quote(arg) for arg in browserCmd))
+            forwardToBrowser(browserCmd)
+        try:
+            exitSource = ProcessExitSource(
+                proc, 'the browser stopped prematurely')
+            with contextlib.closing(exitSource):
+                exitSource.open()
+
+                yield (proc, exitSource)
+
+            # Ask each child process to exit.
+            logger.debug('Terminating the browser')
+            group.kill(signal.SIGTERM)
+
+            # Give the browser a few seconds to shut down gracefully.
+            def terminateBrowser():
+                logger.info('Forcibly killing the browser at the deadline')
+                group.kill(signal.SIGKILL)
+            terminator = threading.Timer(
+                BROWSER_EXIT_DELAY.total_seconds(), terminateBrowser)
+            terminator.start()
             try:
-                # Monitor the browser and kick the socket when it exits.
-                waiterStarting = threading.Thread(
-                    target=monitorProcess, args=(proc, source))
-                waiterStarting.start()
-                waiter = waiterStarting
-
-                yield (proc, sink.fileno())
-
-                # Ask each child process to exit.
-                logger.debug('Terminating the browser')
-                killBrowser(proc, signal.SIGTERM)
-
-                # Give the browser a few seconds to shut down gracefully.
-                def terminateBrowser():
-                    logger.info(
-                        'Forcibly killing the browser at the deadline')
-                    killBrowser(proc, signal.SIGKILL)
-                terminator = threading.Timer(
-                    BROWSER_EXIT_DELAY.total_seconds(), terminateBrowser)
-                terminator.start()
-                try:
-                    proc.wait()
-                    proc = None
-                    logger.debug('Waited for the browser to quit')
-                finally:
-                    terminator.cancel()
-                    terminator.join()
+                proc.wait()
+                proc = None
+                logger.debug('Waited for the browser to quit')
             finally:
-                if proc is not None:
-                    # As a last resort, forcibly kill the browser.
-                    logger.info('Forcibly killing the browser')
-                    killBrowser(proc, signal.SIGKILL)
-                    proc.wait()
-                    logger.debug('Waited for the browser to die')
+                terminator.cancel()
+                terminator.join()
+        finally:
+            if proc is not None:
+                # As a last resort, forcibly kill the browser.
+                logger.info('Forcibly killing the browser')
+                group.kill(signal.SIGKILL)
+                proc.wait()
+                logger.debug('Waited for the browser to die')
+            group.reap()
+
+
+class XdotoolInjector(object):
+    """Injects input events by translating them into xdotool commands
+
+    Each command runs in its own xdotool process, since xdotool only starts
+    executing a script from stdin once it has read all of it.
+    """
+
+    def __init__(self, xdotoolPath):
+        self.xdotoolPath = xdotoolPath
+        self.translators = {
+            KeyInput: self._translateKey,
+            ClickInput: self._translateClick,
+            MoveInput: self._translateMove,
+        }
+
+    def _translateKey(self, event):
+        return ['key', '--clearmodifiers', '--'] + list(event.keys)
+
+    def _translateClick(self, event):
+        # NOTE: XDOTOOL HACK
+        # Some platforms include a buggy version of xdotool,
+        # (https://github.com/jordansissel/xdotool/pull/102).
+        # If you have version 3.20150503.1, then the mouse button
+        # will not be released correctly. The workaround is to
+        # uncomment the following line.
+        #return ['click', str(event.button)]
+        return ['click', '--clearmodifiers', str(event.button)]
+
+    def _translateMove(self, event):
+        return [
+            'mousemove_relative',
+            '--',
+            str(event.horizontal),
+            str(event.vertical),
+        ]
+
+    def checkKeys(self, sequences):
+        # xdotool resolves key names itself, and reports its own errors.
+        pass
+
+    def inject(self, events):
+        for event in events:
+            cmd = [self.xdotoolPath] + self.translators[type(event)](event)
+            logger.debug(
+                'Executing: ' + ' '.join(shlex.quote(arg) for arg in cmd))
+            subprocess.check_call(cmd)
+
+    def close(self):
+        pass
+
+
+class XtestInjector(object):
+    """Injects input events in-process with the X11 XTEST extension"""
+
+    # Modifier names that xdotool accepts in key sequences like "ctrl+c".
+    MODIFIER_KEYSYMS = {
+        'alt': 'Alt_L',
+        'ctrl': 'Control_L',
+        'control': 'Control_L',
+        'meta': 'Meta_L',
+        'shift': 'Shift_L',
+        'super': 'Super_L',
+    }
+
+    def __init__(self, display):
+        self.display = display
+        self.keycodeCache = {}
+        self.injectors = {
+            KeyInput: self._injectKey,
+            ClickInput: self._injectClick,
+            MoveInput: self._injectMove,
+        }
+
+    def _getKeycode(self, name):
+        keysym = Xlib.XK.string_to_keysym(
+            self.MODIFIER_KEYSYMS.get(name.lower(), name))
+        if keysym == Xlib.X.NoSymbol:
+            raise ValueError('Unrecognized key: ' + name)
+        # Each keycode maps to several keysyms. An odd index means that the
+        # keysym is only reachable with the shift modifier.
+        for (keycode, index) in self.display.keysym_to_keycodes(keysym):
+            return (keycode, index % 2 == 1)
+        raise ValueError('Unmapped key: ' + name)
+
+    def _getKeycodes(self, sequence):
+        """Returns the keycodes of a sequence, or None if it can't be typed
+
+        A sequence that can't be typed is only reported the first time.
+        """
+        if sequence in self.keycodeCache:
+            return self.keycodeCache[sequence]
+        keycodes = []
+        try:
+            for name in sequence.split('+'):
+                (keycode, isShifted) = self._getKeycode(name)
+                if isShifted:
+                    keycodes.append(self._getKeycode('shift')[0])
+                keycodes.append(keycode)
+        except ValueError as e:
+            logger.warning(
+                'Skipping key sequence "{}": {}'.format(sequence, e))
+            keycodes = None
+        self.keycodeCache[sequence] = keycodes
+        return keycodes
+
+    def checkKeys(self, sequences):
+        for sequence in sequences:
+            self._getKeycodes(sequence)
+
+    def _injectKey(self, event):
+        # Unlike xdotool, there is no need to clear modifiers, because the
+        # remote control never holds any down.
+        for sequence in event.keys:
+            keycodes = self._getKeycodes(sequence)
+            if keycodes is None:
+                continue
+            for keycode in keycodes:
+                Xlib.ext.xtest.fake_input(
+                    self.display, Xlib.X.KeyPress, keycode)
+            for keycode in reversed(keycodes):
+                Xlib.ext.xtest.fake_input(
+                    self.display, Xlib.X.KeyRelease, keycode)
+
+    def _injectClick(self, event):
+        Xlib.ext.xtest.fake_input(
+            self.display, Xlib.X.ButtonPress, event.button)
+        Xlib.ext.xtest.fake_input(
+            self.display, Xlib.X.ButtonRelease, event.button)
+
+    def _injectMove(self, event):
+        Xlib.ext.xtest.fake_input(
+            self.display,
+            Xlib.X.MotionNotify,
+            detail=True,
+            x=event.horizontal,
+            y=event.vertical)
+
+    def inject(self, events):
+        for event in events:
+            logger.debug('Injecting XTEST input: ' + str(event))
+            self.injectors[type(event)](event)
+        self.display.sync()
+
+    def close(self):
+        self.display.close()
+
+
+class UinputInjector(object):
+    """Injects input events through a virtual evdev device"""
+
+    # Constants from linux/input-event-codes.h and linux/uinput.h.
+    EV_SYN = 0x00
+    EV_KEY = 0x01
+    EV_REL = 0x02
+    SYN_REPORT = 0
+    REL_X = 0x00
+    REL_Y = 0x01
+    REL_WHEEL = 0x08
+    BTN_LEFT = 0x110
+    BTN_RIGHT = 0x111
+    BTN_MIDDLE = 0x112
+    UI_DEV_CREATE = 0x5501
+    UI_DEV_DESTROY = 0x5502
+    UI_SET_EVBIT = 0x40045564
+    UI_SET_KEYBIT = 0x40045565
+    UI_SET_RELBIT = 0x40045566
+    UI_GET_SYSNAME_BASE = 0x8000552c
+    BUS_VIRTUAL = 0x06
+    ABS_CNT = 64
+
+    # The layout of struct input_event and the legacy struct uinput_user_dev.
+    INPUT_EVENT = struct.Struct('llHHi')
+    USER_DEV = struct.Struct('80sHHHHI{}i'.format(4 * ABS_CNT))
+
+    # Evdev reports physical keys, so X keysym names are translated assuming a
+    # US keyboard layout. The flag indicates whether shift must be held.
+    KEYSYM_CODES = dict(
+        [(letter, (code, False)) for (letter, code) in zip(
+            'qwertyuiopasdfghjklzxcvbnm',
+            list(range(16, 26)) + list(range(30, 39)) + list(range(44, 51)))] +
+        [(letter.upper(), (code, True)) for (letter, code) in zip(
+            'qwertyuiopasdfghjklzxcvbnm',
+            list(range(16, 26)) + list(range(30, 39)) + list(range(44, 51)))] +
+        [(digit, (code, False)) for (digit, code) in zip(
+            '1234567890', range(2, 12))] +
+        [(symbol, (code, True)) for (symbol, code) in zip(
+            ['exclam', 'at', 'numbersign', 'dollar', 'percent',
+             'asciicircum', 'ampersand', 'asterisk', 'parenleft',
+             'parenright'],
+            range(2, 12))] +
+        [('F' + str(number), (code, False)) for (number, code) in zip(
+            range(1, 13), list(range(59, 69)) + [87, 88])] +
+        list({
+            'Escape': (1, False),
+            'minus': (12, False),
+            'underscore': (12, True),
+            'equal': (13, False),
+            'plus': (13, True),
+            'BackSpace': (14, False),
+            'Tab': (15, False),
+            'bracketleft': (26, False),
+            'braceleft': (26, True),
+            'bracketright': (27, False),
+            'braceright': (27, True),
+            'Return': (28, False),
+            'ctrl': (29, False),
+            'control': (29, False),
+            'Control_L': (29, False),
+            'semicolon': (39, False),
+            'colon': (39, True),
+            'apostrophe': (40, False),
+            'quotedbl': (40, True),
+            'grave': (41, False),
+            'asciitilde': (41, True),
+            'shift': (42, False),
+            'Shift_L': (42, False),
+            'backslash': (43, False),
+            'bar': (43, True),
+            'comma': (51, False),
+            'less': (51, True),
+            'period': (52, False),
+            'greater': (52, True),
+            'slash': (53, False),
+            'question': (53, True),
+            'alt': (56, False),
+            'Alt_L': (56, False),
+            'space': (57, False),
+            'Home': (102, False),
+            'Up': (103, False),
+            'Prior': (104, False),
+            'Page_Up': (104, False),
+            'Left': (105, False),
+            'Right': (106, False),
+            'End': (107, False),
+            'Down': (108, False),
+            'Next': (109, False),
+            'Page_Down': (109, False),
+            'Insert': (110, False),
+            'Delete': (111, False),
+            'XF86AudioMute': (113, False),
+            'XF86AudioLowerVolume': (114, False),
+            'XF86AudioRaiseVolume': (115, False),
+            'super': (125, False),
+            'meta': (125, False),
+            'Super_L': (125, False),
+            'XF86AudioPlay': (164, False),
+        }.items()))
+
+    # X numbers the middle button 2 and the right button 3, while buttons 4
+    # and 5 scroll the wheel up and down.
+    BUTTON_CODES = {1: BTN_LEFT, 2: BTN_MIDDLE, 3: BTN_RIGHT}
+    WHEEL_STEPS = {4: 1, 5: -1}
+
+    def __init__(self, fd):
+        self.fd = fd
+        self.keycodeCache = {}
+        self.encoders = {
+            KeyInput: self._encodeKey,
+            ClickInput: self._encodeClick,
+            MoveInput: self._encodeMove,
+        }
+
+    @classmethod
+    def create(cls, path=UINPUT_PATH):
+        fd = os.open(path, os.O_WRONLY | os.O_NONBLOCK)
+        try:
+            fcntl.ioctl(fd, cls.UI_SET_EVBIT, cls.EV_KEY)
+            for (keycode, _) in set(cls.KEYSYM_CODES.values()):
+                fcntl.ioctl(fd, cls.UI_SET_KEYBIT, keycode)
+            for button in cls.BUTTON_CODES.values():
+                fcntl.ioctl(fd, cls.UI_SET_KEYBIT, button)
+            fcntl.ioctl(fd, cls.UI_SET_EVBIT, cls.EV_REL)
+            for axis in (cls.REL_X, cls.REL_Y, cls.REL_WHEEL):
+                fcntl.ioctl(fd, cls.UI_SET_RELBIT, axis)
+            os.write(fd, cls.USER_DEV.pack(
+                UINPUT_DEVICE_NAME, cls.BUS_VIRTUAL, 1, 1, 1, 0,
+                *([0] * 4 * cls.ABS_CNT)))
+            fcntl.ioctl(fd, cls.UI_DEV_CREATE)
+        except:
+            os.close(fd)
+            raise
+        return cls(fd)
+
+    def getSysname(self):
+        """Returns the device's name under /sys/devices/virtual/input"""
+        size = 64
+        buf = bytearray(size)
+        fcntl.ioctl(self.fd, self.UI_GET_SYSNAME_BASE | (size << 16), buf)
+        return bytes(buf).split(b'\0', 1)[0].decode('ascii')
+
+    def _pack(self, eventType, code, value):
+        return self.INPUT_EVENT.pack(0, 0, eventType, code, value)
+
+    def _sync(self):
+        return self._pack(self.EV_SYN, self.SYN_REPORT, 0)
+
+    def _getKeycodes(self, sequence):
+        """Returns the keycodes of a sequence, or None if it can't be typed
+
+        A sequence that can't be typed is only reported the first time.
+        """
+        if sequence in self.keycodeCache:
+            return self.keycodeCache[sequence]
+        keycodes = []
+        for name in sequence.split('+'):
+            (keycode, isShifted) = self.KEYSYM_CODES.get(
+                name, self.KEYSYM_CODES.get(name.lower(), (None, False)))
+            if keycode is None:
+                logger.warning(
+                    'Skipping key sequence "{}": Unrecognized key: {}'.format(
+                        sequence, name))
+                keycodes = None
+                break
+            shiftKeycode = self.KEYSYM_CODES['shift'][0]
+            if isShifted and shiftKeycode not in keycodes:
+                keycodes.append(shiftKeycode)
+            keycodes.append(keycode)
+        self.keycodeCache[sequence] = keycodes
+        return keycodes
+
+    def checkKeys(self, sequences):
+        for sequence in sequences:
+            self._getKeycodes(sequence)
+
+    def _encodeKey(self, event):
+        chunks = []
+        for sequence in event.keys:
+            keycodes = self._getKeycodes(sequence)
+            if keycodes is None:
+                continue
+            chunks.extend(
+                self._pack(self.EV_KEY, keycode, 1) for keycode in keycodes)
+            chunks.append(self._sync())
+            chunks.extend(
+                self._pack(self.EV_KEY, keycode, 0)
+                for keycode in reversed(keycodes))
+            chunks.append(self._sync())
+        return chunks
+
+    def _encodeClick(self, event):
+        if event.button in self.WHEEL_STEPS:
+            return [
+                self._pack(
+                    self.EV_REL, self.REL_WHEEL,
+                    self.WHEEL_STEPS[event.button]),
+                self._sync(),
+            ]
+        button = self.BUTTON_CODES.get(event.button)
+        if button is None:
+            logger.warning('Skipping unsupported button: ' + str(event.button))
+            return []
+        return [
+            self._pack(self.EV_KEY, button, 1),
+            self._sync(),
+            self._pack(self.EV_KEY, button, 0),
+            self._sync(),
+        ]
+
+    def _encodeMove(self, event):
+        return [
+            self._pack(self.EV_REL, self.REL_X, event.horizontal),
+            self._pack(self.EV_REL, self.REL_Y, event.vertical),
+            self._sync(),
+        ]
+
+    def inject(self, events):
+        chunks = []
+        for event in events:
+            logger.debug('Injecting uinput input: ' + str(event))
+            chunks.extend(self.encoders[type(event)](event))
+        # The whole batch is delivered with a single write.
+        os.write(self.fd, b''.join(chunks))
+
+    def close(self):
+        try:
+            fcntl.ioctl(self.fd, self.UI_DEV_DESTROY)
         finally:
-            if waiter is not None:
-                logger.debug(
-                    'Joining with browser monitoring thread')
-                waiter.join()
-                logger.debug(
-                    'Joined with browser monitoring thread')
+            os.close(self.fd)
+
+
+class PointerAccelerator(object):
+    """Moves the pointer at a speed that grows while a button is held
+
+    A fresh press nudges the pointer by a fixed step. While repeats keep
+    arriving, the pointer moves on a fixed tick, with a speed that only depends
+    on how long the button has been held. Fractions of a pixel are carried
+    over to the next tick.
+    """
+
+    # Each curve maps the seconds that a button has been held to a speed in
+    # pixels per second.
+    CURVES = {
+        'linear': lambda held: 40 + 1000 * held,
+        'quadratic': lambda held: 40 + 1000 * held ** 2,
+        'exp': lambda held: min(40 * math.exp(4 * held), 2500),
+    }
+
+    def __init__(self, tickInterval=POINTER_TICK_INTERVAL):
+        self.tickInterval = tickInterval.total_seconds()
+        self.direction = None
+        self.curve = None
+        self.pressTime = None
+        self.lastRepeatTime = None
+        self.repeatInterval = None
+        self.lastTickTime = None
+        self.remainder = (0., 0.)
+
+    def press(self, horizontal, vertical, curveName, repeat, now):
+        curve = self.CURVES.get(curveName)
+        if curve is None:
+            raise ValueError('Unrecognized pointer curve: ' + curveName)
+        direction = (horizontal, vertical)
+        if not repeat or direction != self.direction or self.pressTime is None:
+            self.direction = direction
+            self.curve = curve
+            self.pressTime = now
+            self.lastRepeatTime = None
+            self.repeatInterval = None
+            self.lastTickTime = None
+            self.remainder = (0., 0.)
+            return MoveInput(
+                horizontal * POINTER_PRESS_STEP, vertical * POINTER_PRESS_STEP)
+
+        if self.lastRepeatTime is not None:
+            interval = now - self.lastRepeatTime
+            if self.repeatInterval is None:
+                self.repeatInterval = interval
+            else:
+                self.repeatInterval = (self.repeatInterval + interval) / 2
+        self.lastRepeatTime = now
+        if self.lastTickTime is None:
+            self.lastTickTime = now
+        return None
+
+    def getNextTickTime(self):
+        if self.lastTickTime is None:
+            return None
+        return self.lastTickTime + self.tickInterval
+
+    def _getHoldDeadline(self):
+        # The button counts as released once a repeat is overdue.
+        if self.repeatInterval is None:
+            timeout = POINTER_HOLD_TIMEOUT_MAX.total_seconds()
+        else:
+            timeout = min(
+                max(
+                    self.repeatInterval * 1.5,
+                    POINTER_HOLD_TIMEOUT_MIN.total_seconds()),
+                POINTER_HOLD_TIMEOUT_MAX.total_seconds())
+        return self.lastRepeatTime + timeout
+
+    def tick(self, now):
+        nextTickTime = self.getNextTickTime()
+        if nextTickTime is None or now < nextTickTime:
+            return None
+
+        holdDeadline = self._getHoldDeadline()
+        end = min(now, holdDeadline)
+        distance = self.curve(end - self.pressTime) * max(
+            end - self.lastTickTime, 0)
+        (horizontal, vertical) = (
+            self.remainder[0] + self.direction[0] * distance,
+            self.remainder[1] + self.direction[1] * distance)
+        move = MoveInput(int(horizontal), int(vertical))
+        self.remainder = (
+            horizontal - move.horizontal, vertical - move.vertical)
+
+        if now >= holdDeadline:
+            self.pressTime = None
+            self.lastTickTime = None
+        else:
+            self.lastTickTime = now
+        if not move.horizontal and not move.vertical:
+            return None
+        return move
+
+
+class Timer(object):
+    """A pending deadline that can be cancelled"""
+
+    def __init__(self, deadline, callback):
+        self.deadline = deadline
+        self.callback = callback
+        self.isCancelled = False
+
+    def cancel(self):
+        self.isCancelled = True
+
+
+class TimerScheduler(object):
+    """Holds any number of pending deadlines on the monotonic clock
+
+    The deadlines are kept in a heap, so the loop can wait exactly until the
+    earliest one. Cancelled timers are discarded lazily.
+    """
+
+    def __init__(self):
+        self.heap = []
+        self.sequence = itertools.count()
+
+    def scheduleAt(self, deadline, callback):
+        timer = Timer(deadline, callback)
+        heapq.heappush(self.heap, (deadline, next(self.sequence), timer))
+        return timer
+
+    def schedule(self, delay, callback):
+        return self.scheduleAt(
+            time.monotonic() + delay.total_seconds(), callback)
+
+    def _discardCancelled(self):
+        while self.heap and self.heap[0][2].isCancelled:
+            heapq.heappop(self.heap)
+
+    def getTimeout(self):
+        self._discardCancelled()
+        if not self.heap:
+            return None
+        return max(self.heap[0][0] - time.monotonic(), 0)
+
+    def fire(self):
+        now = time.monotonic()
+        self._discardCancelled()
+        while self.heap and self.heap[0][0] <= now:
+            (_, _, timer) = heapq.heappop(self.heap)
+            if not timer.isCancelled:
+                timer.callback()
+            self._discardCancelled()
+
+
+class EventLoop(object):
+    """Dispatches readable sources and due timers
+
+    A source is any object with a fileno() method and an onReadable(loop)
+    method. New input channels only need to be registered, and each wake-up
+    only visits the sources that are actually ready.
+    """
+
+    def __init__(self):
+        self.selector = selectors.DefaultSelector()
+        self.timers = TimerScheduler()
+        self.isStopped = False
+
+    def register(self, source):
+        self.selector.register(source, selectors.EVENT_READ)
+
+    def unregister(self, source):
+        self.selector.unregister(source)
+
+    def stop(self):
+        self.isStopped = True
+
+    def run(self, onDispatched):
+        """Runs until stopped, calling onDispatched after each wake-up"""
+        while not self.isStopped:
+            # Interrupted waits are retried automatically, (see PEP 475).
+            for (key, _) in self.selector.select(self.timers.getTimeout()):
+                key.fileobj.onReadable(self)
+                if self.isStopped:
+                    return
+            self.timers.fire()
+            onDispatched()
+
+    def close(self):
+        self.selector.close()
+
+
+class ExitSource(object):
+    """Stops the loop as soon as its file descriptor becomes readable"""
+
+    def __init__(self, fd, reason):
+        self.fd = fd
+        self.reason = reason
+
+    def fileno(self):
+        return self.fd if isinstance(self.fd, int) else self.fd.fileno()
+
+    def onReadable(self, loop):
+        logger.info('Exiting because ' + self.reason)
+        loop.stop()
+
+
+class LircSource(object):
+    """Stamps LIRC codes as they arrive and hands them to the loop in bursts
+
+    A reader thread drains the LIRC socket as soon as it is readable, even
+    while the loop is blocked injecting input, so that each code's receive
+    time tells how long it has been waiting. Only the reader thread calls
+    pylirc. The loop is woken through a socket pair.
+    """
+
+    def __init__(self, fd, onCodes):
+        self.fd = fd
+        self.onCodes = onCodes
+        self.lock = threading.Lock()
+        self.codes = []
+        (self.wakeupSink, self.wakeupSource) = socket.socketpair()
+        self.wakeupSink.setblocking(False)
+        self.wakeupSource.setblocking(False)
+        (self.stopSink, self.stopSource) = socket.socketpair()
+        self.reader = threading.Thread(target=self.readCodes)
+        self.reader.start()
+
+    def fileno(self):
+        return self.wakeupSink.fileno()
+
+    def isLircClosed(self):
+        # The socket is duplicated, so that closing it leaves pylirc's alone.
+        lircSocket = socket.fromfd(self.fd, socket.AF_UNIX, socket.SOCK_STREAM)
+        with contextlib.closing(lircSocket):
+            try:
+                return not lircSocket.recv(
+                    1, socket.MSG_PEEK | socket.MSG_DONTWAIT)
+            except BlockingIOError:
+                return False
+
+    def drain(self, selector):
+        """Queues every available code and returns False once LIRC is gone"""
+        while True:
+            batch = pylirc.nextcode(True)
+            if batch:
+                receivedTime = time.monotonic()
+                with self.lock:
+                    self.codes.extend(
+                        (PylircCode(**button), receivedTime)
+                        for button in batch)
+                try:
+                    self.wakeupSource.send(b'\0')
+                except BlockingIOError:
+                    # The loop has yet to consume an earlier wake-up.
+                    pass
+                continue
+            # A button without a binding also yields None, so only the
+            # socket's readiness tells whether the queue is empty.
+            if not any(
+                    key.fileobj == self.fd
+                    for (key, events) in selector.select(0)):
+                return True
+            if self.isLircClosed():
+                return False
+
+    def readCodes(self):
+        with selectors.DefaultSelector() as selector:
+            selector.register(self.fd, selectors.EVENT_READ)
+            selector.register(self.stopSink, selectors.EVENT_READ)
+            while True:
+                readable = [key.fileobj for (key, events) in selector.select()]
+                if self.stopSink in readable:
+                    return
+                if not self.drain(selector):
+                    logger.info('Stopped reading codes because LIRC closed')
+                    return
+
+    def onReadable(self, loop):
+        try:
+            while self.wakeupSink.recv(4096):
+                pass
+        except BlockingIOError:
+            pass
+        with self.lock:
+            codes = self.codes
+            self.codes = []
+        if codes:
+            self.onCodes(codes)
+
+    def close(self):
+        self.stopSource.send(b'\0')
+        self.reader.join()
+        for endpoint in (
+                self.wakeupSink, self.wakeupSource, self.stopSink,
+                self.stopSource):
+            endpoint.close()
+
+
+class InputCoalescer(object):
+    """Drops stale LIRC repeats and merges bursts of pointer moves"""
+
+    def __init__(self, repeatHorizon):
+        self.repeatHorizon = repeatHorizon.total_seconds()
+        self.mergedCount = 0
+        self.droppedCount = 0
+
+    def isStale(self, code, receivedTime, now):
+        # Only repeats are dropped, so that every distinct press still counts.
+        if code.repeat and now - receivedTime > self.repeatHorizon:
+            self.droppedCount += 1
+            return True
+        return False
+
+    def merge(self, events):
+        merged = []
+        for event in events:
+            if (isinstance(event, MoveInput) and merged and
+                    isinstance(merged[-1], MoveInput)):
+                previous = merged[-1]
+                merged[-1] = MoveInput(
+                    previous.horizontal + event.horizontal,
+                    previous.vertical + event.vertical)
+                self.mergedCount += 1
+            else:
+                merged.append(event)
+        return merged
+
+    def logStatistics(self):
+        logger.info(
+            'Merged {} pointer moves and dropped {} stale repeats'.format(
+                self.mergedCount, self.droppedCount))
+
+
+def checkKeymapKeys(injector, loadedKeymap):
+    """Reports each key of the keymap that the injector can't type, once"""
+    for command in loadedKeymap.commands.values():
+        if command.name in ('KEY', 'MULTITAP'):
+            injector.checkKeys(command.args)
+
+
+def openXtestInjector(xdotoolPath):
+    if Xlib is None:
+        logger.debug('Not connecting to the X display')
+        return None
+    try:
+        display = Xlib.display.Display()
+    except Xlib.error.DisplayError as e:
+        logger.debug('Failed to connect to the X display: ' + str(e))
+        return None
+    if not display.has_extension('XTEST'):
+        logger.debug('The X display does not support XTEST')
+        display.close()
+        return None
+    logger.info('Injecting input with XTEST')
+    return XtestInjector(display)
+
+
+def openXdotoolInjector(xdotoolPath):
+    if xdotoolPath is None:
+        logger.debug('Not injecting input with xdotool')
+        return None
+    logger.info('Injecting input with xdotool')
+    return XdotoolInjector(xdotoolPath)
+
+
+def openUinputInjector(xdotoolPath):
+    try:
+        injector = UinputInjector.create()
+    except (IOError, OSError) as e:
+        logger.debug('Failed to create a uinput device: ' + str(e))
+        return None
+    try:
+        logger.info(
+            'Injecting input with uinput device: ' + injector.getSysname())
+    except (IOError, OSError):
+        logger.info('Injecting input with a uinput device')
+    return injector
+
+
+@contextlib.contextmanager
+def openInjector(xdotoolPath):
+    if 'DISPLAY' in os.environ and 'WAYLAND_DISPLAY' not in os.environ:
+        openers = [openXtestInjector, openXdotoolInjector, openUinputInjector]
+    else:
+        # X11 injection would only reach XWayland clients, if any.
+        openers = [openUinputInjector, openXtestInjector, openXdotoolInjector]
+    for opener in openers:
+        injector = opener(xdotoolPath)
+        if injector is not None:
+            with contextlib.closing(injector):
+                yield injector
+            return
+    logger.debug('Not injecting input')
+    yield
 
 
 def activateWindow(cmd, proc, isAborting, xdotoolPath):
@@ -334,65 +1386,52 @@ def raiseBrowser(pid, xdotoolPath):
             activator.join()
 
 
-def driveBrowser(xdotoolPath, mixer, lircFd, browserExitFd, abortFd, parentFd):
-    polling = [browserExitFd, abortFd, parentFd]
-    if lircFd is not None:
-        polling.append(lircFd)
-
+def driveBrowser(
+        injector, mixer, lircFd, browserExit, abortFd, parentFd,
+        repeatHorizon=DEFAULT_REPEAT_HORIZON):
     class CommandState:
-        releaseKeyTime = None
-        nextReleaseKeyTime = None
+        releaseTimer = None
+        nextReleaseDelay = None
         isReleasing = False
         repeatKeys = None
         repeatIndex = 0
+        tickTimer = None
+        isTickDue = False
         isExiting = False
 
-    def handleVolumeUpCommand(command, args, repeat):
+    def handleVolumeUpCommand(command, repeat):
         mixer.incrementVolume()
-    def handleVolumeDownCommand(command, args, repeat):
+    def handleVolumeDownCommand(command, repeat):
         mixer.decrementVolume()
-    def handleMuteCommand(command, args, repeat):
+    def handleMuteCommand(command, repeat):
         mixer.toggleMute()
-    def handleMultitapCommand(command, args, repeat):
-        if CommandState.releaseKeyTime is not None and CommandState.repeatKeys == args:
+    def handleMultitapCommand(command, repeat):
+        keys = command.args
+        if CommandState.releaseTimer is not None and CommandState.repeatKeys == keys:
             CommandState.repeatIndex += 1
         else:
             CommandState.isReleasing = True
-            CommandState.repeatKeys = args
+            CommandState.repeatKeys = keys
             CommandState.repeatIndex = 0
-        CommandState.nextReleaseKeyTime = (datetime.datetime.now() + RELEASE_KEY_DELAY)
-        current = args[CommandState.repeatIndex % len(args)]
-        return ['key', '--clearmodifiers', '--', current, 'Shift+Left']
-    def handleKeyCommand(command, args, repeat):
+        CommandState.nextReleaseDelay = RELEASE_KEY_DELAY
+        current = keys[CommandState.repeatIndex % len(keys)]
+        return [KeyInput((current, 'Shift+Left'))]
+    def handleKeyCommand(command, repeat):
         CommandState.isReleasing = True
-        return ['key', '--clearmodifiers', '--'] + args
-    def handleClickCommand(command, args, repeat):
+        return [KeyInput(command.args)]
+    def handleClickCommand(command, repeat):
         CommandState.isReleasing = True
-        # NOTE: XDOTOOL HACK
-        # Some platforms include a buggy version of xdotool,
-        # (https://github.com/jordansissel/xdotool/pull/102).
-        # If you have version 3.20150503.1, then the mouse button
-        # will not be released correctly. The workaround is to
-        # uncomment the following line.
-        #return ['click', '1']
-        return ['click', '--clearmodifiers', '1']
-    def handleMouseCommand(command, args, repeat):
-        step = (repeat + 2) ** 2
-        (horizontal, vertical) = args
-        acceleratedHorizontal = str(int(horizontal) * step)
-        acceleratedVertical = str(int(vertical) * step)
-        return [
-            'mousemove_relative',
-            '--',
-            acceleratedHorizontal,
-            acceleratedVertical,
-        ]
-    def handleExitCommand(command, args, repeat):
+        (button,) = command.args
+        return [ClickInput(button)]
+    def handleMouseCommand(command, repeat):
+        (horizontal, vertical, curve) = command.args
+        move = accelerator.press(
+            horizontal, vertical, curve, repeat, time.monotonic())
+        return None if move is None else [move]
+    def handleExitCommand(command, repeat):
         CommandState.isExiting = True
-    def handleReleaseCommand(command, args, repeat):
+    def handleReleaseCommand(command, repeat):
         CommandState.isReleasing = True
-    def handleUnrecognizedCommand(command, args, repeat):
-        raise RuntimeError('Unrecognized LIRC config: ' + command)
 
     commandHandlers = {
         'VOLUME_UP': handleVolumeUpCommand,
@@ -406,103 +1445,140 @@ def driveBrowser(xdotoolPath, mixer, lircFd, browserExitFd, abortFd, parentFd):
         'RELEASE': handleReleaseCommand,
     }
 
-    while not CommandState.isExiting:
-        if CommandState.releaseKeyTime is None:
-            timeout = None
-        else:
-            timeout = max(
-                (CommandState.releaseKeyTime - datetime.datetime.now()).total_seconds(),
-                0)
-        try:
-            (rlist, _, _) = select.select(polling, [], [], timeout)
-            if browserExitFd in rlist:
-                logger.info('Exiting because the browser stopped prematurely')
-                break
-            if abortFd in rlist:
-                logger.info('Exiting because a SIGTERM was received')
-                break
-            if parentFd in rlist:
-                logger.info('Exiting because the parent has disappeared')
-                break
-            if lircFd is not None and lircFd in rlist:
-                buttons = pylirc.nextcode(True)
-            else:
-                buttons = None
-        except select.error as e:
-            # Check whether this interrupt was from a signal to abort.
-            if e[0] == errno.EINTR:
-                (rlist, _, _) = select.select([abortFd], [], [], 0)
-                if abortFd in rlist:
-                    logger.info(
-                        'Exiting because a SIGTERM interrupted a syscall')
-                    break
-            raise
-        codes = ([PylircCode(**button) for button in buttons]
-                 if buttons else [])
-        if (CommandState.releaseKeyTime is not None and
-                CommandState.releaseKeyTime <= datetime.datetime.now()):
-            codes.append(PylircCode(config='RELEASE', repeat=0))
-
-        for code in codes:
+    coalescer = InputCoalescer(repeatHorizon)
+    accelerator = PointerAccelerator()
+    loop = EventLoop()
+    timers = loop.timers
+    dueCodes = []
+
+    def onReleaseTimer():
+        # The timer stays set until the release has been handled.
+        dueCodes.append(
+            (PylircCode(config='RELEASE', repeat=0), time.monotonic()))
+    def onTickTimer():
+        CommandState.tickTimer = None
+        CommandState.isTickDue = True
+
+    def processCodes():
+        codes = list(dueCodes)
+        del dueCodes[:]
+        pending = []
+        now = time.monotonic()
+        for (code, receivedTime) in codes:
             logger.debug('Received LIRC code: ' + str(code))
-            tokens = shlex.split(code.config)
-            (command, args) = (tokens[0], tokens[1:])
+            if coalescer.isStale(code, receivedTime, now):
+                logger.debug('Dropping stale LIRC repeat: ' + str(code))
+                continue
+            command = keymap.compileCommand(code.config)
             CommandState.isReleasing = False
-            CommandState.nextReleaseKeyTime = None
+            CommandState.nextReleaseDelay = None
 
-            handler = commandHandlers.get(command, handleUnrecognizedCommand)
-            inputs = handler(command, args, code.repeat)
+            handler = commandHandlers[command.name]
+            inputs = handler(command, code.repeat)
 
             if CommandState.isExiting:
                 break
 
-            if CommandState.isReleasing and CommandState.releaseKeyTime is not None:
-                if xdotoolPath is not None:
-                    # Deselect the current multi-tap character.
-                    logger.debug('Executing xdotool for multi-tap release')
-                    subprocess.check_call(
-                        [xdotoolPath, 'key', '--clearmodifiers', 'Right'])
-                else:
-                    logger.debug('Ignoring xdotool for multi-tap release')
-            CommandState.releaseKeyTime = CommandState.nextReleaseKeyTime
+            if CommandState.isReleasing and CommandState.releaseTimer is not None:
+                # Deselect the current multi-tap character.
+                logger.debug('Queueing multi-tap release')
+                pending.append(KeyInput(('Right',)))
+            if CommandState.releaseTimer is not None:
+                CommandState.releaseTimer.cancel()
+                CommandState.releaseTimer = None
+            if CommandState.nextReleaseDelay is not None:
+                CommandState.releaseTimer = timers.schedule(
+                    CommandState.nextReleaseDelay, onReleaseTimer)
 
             if inputs is not None:
-                if xdotoolPath is not None:
-                    cmd = [xdotoolPath] + inputs
-                    logger.debug(
-                        'Executing: ' +
-                        ' '.join(shlex.quote(arg) for arg in cmd))
-                    subprocess.check_call(cmd)
-                else:
-                    logger.debug('Ignoring xdotool inputs: ' + str(inputs))
-
-
-def wrapBrowser(browserCmd, suspendKodi, lircConfig, xdotoolPath, alsaControl):
+                pending.extend(inputs)
+
+        if CommandState.isTickDue:
+            CommandState.isTickDue = False
+            move = accelerator.tick(time.monotonic())
+            if move is not None:
+                pending.append(move)
+        # The accelerator's next tick may have moved after a press or repeat.
+        nextTickTime = accelerator.getNextTickTime()
+        if (CommandState.tickTimer is not None and
+                CommandState.tickTimer.deadline != nextTickTime):
+            CommandState.tickTimer.cancel()
+            CommandState.tickTimer = None
+        if CommandState.tickTimer is None and nextTickTime is not None:
+            CommandState.tickTimer = timers.scheduleAt(
+                nextTickTime, onTickTimer)
+
+        if pending:
+            if injector is not None:
+                injector.inject(coalescer.merge(pending))
+            else:
+                logger.debug('Ignoring inputs: ' + str(pending))
+
+        if CommandState.isExiting:
+            loop.stop()
+
+    with contextlib.closing(loop), contextlib.ExitStack() as stack:
+        loop.register(browserExit)
+        loop.register(ExitSource(abortFd, 'a SIGTERM was received'))
+        loop.register(ExitSource(parentFd, 'the parent has disappeared'))
+        if lircFd is not None:
+            lircSource = LircSource(lircFd, dueCodes.extend)
+            stack.callback(lircSource.close)
+            loop.register(lircSource)
+        loop.run(processCodes)
+
+    coalescer.logStatistics()
+
+
+def wrapBrowser(
+        browserCmd, suspendKodi, lircConfig, xdotoolPath, alsaControl,
+        repeatHorizon=DEFAULT_REPEAT_HORIZON, keymapCacheFolder=None,
+        warmPid=None, kodiPid=None):
+    # Reject a broken keymap before anything is launched. The compiled keymap
+    # also primes the command cache, so codes are never parsed mid-session.
+    logger.debug('Loading keymap: ' + lircConfig)
+    loadedKeymap = keymap.loadKeymap(lircConfig, keymapCacheFolder)
     mixer = PulseMixer() if alsaControl is None else AlsaMixer(alsaControl)
     with (
             abortContext()) as abortFd, (
-            suspendParentProcess(suspendKodi)), (
+            suspendParentProcess(suspendKodi, kodiPid)), (
             runPylirc(lircConfig)) as lircFd, (
-            execBrowser(browserCmd)) as (browser, browserExitFd), (
-            raiseBrowser(browser.pid, xdotoolPath)):
-        driveBrowser(xdotoolPath, mixer, lircFd, browserExitFd, abortFd, sys.stdin)
+            execBrowser(browserCmd, warmPid)) as (browser, browserExit), (
+            raiseBrowser(browser.pid, xdotoolPath)), (
+            openInjector(xdotoolPath)) as injector:
+        if injector is not None:
+            checkKeymapKeys(injector, loadedKeymap)
+        driveBrowser(
+            injector, mixer, lircFd, browserExit, abortFd, sys.stdin,
+            repeatHorizon)
 
 
-def main():
+def main(argv=None):
     parser = argparse.ArgumentParser()
     parser.add_argument('--suspend-kodi', action='store_true')
     parser.add_argument('--lirc-config', required=True)
     parser.add_argument('--xdotool-path')
     parser.add_argument('--alsa-control')
+    parser.add_argument(
+        '--repeat-horizon-ms',
+        type=int,
+        default=int(DEFAULT_REPEAT_HORIZON.total_seconds() * 1000))
+    parser.add_argument('--keymap-cache')
+    parser.add_argument('--warm-pid', type=int)
+    parser.add_argument('--kodi-pid', type=int)
     parser.add_argument('cmd', nargs='+')
-    args = parser.parse_args()
+    args = parser.parse_args(argv)
 
     wrapBrowser(
         args.cmd,
         args.suspend_kodi,
         args.lirc_config,
         args.xdotool_path,
-        args.alsa_control)
+        args.alsa_control,
+        datetime.timedelta(milliseconds=args.repeat_horizon_ms),
+        args.keymap_cache,
+        args.warm_pid,
+        args.kodi_pid)
 
 
 if __name__ == "__main__":
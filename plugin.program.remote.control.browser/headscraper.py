@@ -0,0 +1,131 @@
+import codecs
+import collections
+import functools
+import html.parser
+import re
+
+
+CHUNK_SIZE = 16 * 2**10
+HEAD_BYTE_CAP = 512 * 2**10
+DEFAULT_CHARSET = 'utf-8'
+# Like browsers, only the start of the page is searched for a meta charset.
+CHARSET_SNIFF_SIZE = 1024
+META_CHARSET_PATTERN = re.compile(
+    br'<meta\s[^>]*?charset\s*=\s*["\']?\s*([a-z0-9_:.-]+)', re.IGNORECASE)
+
+
+Icon = collections.namedtuple('Icon', ('href', 'sizes', 'type', 'rels'))
+
+
+class HeadScraper(html.parser.HTMLParser):
+    """Collects the title and icons of a webpage as its head streams in"""
+
+    def __init__(self, onTitle):
+        super(HeadScraper, self).__init__(convert_charrefs=True)
+        self.onTitle = onTitle
+        self.title = None
+        self.titleParts = None
+        self.icons = []
+        self.isDone = False
+
+    def handle_starttag(self, tag, attrs):
+        # A valueless attribute is reported as None.
+        attrs = dict((name, value or '') for (name, value) in attrs)
+        if tag == 'title' and self.title is None:
+            self.titleParts = []
+        elif tag == 'link':
+            rels = tuple(attrs.get('rel', '').lower().split())
+            if 'icon' in rels and attrs.get('href'):
+                self.icons.append(Icon(
+                    href=attrs['href'],
+                    sizes=attrs.get('sizes'),
+                    type=attrs.get('type'),
+                    rels=rels))
+        elif tag == 'body':
+            self.isDone = True
+
+    def handle_data(self, data):
+        if self.titleParts is not None:
+            self.titleParts.append(data)
+
+    def handle_endtag(self, tag):
+        if tag == 'title':
+            self.finishTitle()
+        elif tag == 'head':
+            self.isDone = True
+
+    def finishTitle(self):
+        if self.titleParts is not None:
+            self.title = ''.join(self.titleParts).strip()
+            self.titleParts = None
+            self.onTitle(self.title)
+
+
+def getIconPreference(icon):
+    return (
+        # Prefer large images.
+        functools.reduce(
+            lambda prev, cur: prev * int(cur, 10),
+            re.findall(r'\d+', icon.sizes),
+            1)
+        if icon.sizes is not None else 0,
+        # Prefer PNG format.
+        icon.type == 'image/png',
+        # Prefer "icon" to "shortcut icon".
+        icon.rels == ('icon',))
+
+
+def getBestIcon(icons):
+    return max(icons, key=getIconPreference, default=None)
+
+
+def sniffCharset(prefix):
+    """Returns the charset that a page declares in its first bytes, if any"""
+    match = META_CHARSET_PATTERN.search(prefix[:CHARSET_SNIFF_SIZE])
+    if match is None:
+        return None
+    charset = match.group(1).decode('ascii')
+    # A page that could be read as ASCII can't actually be UTF-16.
+    if charset.lower().startswith('utf-16'):
+        return DEFAULT_CHARSET
+    return charset
+
+
+def scrapeHead(response, onTitle, isAborting, byteCap=HEAD_BYTE_CAP):
+    """Parses a response until the end of its head
+
+    The title is reported through onTitle as soon as it has been parsed. The
+    rest of the page is never read, so the caller should close the response.
+    Without a charset in the Content-Type header, the charset of a meta tag
+    near the start of the page is used.
+    """
+    # A short read returns whatever has arrived, instead of waiting to fill
+    # the whole chunk.
+    read = getattr(response, 'read1', response.read)
+    remaining = byteCap
+    charset = response.headers.get_content_charset()
+    prefix = b''
+    if charset is None:
+        while len(prefix) < min(CHARSET_SNIFF_SIZE, byteCap):
+            chunk = read(min(CHUNK_SIZE, byteCap - len(prefix)))
+            if not chunk:
+                break
+            prefix += chunk
+        remaining -= len(prefix)
+        charset = sniffCharset(prefix) or DEFAULT_CHARSET
+    try:
+        decoder = codecs.getincrementaldecoder(charset)(errors='replace')
+    except LookupError:
+        decoder = codecs.getincrementaldecoder(DEFAULT_CHARSET)(
+            errors='replace')
+    scraper = HeadScraper(onTitle)
+    scraper.feed(decoder.decode(prefix))
+    while not scraper.isDone and remaining > 0 and not isAborting.is_set():
+        chunk = read(min(CHUNK_SIZE, remaining))
+        if not chunk:
+            break
+        remaining -= len(chunk)
+        scraper.feed(decoder.decode(chunk))
+    # An unterminated title is still better than none.
+    scraper.finishTitle()
+    return scraper
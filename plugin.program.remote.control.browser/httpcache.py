@@ -0,0 +1,93 @@
+import collections
+import sqlite3
+
+
+SCHEMA_VERSION = 1
+BUSY_TIMEOUT = 10  # seconds
+
+
+PageEntry = collections.namedtuple(
+    'PageEntry', ('etag', 'lastModified', 'base', 'title', 'icon'))
+IconEntry = collections.namedtuple(
+    'IconEntry', ('etag', 'lastModified', 'hash', 'thumb'))
+
+
+def getValidatorHeaders(etag, lastModified):
+    """Returns the headers that make a request conditional"""
+    headers = {}
+    if etag is not None:
+        headers['If-None-Match'] = etag
+    if lastModified is not None:
+        headers['If-Modified-Since'] = lastModified
+    return headers
+
+
+class HttpCache(object):
+    """Remembers the validators of scraped webpages and favicons
+
+    A webpage is stored along with what was scraped from its head, and a
+    favicon along with the hash of its content and the thumbnail that was made
+    from it. Either can then be revalidated instead of being processed again.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.connection = None
+
+    def open(self):
+        # Each statement is its own transaction, since entries are only ever
+        # replaced whole.
+        self.connection = sqlite3.connect(
+            self.path, timeout=BUSY_TIMEOUT, isolation_level=None)
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        (version,) = self.connection.execute('PRAGMA user_version').fetchone()
+        if version < SCHEMA_VERSION:
+            self.connection.execute(
+                'CREATE TABLE IF NOT EXISTS pages ('
+                'url TEXT PRIMARY KEY, '
+                'etag TEXT, '
+                'lastModified TEXT, '
+                'base TEXT NOT NULL, '
+                'title TEXT, '
+                'icon TEXT)')
+            self.connection.execute(
+                'CREATE TABLE IF NOT EXISTS icons ('
+                'url TEXT PRIMARY KEY, '
+                'etag TEXT, '
+                'lastModified TEXT, '
+                'hash TEXT NOT NULL, '
+                'thumb TEXT NOT NULL)')
+            self.connection.execute(
+                'PRAGMA user_version={:d}'.format(SCHEMA_VERSION))
+
+    def close(self):
+        if self.connection is not None:
+            self.connection.close()
+            self.connection = None
+
+    def getPage(self, url):
+        row = self.connection.execute(
+            'SELECT etag, lastModified, base, title, icon FROM pages '
+            'WHERE url = ?',
+            (url,)).fetchone()
+        return None if row is None else PageEntry(*row)
+
+    def putPage(self, url, entry):
+        self.connection.execute(
+            'INSERT OR REPLACE INTO pages '
+            '(url, etag, lastModified, base, title, icon) '
+            'VALUES (?, ?, ?, ?, ?, ?)',
+            (url,) + tuple(entry))
+
+    def getIcon(self, url):
+        row = self.connection.execute(
+            'SELECT etag, lastModified, hash, thumb FROM icons WHERE url = ?',
+            (url,)).fetchone()
+        return None if row is None else IconEntry(*row)
+
+    def putIcon(self, url, entry):
+        self.connection.execute(
+            'INSERT OR REPLACE INTO icons '
+            '(url, etag, lastModified, hash, thumb) '
+            'VALUES (?, ?, ?, ?, ?)',
+            (url,) + tuple(entry))
@@ -0,0 +1,132 @@
+import contextlib
+import json
+import os
+import queue
+import selectors
+import subprocess
+import sys
+import threading
+import time
+
+
+DEFAULT_TIMEOUT = 30  # seconds
+WORKER_EXIT_DELAY = 1  # seconds
+
+
+class ImageWorkerError(IOError):
+    pass
+
+
+class ImageWorker(object):
+    """Retrieves favicons through a long-lived retrieve.py process
+
+    Pillow still runs outside of Kodi, because many distributions are prone to
+    deadlock, but the interpreter start-up is only paid once for many icons. A
+    worker that crashes or stops responding is killed and then replaced on the
+    next request.
+    """
+
+    def __init__(self, retrievePath, timeout=DEFAULT_TIMEOUT):
+        self.retrievePath = retrievePath
+        self.timeout = timeout
+        self.lock = threading.Lock()
+        self.proc = None
+        self.buffer = b''
+
+    def start(self):
+        self.proc = subprocess.Popen(
+            [sys.executable, self.retrievePath, '--serve'],
+            close_fds=True,
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE)
+        self.buffer = b''
+
+    def stop(self):
+        if self.proc is None:
+            return
+        proc = self.proc
+        self.proc = None
+        try:
+            proc.stdin.close()
+        except IOError:
+            pass
+        try:
+            proc.wait(WORKER_EXIT_DELAY)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+            proc.wait()
+        proc.stdout.close()
+
+    def close(self):
+        with self.lock:
+            self.stop()
+
+    def readLine(self, deadline):
+        fd = self.proc.stdout.fileno()
+        with selectors.DefaultSelector() as selector:
+            selector.register(fd, selectors.EVENT_READ)
+            while b'\n' not in self.buffer:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0 or not selector.select(timeout):
+                    raise ImageWorkerError('The image worker timed out')
+                chunk = os.read(fd, 4096)
+                if not chunk:
+                    raise ImageWorkerError('The image worker crashed')
+                self.buffer += chunk
+        (line, separator, self.buffer) = self.buffer.partition(b'\n')
+        return line
+
+    def retrieve(self, url, folder, validators=None):
+        """Downloads an image and saves it as a PNG thumbnail in a folder
+
+        The optional validators hold the etag, lastModified and hash of an
+        earlier download. The result holds those of this download and the
+        thumbnail's ID, or it is marked as unchanged if nothing was saved.
+        """
+        request = json.dumps(dict(validators or {}, url=url, folder=folder))
+        with self.lock:
+            if self.proc is None:
+                self.start()
+            try:
+                self.proc.stdin.write(request.encode('utf_8') + b'\n')
+                self.proc.stdin.flush()
+                line = self.readLine(time.monotonic() + self.timeout)
+            except (IOError, ImageWorkerError):
+                # The worker can't be trusted to be in sync any longer.
+                self.stop()
+                raise
+        try:
+            response = json.loads(line.decode('utf_8'))
+        except ValueError:
+            raise ImageWorkerError('Invalid image worker response')
+        error = response.get('error')
+        if error is not None:
+            raise ImageWorkerError(error)
+        return response
+
+
+class ImageWorkerPool(object):
+    """Shares a fixed number of image workers between threads"""
+
+    def __init__(self, retrievePath, size):
+        # Workers only start a process when they are first used.
+        self.workers = [ImageWorker(retrievePath) for _ in range(size)]
+        self.idleWorkers = queue.Queue()
+        for worker in self.workers:
+            self.idleWorkers.put(worker)
+
+    @contextlib.contextmanager
+    def borrow(self):
+        worker = self.idleWorkers.get()
+        try:
+            yield worker
+        finally:
+            self.idleWorkers.put(worker)
+
+    def retrieve(self, url, folder, validators=None):
+        with self.borrow() as worker:
+            return worker.retrieve(url, folder, validators)
+
+    def close(self):
+        for worker in self.workers:
+            worker.close()
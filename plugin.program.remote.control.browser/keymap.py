@@ -0,0 +1,364 @@
+import collections
+import errno
+import hashlib
+import json
+import os
+import re
+import shlex
+
+import atomicfile
+
+
+LIRC_PROG = 'browser'
+CACHE_VERSION = 1
+CACHE_PATH_DIGEST_LENGTH = 16
+DEFAULT_POINTER_CURVE = 'quadratic'
+POINTER_CURVES = ('linear', 'quadratic', 'exp')
+# The X pointer buttons: left, middle, right, wheel up and wheel down.
+CLICK_BUTTONS = range(1, 6)
+BINDING_KEYS = (
+    'prog',
+    'remote',
+    'button',
+    'repeat',
+    'delay',
+    'config',
+    'mode',
+    'flags',
+    'ignore_first_events',
+)
+BINDING_FLAGS = ('once', 'quit', 'mode', 'ecno', 'startup_mode', 'toggle_reset')
+
+
+LircCommand = collections.namedtuple('LircCommand', ('name', 'args'))
+Binding = collections.namedtuple(
+    'Binding',
+    ('mode', 'prog', 'remote', 'buttons', 'configs', 'repeat', 'delay',
+     'targetMode', 'flags'))
+Keymap = collections.namedtuple(
+    'Keymap', ('sources', 'startupMode', 'bindings', 'commands'))
+
+
+class KeymapError(ValueError):
+    pass
+
+
+def parseNoArgs(args):
+    if args:
+        raise ValueError('Unexpected arguments: ' + ' '.join(args))
+    return ()
+
+
+def parseKeyArgs(args):
+    if not args:
+        raise ValueError('Missing keys')
+    return tuple(args)
+
+
+def parseClickArgs(args):
+    if len(args) > 1:
+        raise ValueError('Unexpected arguments: ' + ' '.join(args[1:]))
+    button = int(next(iter(args), '1'), 10)
+    if button not in CLICK_BUTTONS:
+        raise ValueError('Unsupported button: {}'.format(button))
+    return (button,)
+
+
+def parseMouseArgs(args):
+    if len(args) < 2:
+        raise ValueError('Missing pointer direction')
+    (horizontal, vertical) = (int(arg, 10) for arg in args[:2])
+    options = {}
+    for arg in args[2:]:
+        (key, separator, value) = arg.partition('=')
+        if not separator:
+            raise ValueError('Invalid pointer option: ' + arg)
+        options[key] = value
+    curve = options.pop('curve', DEFAULT_POINTER_CURVE)
+    if curve not in POINTER_CURVES:
+        raise ValueError('Unrecognized pointer curve: ' + curve)
+    if options:
+        raise ValueError(
+            'Unrecognized pointer options: ' + ', '.join(sorted(options)))
+    return (horizontal, vertical, curve)
+
+
+COMMAND_PARSERS = {
+    'VOLUME_UP': parseNoArgs,
+    'VOLUME_DOWN': parseNoArgs,
+    'MUTE': parseNoArgs,
+    'MULTITAP': parseKeyArgs,
+    'KEY': parseKeyArgs,
+    'CLICK': parseClickArgs,
+    'MOUSE': parseMouseArgs,
+    'EXIT': parseNoArgs,
+    'RELEASE': parseNoArgs,
+}
+
+
+# Compiled commands are shared by every keymap in the process.
+compiledCommands = {}
+
+
+def compileCommand(config):
+    """Parses a LIRC config string once into an immutable command"""
+    command = compiledCommands.get(config)
+    if command is not None:
+        return command
+    tokens = shlex.split(config)
+    if not tokens:
+        raise KeymapError('Empty LIRC config')
+    (name, args) = (tokens[0], tokens[1:])
+    parser = COMMAND_PARSERS.get(name)
+    if parser is None:
+        raise KeymapError('Unrecognized LIRC config: ' + config)
+    try:
+        command = LircCommand(name, parser(args))
+    except ValueError as e:
+        raise KeymapError('Invalid LIRC config "{}": {}'.format(config, e))
+    compiledCommands[config] = command
+    return command
+
+
+class LircrcParser(object):
+    """Parses a lircrc file and its includes into bindings"""
+
+    def __init__(self):
+        self.sources = []
+        self.included = set()
+        self.startupMode = None
+        self.bindings = []
+
+    def fail(self, path, lineNumber, message):
+        raise KeymapError('{}:{}: {}'.format(path, lineNumber, message))
+
+    def parseFile(self, path, mode=None):
+        path = os.path.realpath(path)
+        if path in self.included:
+            return
+        self.included.add(path)
+        with open(path, 'rb') as lircrcFile:
+            contents = lircrcFile.read()
+        self.sources.append((path, hashlib.sha256(contents).hexdigest()))
+
+        fileMode = mode
+        block = None
+        for (lineNumber, line) in enumerate(
+                contents.decode('utf_8').splitlines(), 1):
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+            tokens = line.split(None, 1)
+            keyword = tokens[0]
+            argument = tokens[1].strip() if len(tokens) > 1 else None
+
+            if keyword == 'begin' and block is None:
+                if argument is None:
+                    block = collections.defaultdict(list)
+                    block['lineNumber'] = lineNumber
+                elif mode != fileMode:
+                    self.fail(path, lineNumber, 'Nested mode: ' + argument)
+                else:
+                    mode = argument
+            elif keyword == 'end' and block is not None:
+                if argument is not None:
+                    self.fail(path, lineNumber, 'Unterminated binding')
+                self.addBinding(path, block, mode)
+                block = None
+            elif keyword == 'end':
+                if argument is None or argument != mode or mode == fileMode:
+                    self.fail(path, lineNumber, 'Unmatched end: ' + line)
+                mode = fileMode
+            elif keyword == 'include' and block is None:
+                if argument is None:
+                    self.fail(path, lineNumber, 'Missing include path')
+                included = argument.strip('"<>')
+                self.parseFile(
+                    os.path.join(os.path.dirname(path), included), mode)
+            elif block is not None:
+                (key, separator, value) = line.partition('=')
+                (key, value) = (key.strip(), value.strip())
+                if not separator or key not in BINDING_KEYS:
+                    self.fail(path, lineNumber, 'Unrecognized line: ' + line)
+                block[key].append(value)
+            else:
+                self.fail(path, lineNumber, 'Unrecognized line: ' + line)
+
+        if block is not None:
+            self.fail(path, block['lineNumber'], 'Unterminated binding')
+        if mode != fileMode:
+            self.fail(path, lineNumber, 'Unterminated mode: ' + mode)
+
+    def addBinding(self, path, block, mode):
+        lineNumber = block['lineNumber']
+
+        def getSingle(key, default=None):
+            values = block.get(key, [])
+            if len(values) > 1:
+                self.fail(path, lineNumber, 'Repeated key: ' + key)
+            return next(iter(values), default)
+
+        def getCount(key):
+            value = getSingle(key, '0')
+            try:
+                count = int(value, 10)
+            except ValueError:
+                count = -1
+            if count < 0:
+                self.fail(path, lineNumber, 'Invalid {}: {}'.format(key, value))
+            return count
+
+        flags = tuple(
+            flag
+            for value in block.get('flags', [])
+            for flag in re.split(r'[\s|]+', value) if flag)
+        for flag in flags:
+            if flag not in BINDING_FLAGS:
+                self.fail(path, lineNumber, 'Unrecognized flag: ' + flag)
+        targetMode = getSingle('mode')
+        if 'startup_mode' in flags:
+            if targetMode is None:
+                self.fail(path, lineNumber, 'Missing startup mode')
+            self.startupMode = targetMode
+            return
+
+        prog = getSingle('prog')
+        configs = tuple(block.get('config', []))
+        if prog is None:
+            self.fail(path, lineNumber, 'Missing prog')
+        if not configs and targetMode is None:
+            self.fail(path, lineNumber, 'Missing config')
+        if prog == LIRC_PROG:
+            for config in configs:
+                try:
+                    compileCommand(config)
+                except KeymapError as e:
+                    self.fail(path, lineNumber, str(e))
+        self.bindings.append(Binding(
+            mode=mode,
+            prog=prog,
+            remote=getSingle('remote', '*'),
+            buttons=tuple(block.get('button', [])),
+            configs=configs,
+            repeat=getCount('repeat'),
+            delay=getCount('delay'),
+            targetMode=targetMode,
+            flags=flags))
+
+
+def parseKeymap(path):
+    parser = LircrcParser()
+    parser.parseFile(path)
+    commands = dict(
+        (config, compileCommand(config))
+        for binding in parser.bindings if binding.prog == LIRC_PROG
+        for config in binding.configs)
+    return Keymap(
+        sources=tuple(parser.sources),
+        startupMode=parser.startupMode,
+        bindings=tuple(parser.bindings),
+        commands=commands)
+
+
+def getCachePath(path, cacheFolder):
+    # The name starts with a hash of the path alone, so that the entries of
+    # older versions of the same keymap can be found and removed.
+    path = os.path.realpath(path)
+    with open(path, 'rb') as lircrcFile:
+        contentDigest = hashlib.sha256(lircrcFile.read()).hexdigest()
+    pathDigest = hashlib.sha256(path.encode('utf_8')).hexdigest()
+    return os.path.join(
+        cacheFolder,
+        '{}-{}.json'.format(
+            pathDigest[:CACHE_PATH_DIGEST_LENGTH], contentDigest))
+
+
+def removeStaleCaches(cachePath):
+    """Removes every other cache entry of the same keymap path"""
+    (cacheFolder, cacheName) = os.path.split(cachePath)
+    (pathDigest, separator, contentDigest) = cacheName.partition('-')
+    for name in os.listdir(cacheFolder):
+        if name == cacheName or not name.endswith('.json'):
+            continue
+        if name.startswith(pathDigest + '-'):
+            try:
+                os.remove(os.path.join(cacheFolder, name))
+            except OSError:
+                pass
+
+
+def isCacheFresh(sources):
+    for (path, expectedHash) in sources:
+        try:
+            with open(path, 'rb') as sourceFile:
+                actualHash = hashlib.sha256(sourceFile.read()).hexdigest()
+        except IOError:
+            return False
+        if actualHash != expectedHash:
+            return False
+    return True
+
+
+def readCache(cachePath):
+    try:
+        with open(cachePath) as cacheFile:
+            cached = json.load(cacheFile)
+    except (IOError, ValueError):
+        return None
+    if cached.get('version') != CACHE_VERSION:
+        return None
+    sources = tuple(tuple(source) for source in cached['sources'])
+    if not isCacheFresh(sources):
+        return None
+    commands = {}
+    for (config, (name, args)) in cached['commands'].items():
+        command = LircCommand(name, tuple(args))
+        compiledCommands.setdefault(config, command)
+        commands[config] = command
+    return Keymap(
+        sources=sources,
+        startupMode=cached['startupMode'],
+        bindings=tuple(
+            Binding(**dict(
+                (key, tuple(value) if isinstance(value, list) else value)
+                for (key, value) in binding.items()))
+            for binding in cached['bindings']),
+        commands=commands)
+
+
+def writeCache(cachePath, keymap):
+    cached = {
+        'version': CACHE_VERSION,
+        'sources': keymap.sources,
+        'startupMode': keymap.startupMode,
+        'bindings': [binding._asdict() for binding in keymap.bindings],
+        'commands': keymap.commands,
+    }
+    try:
+        os.makedirs(os.path.dirname(cachePath))
+    except OSError as e:
+        if e.errno != errno.EEXIST:
+            raise
+    with atomicfile.atomicWrite(cachePath, 'w') as cacheFile:
+        json.dump(cached, cacheFile)
+
+
+def loadKeymap(path, cacheFolder=None):
+    """Returns the compiled keymap, reusing the cache when it is fresh
+
+    A KeymapError is raised if the keymap is malformed or if it contains a
+    config line that the browser does not understand.
+    """
+    if cacheFolder is None:
+        return parseKeymap(path)
+    cachePath = getCachePath(path, cacheFolder)
+    keymap = readCache(cachePath)
+    if keymap is None:
+        keymap = parseKeymap(path)
+        try:
+            writeCache(cachePath, keymap)
+            removeStaleCaches(cachePath)
+        except (IOError, OSError):
+            # The cache is only an optimization.
+            pass
+    return keymap
@@ -0,0 +1,203 @@
+#!/usr/bin/env python
+
+import argparse
+import contextlib
+import json
+import logging
+import os
+import selectors
+import signal
+import socket
+import sys
+import time
+import traceback
+
+# Importing the wrapper ahead of time is the whole point of the launcher. Each
+# forked child starts with every module already loaded.
+import browse
+
+
+# Log lines go through the wrapper's handler.
+logger = logging.getLogger('remotecontrolbrowser.launcher')
+
+
+MAX_REQUEST_SIZE = 64 * 2**10
+REQUEST_FDS = 2
+
+
+class LauncherExit(Exception):
+    pass
+
+
+class Launcher(object):
+    """Forks a browser wrapper for each request on a Unix socket
+
+    A request is one JSON line holding the wrapper's arguments, sent along with
+    the client's stdin and stderr file descriptors. The launcher replies with
+    a line holding the wrapper's pid, and later with a line holding its exit
+    status.
+    """
+
+    def __init__(self, socketPath):
+        self.socketPath = socketPath
+        self.selector = selectors.DefaultSelector()
+        self.listener = None
+        self.wakeupSink = None
+        self.wakeupSource = None
+        self.children = {}
+
+    def open(self):
+        try:
+            os.remove(self.socketPath)
+        except OSError:
+            pass
+        self.listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.listener.bind(self.socketPath)
+        self.listener.listen()
+        self.selector.register(self.listener, selectors.EVENT_READ, self.accept)
+
+        (self.wakeupSink, self.wakeupSource) = socket.socketpair()
+        self.wakeupSink.setblocking(False)
+        self.wakeupSource.setblocking(False)
+        signal.signal(signal.SIGCHLD, lambda signal, frame: None)
+        signal.set_wakeup_fd(
+            self.wakeupSource.fileno(), warn_on_full_buffer=False)
+        self.selector.register(
+            self.wakeupSink, selectors.EVENT_READ, self.reapChildren)
+
+        # Closing stdin will inform the launcher of the service's death.
+        self.selector.register(sys.stdin, selectors.EVENT_READ, self.exit)
+
+    def releaseResources(self):
+        signal.set_wakeup_fd(-1)
+        signal.signal(signal.SIGCHLD, signal.SIG_DFL)
+        for (connection, startTime) in self.children.values():
+            connection.close()
+        self.children.clear()
+        self.selector.close()
+        if self.listener is not None:
+            self.listener.close()
+        if self.wakeupSink is not None:
+            self.wakeupSink.close()
+            self.wakeupSource.close()
+
+    def close(self):
+        self.releaseResources()
+        if self.listener is not None:
+            try:
+                os.remove(self.socketPath)
+            except OSError:
+                pass
+
+    def run(self):
+        logger.info('Listening on ' + self.socketPath)
+        try:
+            while True:
+                for (key, events) in self.selector.select():
+                    key.data()
+        except LauncherExit:
+            logger.info('Exiting because the service stopped')
+
+    def exit(self):
+        raise LauncherExit()
+
+    def accept(self):
+        (connection, address) = self.listener.accept()
+        with contextlib.ExitStack() as stack:
+            stack.callback(connection.close)
+            startTime = time.monotonic()
+            (request, fds, flags, address) = socket.recv_fds(
+                connection, MAX_REQUEST_SIZE, REQUEST_FDS)
+            for fd in fds:
+                stack.callback(os.close, fd)
+            while request and not request.endswith(b'\n'):
+                chunk = connection.recv(MAX_REQUEST_SIZE)
+                if not chunk:
+                    break
+                request += chunk
+            try:
+                args = json.loads(request.decode('utf_8'))['args']
+            except (ValueError, KeyError, TypeError) as e:
+                logger.info('Ignoring malformed request: ' + str(e))
+                return
+            if len(fds) != REQUEST_FDS:
+                logger.info('Ignoring request without stdin and stderr')
+                return
+
+            pid = os.fork()
+            if pid == 0:
+                self.runChild(connection, args, fds)
+            logger.debug('Forked wrapper {} in {:.1f} ms'.format(
+                pid, (time.monotonic() - startTime) * 1000))
+            self.send(connection, {'pid': pid})
+            self.children[pid] = (connection, startTime)
+            stack.pop_all()
+            for fd in fds:
+                os.close(fd)
+
+    def runChild(self, connection, args, fds):
+        """Becomes the wrapper and never returns"""
+        exitCode = 1
+        try:
+            # The child must not hold on to any of the launcher's resources.
+            connection.close()
+            self.releaseResources()
+            (stdinFd, stderrFd) = fds
+            os.dup2(stdinFd, sys.stdin.fileno())
+            os.dup2(stderrFd, sys.stderr.fileno())
+            os.close(stdinFd)
+            os.close(stderrFd)
+            browse.main(args)
+            exitCode = 0
+        except SystemExit as e:
+            exitCode = e.code if isinstance(e.code, int) else 1
+        except BaseException:
+            traceback.print_exc()
+        finally:
+            sys.stderr.flush()
+            os._exit(exitCode)
+
+    def reapChildren(self):
+        try:
+            while self.wakeupSink.recv(4096):
+                pass
+        except BlockingIOError:
+            pass
+        while self.children:
+            try:
+                (pid, status) = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                break
+            if pid == 0:
+                break
+            child = self.children.pop(pid, None)
+            if child is None:
+                continue
+            (connection, startTime) = child
+            returncode = os.waitstatus_to_exitcode(status)
+            logger.debug('Wrapper {} exited with {} after {:.0f} s'.format(
+                pid, returncode, time.monotonic() - startTime))
+            with contextlib.closing(connection):
+                try:
+                    self.send(connection, {'exit': returncode})
+                except OSError:
+                    # The client may have given up already.
+                    pass
+
+    def send(self, connection, message):
+        connection.sendall(json.dumps(message).encode('utf_8') + b'\n')
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--socket', required=True)
+    args = parser.parse_args()
+
+    launcher = Launcher(args.socket)
+    with contextlib.closing(launcher):
+        launcher.open()
+        launcher.run()
+
+
+if __name__ == "__main__":
+    main()
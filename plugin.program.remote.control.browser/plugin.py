@@ -2,43 +2,42 @@ import argparse
 import contextlib
 import datetime
 import errno
-import functools
 import json
 import math
 import os
+import pickle
 import re
 import shlex
-import subprocess
+import socket
 import sys
 import threading
-import urllib.request
+import time
 import urllib.parse
 import uuid
-import xml.etree.ElementTree
 
-import bs4
 import xbmc
 import xbmcaddon
 import xbmcgui
 import xbmcplugin
 import xbmcvfs
 
+import atomicfile
+import bookmarks
+
+
+# Kodi starts a fresh interpreter for every directory listing and menu action,
+# so any module that only some modes need is imported inside those modes.
 
 # If any of these packages are missing, the script will attempt to proceed
-# without those features.
-try:
-    import alsaaudio
-except ImportError:
-    xbmc.log('Missing Python package: alsaaudio', xbmc.LOGDEBUG)
-    alsaaudio = None
-try:
-    import pulsectl
-except ImportError:
-    xbmc.log('Missing Python package: pulsectl', xbmc.LOGDEBUG)
-    pulsectl = None
+# without those features. They are loaded by importMixerPackages().
+alsaaudio = None
+pulsectl = None
 
 
 DEFAULT_VOLUME = 50
+REFRESH_FETCH_THREADS = 4
+REFRESH_IMAGE_WORKERS = 2
+LISTING_CACHE_VERSION = 1
 DEFAULT_LIRC_CONFIG = ('special://home/addons' +
                        '/plugin.program.remote.control.browser' +
                        '/resources/data/lircd/browser.lirc')
@@ -85,6 +84,20 @@ class InterminableProgressBar(object):
         self.dialog.update(int(percentage))
 
 
+def importMixerPackages():
+    global alsaaudio, pulsectl
+    try:
+        import alsaaudio
+    except ImportError:
+        xbmc.log('Missing Python package: alsaaudio', xbmc.LOGDEBUG)
+        alsaaudio = None
+    try:
+        import pulsectl
+    except ImportError:
+        xbmc.log('Missing Python package: pulsectl', xbmc.LOGDEBUG)
+        pulsectl = None
+
+
 def makedirs(folder):
     try:
         os.makedirs(folder)
@@ -94,6 +107,32 @@ def makedirs(folder):
             raise
 
 
+def readListingCache(path, key):
+    try:
+        with open(path, 'rb') as cacheFile:
+            cached = pickle.load(cacheFile)
+    except (IOError, EOFError, ValueError, pickle.UnpicklingError):
+        return None
+    if cached.get('key') != key:
+        return None
+    return cached['listing']
+
+
+def writeListingCache(path, key, listing):
+    with atomicfile.atomicWrite(path) as cacheFile:
+        pickle.dump(
+            {'key': key, 'listing': listing},
+            cacheFile,
+            pickle.HIGHEST_PROTOCOL)
+
+
+def getFolderSignature(folder):
+    try:
+        return os.stat(folder).st_mtime_ns
+    except OSError:
+        return None
+
+
 def slurpLine(stream, slurpLogGuard):
     with slurpLogGuard:
         try:
@@ -134,6 +173,74 @@ def lockPidfile(browserLockPath, pid):
                 xbmc.log('Failed to remove pidfile: ' + str(e))
 
 
+class LaunchedProcess(object):
+    """Stands in for the Popen of a wrapper that the launcher forked"""
+
+    def __init__(self, connection, stdin, stderr):
+        self.connection = connection
+        self.stdin = stdin
+        self.stderr = stderr
+        self.buffer = b''
+        self.pid = None
+        self.returncode = None
+
+    @classmethod
+    def launch(cls, socketPath, args):
+        with contextlib.ExitStack() as stack:
+            connection = stack.enter_context(
+                socket.socket(socket.AF_UNIX, socket.SOCK_STREAM))
+            connection.connect(socketPath)
+            (stdinRead, stdinWrite) = os.pipe()
+            stdin = stack.enter_context(os.fdopen(stdinWrite, 'wb'))
+            (stderrRead, stderrWrite) = os.pipe()
+            stderr = stack.enter_context(os.fdopen(stderrRead, 'rb'))
+            try:
+                # The launcher's child takes over these ends of the pipes.
+                request = json.dumps({'args': args}).encode('utf_8') + b'\n'
+                socket.send_fds(
+                    connection, [request], [stdinRead, stderrWrite])
+            finally:
+                os.close(stdinRead)
+                os.close(stderrWrite)
+            proc = cls(connection, stdin, stderr)
+            proc.pid = proc.receive(None)['pid']
+            stack.pop_all()
+            return proc
+
+    def receive(self, timeout):
+        while b'\n' not in self.buffer:
+            self.connection.settimeout(timeout)
+            try:
+                chunk = self.connection.recv(4096)
+            except (BlockingIOError, socket.timeout):
+                return None
+            if not chunk:
+                raise EOFError('The launcher hung up')
+            self.buffer += chunk
+        (line, separator, self.buffer) = self.buffer.partition(b'\n')
+        return json.loads(line.decode('utf_8'))
+
+    def receiveExit(self, timeout):
+        try:
+            message = self.receive(timeout)
+        except EOFError as e:
+            xbmc.log(str(e), xbmc.LOGERROR)
+            message = {'exit': 1}
+        if message is not None:
+            self.returncode = message['exit']
+            self.connection.close()
+
+    def poll(self):
+        if self.returncode is None:
+            self.receiveExit(0)
+        return self.returncode
+
+    def wait(self):
+        if self.returncode is None:
+            self.receiveExit(None)
+        return self.returncode
+
+
 class KeySink(xbmcgui.Window):
     def __enter__(self):
         xbmc.log('Starting capture of all keys', xbmc.LOGDEBUG)
@@ -305,6 +412,7 @@ class VolumeGuard(object):
                 xbmc.log('Original system volume not restored because it is not known')
 
     def getMixer(self):
+        importMixerPackages()
         try:
             return PulseWrapper() if self.alsaControl is None else AlsaWrapper(self.alsaControl)
         except VolumeError:
@@ -339,11 +447,24 @@ class RemoteControlBrowserPlugin(xbmcaddon.Addon):
         self.addonFolder = xbmcvfs.translatePath(self.getAddonInfo('path'))
         self.profileFolder = xbmcvfs.translatePath(self.getAddonInfo('profile'))
         self.bookmarksPath = os.path.join(self.profileFolder, 'bookmarks.xml')
+        self.bookmarkStorePath = os.path.join(
+            self.profileFolder, 'bookmarks.db')
+        self.listingCachePath = os.path.join(
+            self.profileFolder, 'listing.cache')
+        self.httpCachePath = os.path.join(self.profileFolder, 'httpcache.db')
         self.defaultBookmarksPath = os.path.join(
             self.addonFolder, 'resources/data/bookmarks.xml')
         self.thumbsFolder = os.path.join(self.profileFolder, 'thumbs')
         self.defaultThumbsFolder = os.path.join(
             self.addonFolder, 'resources/data/thumbs')
+        self.keymapCacheFolder = os.path.join(self.profileFolder, 'keymaps')
+        self.launcherPath = os.path.join(self.profileFolder, 'launcher.sock')
+        self.imageWorker = None
+
+    def close(self):
+        if self.imageWorker is not None:
+            self.imageWorker.close()
+            self.imageWorker = None
 
     def buildPluginUrl(self, query):
         return urllib.parse.ParseResult(
@@ -369,55 +490,88 @@ class RemoteControlBrowserPlugin(xbmcaddon.Addon):
         # A notification needs to be encoded into a quoted byte string.
         return message.replace('"', r'\"').encode('utf_8')
 
-    def readBookmarks(self):
-        try:
-            return xml.etree.ElementTree.parse(self.bookmarksPath)
-        except (IOError, xml.etree.ElementTree.ParseError) as e:
-            xbmc.log(
-                'Falling back to default bookmarks: ' + str(e), xbmc.LOGDEBUG)
-            return xml.etree.ElementTree.parse(self.defaultBookmarksPath)
-
-    def getBookmarkElement(self, tree, bookmarkId):
-        bookmark = tree.find('bookmark[@id="{}"]'.format(bookmarkId))
+    @contextlib.contextmanager
+    def openBookmarks(self):
+        """Opens the bookmark store, migrating any legacy XML bookmarks"""
+        makedirs(self.profileFolder)
+        store = bookmarks.BookmarkStore(
+            self.bookmarkStorePath,
+            [self.bookmarksPath, self.defaultBookmarksPath])
+        with contextlib.closing(store):
+            store.open()
+            yield store
+
+    def getBookmark(self, bookmarkId):
+        with self.openBookmarks() as store:
+            bookmark = store.get(bookmarkId)
         if bookmark is None:
             raise ValueError('Unrecognized bookmark ID: ' + bookmarkId)
         return bookmark
 
-    def getBookmarkDirectoryItem(self, bookmarkId, title, thumbId):
-        url = self.buildPluginUrl({'mode': 'launchBookmark', 'id': bookmarkId})
-        listItem = xbmcgui.ListItem(label=self.escapeLabel(title))
-        if thumbId is not None:
-            thumbPath = self.getThumbPath(thumbId)
-            if not os.path.isfile(thumbPath):
-                thumbPath = self.getThumbPath(
-                    thumbId, self.defaultThumbsFolder)
-            if os.path.isfile(thumbPath):
+    def getBookmarkListing(self, bookmark, menuLabels):
+        """Returns everything needed to build a bookmark's directory item"""
+        def buildModeUrl(mode):
+            return self.buildPluginUrl({'mode': mode, 'id': bookmark.id})
+
+        thumbPath = None
+        if bookmark.thumb is not None:
+            for thumbsFolder in (self.thumbsFolder, self.defaultThumbsFolder):
+                candidatePath = self.getThumbPath(bookmark.thumb, thumbsFolder)
+                if os.path.isfile(candidatePath):
+                    thumbPath = candidatePath
+                    break
+        url = buildModeUrl('launchBookmark')
+        contextMenuItems = [
+            (menuLabels[0], 'RunPlugin({})'.format(url)),
+            (menuLabels[1],
+             'RunPlugin({})'.format(buildModeUrl('editBookmark'))),
+            (menuLabels[2],
+             'RunPlugin({})'.format(buildModeUrl('editKeymap'))),
+            (menuLabels[3],
+             'RunPlugin({})'.format(buildModeUrl('removeBookmark'))),
+        ]
+        return (url, self.escapeLabel(bookmark.title), thumbPath,
+                contextMenuItems)
+
+    def getListing(self):
+        """Returns the bookmark listing, rebuilding it only when it is stale
+
+        The listing depends on the bookmarks, on which thumbnails exist, and
+        on the language of the menu labels.
+        """
+        menuLabels = tuple(
+            self.getLocalizedString(labelId)
+            for labelId in (30025, 30006, 30027, 30002))
+        with self.openBookmarks() as store:
+            key = (
+                LISTING_CACHE_VERSION,
+                store.getGeneration(),
+                getFolderSignature(self.thumbsFolder),
+                getFolderSignature(self.defaultThumbsFolder),
+                menuLabels)
+            listing = readListingCache(self.listingCachePath, key)
+            if listing is not None:
+                return listing
+            xbmc.log('Rebuilding bookmark listing', xbmc.LOGDEBUG)
+            listing = [
+                self.getBookmarkListing(bookmark, menuLabels)
+                for bookmark in store.list()]
+        try:
+            writeListingCache(self.listingCachePath, key, listing)
+        except (IOError, OSError) as e:
+            xbmc.log('Failed to cache listing: ' + str(e), xbmc.LOGDEBUG)
+        return listing
+
+    def index(self):
+        items = []
+        for (url, label, thumbPath, contextMenuItems) in self.getListing():
+            listItem = xbmcgui.ListItem(label=label)
+            if thumbPath is not None:
                 listItem.setArt({
                     'thumb': thumbPath,
                 })
-        listItem.addContextMenuItems([
-            (self.getLocalizedString(30025),
-             'RunPlugin({})'.format(self.buildPluginUrl(
-                 {'mode': 'launchBookmark', 'id': bookmarkId}))),
-            (self.getLocalizedString(30006),
-             'RunPlugin({})'.format(self.buildPluginUrl(
-                 {'mode': 'editBookmark', 'id': bookmarkId}))),
-            (self.getLocalizedString(30027),
-             'RunPlugin({})'.format(self.buildPluginUrl(
-                 {'mode': 'editKeymap', 'id': bookmarkId}))),
-            (self.getLocalizedString(30002),
-             'RunPlugin({})'.format(self.buildPluginUrl(
-                 {'mode': 'removeBookmark', 'id': bookmarkId}))),
-        ])
-        return (url, listItem)
-
-    def index(self):
-        tree = self.readBookmarks()
-        items = [self.getBookmarkDirectoryItem(
-            bookmark.get('id'),
-            bookmark.get('title'),
-            bookmark.get('thumb'))
-                 for bookmark in tree.iter('bookmark')]
+            listItem.addContextMenuItems(contextMenuItems)
+            items.append((url, listItem))
 
         url = self.buildPluginUrl({'mode': 'addBookmark'})
         listItem = xbmcgui.ListItem(
@@ -434,97 +588,291 @@ class RemoteControlBrowserPlugin(xbmcaddon.Addon):
         xbmcplugin.endOfDirectory(self.handle)
 
     def removeThumb(self, thumbId):
-        if thumbId is not None:
-            try:
-                os.remove(self.getThumbPath(thumbId))
-            except OSError:
-                xbmc.log(
-                    'Failed to remove thumbnail: ' + thumbId, xbmc.LOGINFO)
+        """Deletes a thumbnail once no bookmark uses it any more"""
+        if thumbId is None:
+            return
+        with self.openBookmarks() as store:
+            # The write lock keeps other processes from starting to use the
+            # thumbnail while it is being deleted.
+            with store.transaction():
+                if store.countThumbUsers(thumbId) > 0:
+                    xbmc.log(
+                        'Keeping shared thumbnail: ' + thumbId, xbmc.LOGDEBUG)
+                    return
+                try:
+                    os.remove(self.getThumbPath(thumbId))
+                except OSError:
+                    xbmc.log(
+                        'Failed to remove thumbnail: ' + thumbId,
+                        xbmc.LOGINFO)
+
+    @contextlib.contextmanager
+    def openHttpCache(self):
+        import httpcache
+
+        makedirs(self.profileFolder)
+        cache = httpcache.HttpCache(self.httpCachePath)
+        with contextlib.closing(cache):
+            cache.open()
+            yield cache
+
+    def fetchHead(self, url, onTitle, isAborting):
+        """Returns the base URL of a webpage and the link to its favicon
+
+        A webpage that is unchanged since it was last scraped isn't parsed
+        again. The link is None if the webpage doesn't declare any favicon.
+        """
+        import urllib.error
+        import urllib.request
+
+        import headscraper
+        import httpcache
+
+        with self.openHttpCache() as cache:
+            entry = cache.getPage(url)
+        headers = {}
+        if entry is not None:
+            headers = httpcache.getValidatorHeaders(
+                entry.etag, entry.lastModified)
+        xbmc.log('Fetching webpage: ' + url, xbmc.LOGINFO)
+        try:
+            webpage = urllib.request.urlopen(
+                urllib.request.Request(url, headers=headers))
+        except urllib.error.HTTPError as e:
+            if e.code != 304 or not headers:
+                raise
+            e.close()
+            xbmc.log('Webpage is unchanged: ' + url, xbmc.LOGDEBUG)
+            if entry.title is not None:
+                onTitle(entry.title)
+            return (entry.base, entry.icon)
+
+        xbmc.log('Parsing webpage head: ' + url, xbmc.LOGDEBUG)
+        with contextlib.closing(webpage):
+            head = headscraper.scrapeHead(webpage, onTitle, isAborting)
+        # Prefer the icon with the best quality.
+        icon = headscraper.getBestIcon(head.icons)
+        iconLink = None if icon is None else icon.href
+
+        etag = webpage.headers.get('ETag')
+        lastModified = webpage.headers.get('Last-Modified')
+        # A head that was cut short by an abort must not be remembered.
+        if ((etag is not None or lastModified is not None) and
+                not isAborting.is_set()):
+            with self.openHttpCache() as cache:
+                cache.putPage(url, httpcache.PageEntry(
+                    etag, lastModified, webpage.url, head.title, iconLink))
+        return (webpage.url, iconLink)
+
+    def retrieveThumb(self, thumbUrl, imagePool):
+        """Makes a thumbnail from a favicon and returns its ID
+
+        A favicon that was retrieved before is revalidated, and the thumbnail
+        that was made from it is reused if it is unchanged.
+        """
+        import httpcache
+        import imageworker
+
+        with self.openHttpCache() as cache:
+            entry = cache.getIcon(thumbUrl)
+        # The validators are useless without the thumbnail that was made.
+        validators = None
+        if entry is not None and os.path.isfile(
+                self.getThumbPath(entry.thumb)):
+            validators = {
+                'etag': entry.etag,
+                'lastModified': entry.lastModified,
+                'hash': entry.hash,
+            }
+
+        xbmc.log('Retrieving favicon: ' + thumbUrl, xbmc.LOGINFO)
+        if imagePool is None:
+            # The Pillow module needs to be isolated to its own subprocess
+            # because many distributions are prone to deadlock. One worker
+            # serves every favicon of the session.
+            if self.imageWorker is None:
+                self.imageWorker = imageworker.ImageWorker(
+                    os.path.join(self.addonFolder, 'retrieve.py'))
+            imagePool = self.imageWorker
+        result = imagePool.retrieve(thumbUrl, self.thumbsFolder, validators)
+
+        if result.get('unchanged'):
+            xbmc.log('Favicon is unchanged: ' + thumbUrl, xbmc.LOGDEBUG)
+            # Only a full response carries new validators.
+            if 'hash' not in result:
+                return entry.thumb
+            entry = entry._replace(
+                etag=result['etag'],
+                lastModified=result['lastModified'],
+                hash=result['hash'])
+        else:
+            entry = httpcache.IconEntry(
+                result['etag'], result['lastModified'], result['hash'],
+                result['thumb'])
+        with self.openHttpCache() as cache:
+            cache.putIcon(thumbUrl, entry)
+        return entry.thumb
 
     def scrapeWebpage(
-            self, url, thumbId, isAborting, isTitleReady, fetchedTitleSlot):
-        webpage = None
+            self, url, isAborting, isTitleReady, fetchedTitleSlot,
+            imagePool=None):
+        """Scrapes the title and thumbnail of a webpage
+
+        Returns the ID of the thumbnail, or None if there is no thumbnail.
+        """
+        def onTitle(title):
+            # The user can start editing the title while the rest of the head
+            # is still downloading.
+            xbmc.log('Scraped title: ' + title, xbmc.LOGDEBUG)
+            fetchedTitleSlot.append(title)
+            isTitleReady.set()
+
+        base = url
+        link = None
         try:
             try:
                 if isAborting.is_set():
                     xbmc.log('Aborting fetch of webpage', xbmc.LOGINFO)
-                    return
-                xbmc.log('Fetching webpage: ' + url, xbmc.LOGINFO)
-                webpage = urllib.request.urlopen(url)
-
-                if isAborting.is_set():
-                    xbmc.log('Aborting parse of webpage', xbmc.LOGINFO)
-                    return
-                xbmc.log('Parsing webpage: ' + url, xbmc.LOGDEBUG)
-                soup = bs4.BeautifulSoup(webpage, 'html.parser')
-
-                if isAborting.is_set():
-                    xbmc.log('Aborting scrape of webpage title', xbmc.LOGINFO)
-                    return
-                # Search for the title.
-                titleElement = soup.find('title')
-                if titleElement is not None:
-                    fetchedTitleSlot.append(titleElement.text)
+                    return None
+                (base, link) = self.fetchHead(url, onTitle, isAborting)
             finally:
                 isTitleReady.set()
-
-            if isAborting.is_set():
-                xbmc.log('Aborting scrape of webpage links', xbmc.LOGINFO)
-                return
-            # Search for a rel="icon" attribute.
-            linkElements = soup.findAll('link', rel='icon', href=True)
-            # Prefer the icon with the best quality.
-            linkElement = next(
-                iter(sorted(
-                    linkElements,
-                    key=lambda element: (
-                        # Prefer large images.
-                        functools.reduce(
-                            lambda prev, cur: prev * int(cur, 10),
-                            re.findall(r'\d+', element['sizes']),
-                            1)
-                        if 'sizes' in element.attrs else 0,
-                        # Prefer PNG format.
-                        'type' in element.attrs and
-                        element['type'] == 'image/png',
-                        # Prefer "icon" to "shortcut icon".
-                        element['rel'] == ['icon']),
-                    reverse=True)),
-                None)
         except (ValueError, IOError) as e:
             xbmc.log('Failed to scrape bookmarked page: ' + str(e))
-            linkElement = None
 
         # Try to download the icon.
         try:
-            if webpage is not None:
-                base = webpage.url
-            else:
-                base = url
-            if linkElement is None:
+            if isAborting.is_set():
+                xbmc.log('Aborting scrape of webpage links', xbmc.LOGINFO)
+                return None
+            if link is None:
                 xbmc.log('Falling back to default favicon path', xbmc.LOGDEBUG)
                 link = '/favicon.ico'
-            else:
-                link = linkElement['href']
             thumbUrl = urllib.parse.urljoin(base, link)
 
             if isAborting.is_set():
                 xbmc.log('Aborting creation of thumbs folder', xbmc.LOGINFO)
-                return
+                return None
             makedirs(self.thumbsFolder)
 
-            # The Pillow module needs to be isolated to its own subprocess
-            # because many distributions are prone to deadlock.
-            retrievePath = os.path.join(self.addonFolder, 'retrieve.py')
-            thumbPath = self.getThumbPath(thumbId)
             if isAborting.is_set():
                 xbmc.log('Aborting retrieval of favicon', xbmc.LOGINFO)
-                return
-            xbmc.log('Retrieving favicon: ' + thumbUrl, xbmc.LOGINFO)
-            subprocess.check_call(
-                [sys.executable, retrievePath, thumbUrl, thumbPath])
-        except (ValueError, IOError, subprocess.CalledProcessError) as e:
+                return None
+            return self.retrieveThumb(thumbUrl, imagePool)
+        except (ValueError, IOError) as e:
             xbmc.log('Failed to retrieve favicon: ' + str(e))
+            return None
+
+    def refreshThumb(self, bookmark, isAborting, imagePool):
+        """Scrapes a bookmark's thumbnail and returns its ID, if there is one"""
+        return self.scrapeWebpage(
+            bookmark.url, isAborting, threading.Event(), [], imagePool)
+
+    def refreshThumbs(self):
+        import concurrent.futures
+
+        import imageworker
+
+        with self.openBookmarks() as store:
+            bookmarkList = store.list()
+            if not bookmarkList:
+                return
+
+            retrievePath = os.path.join(self.addonFolder, 'retrieve.py')
+            isAborting = threading.Event()
+            imagePool = imageworker.ImageWorkerPool(
+                retrievePath, REFRESH_IMAGE_WORKERS)
+            progress = xbmcgui.DialogProgress()
+            progress.create(self.getLocalizedString(30051))
+            # Thumbnails are only removed at the end, since a scrape that is
+            # still running may yet produce one of them.
+            staleThumbIds = set()
+
+            def saveThumb(future):
+                bookmark = futures[future]
+                if future.cancelled():
+                    return
+                # One failed bookmark must not stop the others from being
+                # saved, or the stale thumbnails from being removed.
+                try:
+                    thumbId = future.result()
+                except Exception as e:
+                    xbmc.log(
+                        'Failed to refresh bookmark {}: {}'.format(
+                            bookmark.id, e),
+                        xbmc.LOGWARNING)
+                    return
+                if thumbId is None:
+                    xbmc.log(
+                        'No thumbnail for bookmark: ' + bookmark.id,
+                        xbmc.LOGDEBUG)
+                    return
+                if thumbId == bookmark.thumb:
+                    return
+                try:
+                    previous = store.update(bookmark.id, thumb=thumbId)
+                except ValueError as e:
+                    # The bookmark was removed during the refresh.
+                    xbmc.log(str(e), xbmc.LOGINFO)
+                    previous = bookmark._replace(thumb=thumbId)
+                except Exception as e:
+                    xbmc.log(
+                        'Failed to save thumbnail for bookmark {}: {}'.format(
+                            bookmark.id, e),
+                        xbmc.LOGWARNING)
+                    # The new thumbnail is unused, unless another bookmark
+                    # shares it.
+                    previous = bookmark._replace(thumb=thumbId)
+                staleThumbIds.add(previous.thumb)
+
+            try:
+                with contextlib.closing(imagePool), (
+                        concurrent.futures.ThreadPoolExecutor(
+                            REFRESH_FETCH_THREADS)) as executor:
+                    futures = dict(
+                        (executor.submit(
+                            self.refreshThumb, bookmark, isAborting,
+                            imagePool),
+                         bookmark)
+                        for bookmark in bookmarkList)
+                    pending = set(futures)
+                    while pending:
+                        if progress.iscanceled():
+                            xbmc.log(
+                                'User aborted thumbnail refresh',
+                                xbmc.LOGDEBUG)
+                            isAborting.set()
+                            for future in pending:
+                                future.cancel()
+                            break
+                        (done, pending) = concurrent.futures.wait(
+                            pending,
+                            timeout=InterminableProgressBar
+                            .DEFAULT_TICK_INTERVAL.total_seconds(),
+                            return_when=concurrent.futures.FIRST_COMPLETED)
+                        for future in done:
+                            saveThumb(future)
+                            progress.update(
+                                100 * (len(futures) - len(pending)) //
+                                len(futures),
+                                self.escapeLabel(futures[future].title))
+                # Any scrapes that were already running have finished now.
+                for future in pending:
+                    saveThumb(future)
+            finally:
+                progress.close()
+
+        for thumbId in staleThumbIds:
+            try:
+                self.removeThumb(thumbId)
+            except Exception as e:
+                xbmc.log(
+                    'Failed to remove thumbnail {}: {}'.format(thumbId, e),
+                    xbmc.LOGWARNING)
+        xbmc.executebuiltin('Container.Refresh')
+        if not isAborting.is_set():
+            xbmc.executebuiltin('XBMC.Notification(Info:,"{}",5000)'.format(
+                self.escapeNotification(self.getLocalizedString(30052))))
 
     def inputBookmark(
             self, bookmarkId=None, defaultUrl='https://', defaultTitle=None):
@@ -535,18 +883,15 @@ class RemoteControlBrowserPlugin(xbmcaddon.Addon):
             return
         url = keyboard.getText()
 
-        # The old thumb ID can't be reused, because then the cached copy of the
-        # old image would never be replaced.
-        thumbId = str(uuid.uuid1())
-
         # Asynchronously scrape information from the webpage while the user
         # types.
         isAborting = threading.Event()
         isTitleReady = threading.Event()
         fetchedTitleSlot = []
+        scrapedThumbSlot = []
         scraper = threading.Thread(
-            target=self.scrapeWebpage,
-            args=(url, thumbId, isAborting, isTitleReady, fetchedTitleSlot))
+            target=lambda: scrapedThumbSlot.append(self.scrapeWebpage(
+                url, isAborting, isTitleReady, fetchedTitleSlot)))
         scraper.start()
         try:
             if defaultTitle is None:
@@ -602,29 +947,23 @@ class RemoteControlBrowserPlugin(xbmcaddon.Addon):
                 xbmc.log('Joined with aborted scraper thread', xbmc.LOGDEBUG)
 
         # Save the bookmark metadata.
-        tree = self.readBookmarks()
-        if bookmarkId is None:
-            bookmarkId = str(uuid.uuid1())
-            bookmark = xml.etree.ElementTree.SubElement(
-                tree.getroot(),
-                'bookmark',
-                {
-                    'id': bookmarkId,
-                    'title': title,
-                    'url': url,
-                    'lircrc': DEFAULT_LIRC_CONFIG,
-                })
-        else:
-            bookmark = self.getBookmarkElement(tree, bookmarkId)
-            bookmark.set('title', title)
-            bookmark.set('url', url)
-        if os.path.isfile(self.getThumbPath(thumbId)):
-            removeThumbId = bookmark.get('thumb')
-            bookmark.set('thumb', thumbId)
-        else:
-            removeThumbId = None
-        makedirs(self.profileFolder)
-        tree.write(self.bookmarksPath)
+        newThumbId = next(iter(scrapedThumbSlot), None)
+        removeThumbId = None
+        with self.openBookmarks() as store:
+            if bookmarkId is None:
+                store.add(bookmarks.Bookmark(
+                    id=str(uuid.uuid1()),
+                    title=title,
+                    url=url,
+                    lircrc=DEFAULT_LIRC_CONFIG,
+                    thumb=newThumbId))
+            elif newThumbId is None:
+                store.update(bookmarkId, title=title, url=url)
+            else:
+                previous = store.update(
+                    bookmarkId, title=title, url=url, thumb=newThumbId)
+                if previous.thumb != newThumbId:
+                    removeThumbId = previous.thumb
         xbmc.executebuiltin('Container.Refresh')
         if removeThumbId is not None:
             self.removeThumb(removeThumbId)
@@ -633,15 +972,11 @@ class RemoteControlBrowserPlugin(xbmcaddon.Addon):
         self.inputBookmark()
 
     def editBookmark(self, bookmarkId):
-        tree = self.readBookmarks()
-        bookmark = self.getBookmarkElement(tree, bookmarkId)
-        self.inputBookmark(
-            bookmarkId, bookmark.get('url'), bookmark.get('title'))
+        bookmark = self.getBookmark(bookmarkId)
+        self.inputBookmark(bookmarkId, bookmark.url, bookmark.title)
 
     def editKeymap(self, bookmarkId):
-        tree = self.readBookmarks()
-        bookmark = self.getBookmarkElement(tree, bookmarkId)
-        defaultLircrc = bookmark.get('lircrc')
+        defaultLircrc = self.getBookmark(bookmarkId).lircrc
 
         ShowAndGetFile = 1
         lircrc = xbmcgui.Dialog().browseSingle(
@@ -651,29 +986,49 @@ class RemoteControlBrowserPlugin(xbmcaddon.Addon):
             mask='.lirc',
             defaultt=defaultLircrc)
 
-        tree = self.readBookmarks()
-        bookmark = self.getBookmarkElement(tree, bookmarkId)
-        bookmark.set('lircrc', lircrc)
-        makedirs(self.profileFolder)
-        tree.write(self.bookmarksPath)
+        import keymap
+
+        # Report a broken keymap now, rather than after the browser launches.
+        try:
+            keymap.loadKeymap(
+                xbmcvfs.translatePath(lircrc), self.keymapCacheFolder)
+        except (keymap.KeymapError, IOError) as e:
+            xbmc.log('Rejected keymap: ' + str(e), xbmc.LOGWARNING)
+            xbmcgui.Dialog().ok(
+                self.getLocalizedString(30047), str(e))
+            return
+
+        with self.openBookmarks() as store:
+            store.update(bookmarkId, lircrc=lircrc)
 
     def removeBookmark(self, bookmarkId):
-        tree = self.readBookmarks()
-        bookmark = self.getBookmarkElement(tree, bookmarkId)
-        thumbId = bookmark.get('thumb')
-        tree.getroot().remove(bookmark)
-        makedirs(self.profileFolder)
-        tree.write(self.bookmarksPath)
-        self.removeThumb(thumbId)
+        with self.openBookmarks() as store:
+            bookmark = store.remove(bookmarkId)
+        self.removeThumb(bookmark.thumb)
 
         xbmc.executebuiltin('Container.Refresh')
 
+    def exportBookmarks(self):
+        ShowAndGetWriteableDirectory = 3
+        folder = xbmcgui.Dialog().browseSingle(
+            type=ShowAndGetWriteableDirectory,
+            heading=self.getLocalizedString(30049),
+            shares='files')
+        if not folder:
+            xbmc.log('User aborted bookmark export', xbmc.LOGDEBUG)
+            return
+        exportPath = os.path.join(
+            xbmcvfs.translatePath(folder), 'bookmarks.xml')
+        xbmc.log('Exporting bookmarks: ' + exportPath, xbmc.LOGINFO)
+        with self.openBookmarks() as store:
+            store.exportXml(exportPath)
+        xbmc.executebuiltin('XBMC.Notification(Info:,"{}",5000)'.format(
+            self.escapeNotification(self.getLocalizedString(30050))))
+
     def launchBookmark(self, bookmarkId):
-        tree = self.readBookmarks()
-        bookmark = self.getBookmarkElement(tree, bookmarkId)
-        url = bookmark.get('url')
-        lircConfig = xbmcvfs.translatePath(bookmark.get('lircrc'))
-        self.launchUrl(url, lircConfig)
+        bookmark = self.getBookmark(bookmarkId)
+        lircConfig = xbmcvfs.translatePath(bookmark.lircrc)
+        self.launchUrl(bookmark.url, lircConfig)
 
     def linkcast(self, url):
         lircConfig = xbmcvfs.translatePath(DEFAULT_LIRC_CONFIG)
@@ -706,6 +1061,7 @@ class RemoteControlBrowserPlugin(xbmcaddon.Addon):
             fragment=None).geturl()
 
         browserCmd = [browserPath] + shlex.split(browserArgs) + [blackUrl]
+        warmPid = self.claimWarmBrowser(browserPath, browserArgs)
 
         player = xbmc.Player()
         if player.isPlaying() and not xbmc.getCondVisibility('Player.Paused'):
@@ -720,12 +1076,48 @@ class RemoteControlBrowserPlugin(xbmcaddon.Addon):
                     browserLockPath,
                     lircConfig,
                     xdotoolPath,
-                    alsaControl)
+                    alsaControl,
+                    warmPid)
         except CompetingLaunchError:
             xbmc.log('A competing browser instance is already running')
             xbmc.executebuiltin('XBMC.Notification(Info:,"{}",5000)'.format(
                 self.escapeNotification(self.getLocalizedString(30038))))
 
+    def claimWarmBrowser(self, browserPath, browserArgs):
+        """Takes the spare browser that the service keeps ready, if any"""
+        sparePath = os.path.join(self.profileFolder, 'spare.json')
+        claimedPath = '{}.{}'.format(sparePath, os.getpid())
+        try:
+            # Renaming the pidfile ensures that only one launch gets the spare.
+            os.rename(sparePath, claimedPath)
+        except OSError:
+            return None
+        try:
+            with open(claimedPath) as spareFile:
+                spare = json.load(spareFile)
+        except (IOError, ValueError) as e:
+            xbmc.log('Failed to read warm browser: ' + str(e), xbmc.LOGDEBUG)
+            os.remove(claimedPath)
+            return None
+        if (spare.get('browserPath') != browserPath or
+                spare.get('browserArgs') != browserArgs):
+            # The service has not caught up with the settings yet, so it
+            # still owns the spare.
+            os.rename(claimedPath, sparePath)
+            return None
+        os.remove(claimedPath)
+        xbmc.log('Claimed warm browser: ' + str(spare['pid']), xbmc.LOGDEBUG)
+        return spare['pid']
+
+    def launchWrapper(self, wrapperArgs):
+        """Asks the service's launcher to fork a wrapper, if it is running"""
+        if not hasattr(socket, 'send_fds'):
+            return None
+        try:
+            return LaunchedProcess.launch(self.launcherPath, wrapperArgs)
+        except (OSError, EOFError, ValueError, KeyError) as e:
+            xbmc.log('Falling back from the launcher: ' + str(e), xbmc.LOGDEBUG)
+            return None
 
     def spawnBrowser(
             self,
@@ -734,7 +1126,10 @@ class RemoteControlBrowserPlugin(xbmcaddon.Addon):
             browserLockPath,
             lircConfig,
             xdotoolPath,
-            alsaControl):
+            alsaControl,
+            warmPid=None):
+        import subprocess
+
         # The browser runs in its own subprocess so that it can continue after
         # Kodi stops.
         suspendKodiFlags = ['--suspend-kodi'] if suspendKodi else []
@@ -745,6 +1140,12 @@ class RemoteControlBrowserPlugin(xbmcaddon.Addon):
         xdotoolCmd = [] if not xdotoolPath else [
                 '--xdotool-path', xdotoolPath,
             ]
+        keymapCmd = [
+                '--keymap-cache', self.keymapCacheFolder,
+            ]
+        warmCmd = [] if warmPid is None else [
+                '--warm-pid', str(warmPid),
+            ]
         if xbmc.getCondVisibility('System.Platform.Windows'):
             # On Windows, the Popen will block unless close_fds is True and
             # creationflags is DETACHED_PROCESS.
@@ -756,26 +1157,31 @@ class RemoteControlBrowserPlugin(xbmcaddon.Addon):
             'Launching wrapper for browser: ' +
             ' '.join(shlex.quote(arg) for arg in browserCmd),
             xbmc.LOGINFO)
-        commandArgs = (
-            [
-                sys.executable,
-                browsePath,
-            ] +
+        wrapperArgs = (
             suspendKodiFlags +
             alsaCmd +
             xdotoolCmd +
+            keymapCmd +
+            warmCmd +
             [
+                '--kodi-pid', str(os.getpid()),
                 '--lirc-config', lircConfig,
                 '--',
             ] +
             browserCmd)
-        proc = subprocess.Popen(
-            commandArgs,
-            creationflags=creationflags,
-            # Closing stdin will inform the child of its parent's death.
-            stdin=subprocess.PIPE,
-            # The child will publish log lines via stderr.
-            stderr=subprocess.PIPE)
+        commandArgs = [sys.executable, browsePath] + wrapperArgs
+        startTime = time.monotonic()
+        proc = self.launchWrapper(wrapperArgs)
+        if proc is None:
+            proc = subprocess.Popen(
+                commandArgs,
+                creationflags=creationflags,
+                # Closing stdin will inform the child of its parent's death.
+                stdin=subprocess.PIPE,
+                # The child will publish log lines via stderr.
+                stderr=subprocess.PIPE)
+        xbmc.log('Started wrapper in {:.0f} ms'.format(
+            (time.monotonic() - startTime) * 1000), xbmc.LOGDEBUG)
         slurpLogGuard = threading.Lock()
         try:
             slurper = threading.Thread(target=slurpLog, args=(proc.stderr, slurpLogGuard))
@@ -857,11 +1263,14 @@ def main():
         'editKeymap': lambda args: plugin.editKeymap(getBookmarkId(args)),
         'removeBookmark': lambda args: plugin.removeBookmark(
             getBookmarkId(args)),
+        'exportBookmarks': lambda args: plugin.exportBookmarks(),
+        'refreshThumbs': lambda args: plugin.refreshThumbs(),
     }
     handler = HANDLERS.get(mode)
     if handler is None:
         raise ValueError('Unrecognized mode: ' + mode)
-    handler(args)
+    with contextlib.closing(plugin):
+        handler(args)
 
 
 if __name__ == "__main__":
@@ -1,36 +1,82 @@
 #!/usr/bin/env python
 
 import argparse
+import contextlib
+import hashlib
 import io
+import json
 import os
-import shutil
+import sys
 import tempfile
+import urllib.error
 import urllib.request
 
 import PIL.Image
 import PIL.PngImagePlugin
 
+import httpcache
+
+
+DOWNLOAD_TIMEOUT = 10  # seconds
+# Kodi shows bookmark thumbnails small, so any larger image would only be
+# decoded at full size for nothing.
+THUMB_SIZE = 256  # pixels
 
-def main():
-    parser = argparse.ArgumentParser()
-    parser.add_argument('url')
-    parser.add_argument('filename')
-    args = parser.parse_args()
 
-    download = urllib.request.urlopen(args.url)
-    buffered = io.BytesIO(download.read())
+def retrieve(url, folder, etag=None, lastModified=None, contentHash=None):
+    """Downloads an image and saves it as a PNG thumbnail in a folder
+
+    The thumbnail is named after the hash of its content, so that identical
+    images are only stored once. Returns its ID along with the validators and
+    hash of the download. Given those of an earlier download, nothing is saved
+    if the image is unchanged, and the result is marked as such.
+    """
+    headers = httpcache.getValidatorHeaders(etag, lastModified)
+    request = urllib.request.Request(url, headers=headers)
+    try:
+        download = urllib.request.urlopen(request, timeout=DOWNLOAD_TIMEOUT)
+    except urllib.error.HTTPError as e:
+        if e.code == 304 and headers:
+            e.close()
+            return {'unchanged': True}
+        raise
+    with contextlib.closing(download):
+        data = download.read()
+        result = {
+            'etag': download.headers.get('ETag'),
+            'lastModified': download.headers.get('Last-Modified'),
+            'hash': hashlib.sha256(data).hexdigest(),
+        }
+    if result['hash'] == contentHash:
+        result['unchanged'] = True
+        return result
+
+    buffered = io.BytesIO(data)
     PIL.Image.open(buffered).verify()
     # The image must be re-opened after verification.
     buffered.seek(0)
     image = PIL.Image.open(buffered)
+    # This only ever shrinks the image, keeping its aspect ratio.
+    image.thumbnail((THUMB_SIZE, THUMB_SIZE))
+    encoded = io.BytesIO()
+    image.save(encoded, PIL.PngImagePlugin.PngImageFile.format)
+    encoded = encoded.getvalue()
+
+    thumbId = hashlib.sha256(encoded).hexdigest()
+    result['thumb'] = thumbId
+    filename = os.path.join(folder, thumbId + '.png')
+    if os.path.isfile(filename):
+        return result
     saved = None
     try:
-        with tempfile.NamedTemporaryFile(delete=False) as saved:
-            image.save(saved, PIL.PngImagePlugin.PngImageFile.format)
+        # The temporary file is created next to the destination, so that the
+        # move is atomic.
+        with tempfile.NamedTemporaryFile(
+                dir=os.path.dirname(filename), suffix='.tmp',
+                delete=False) as saved:
+            saved.write(encoded)
 
-        # Atomically move to the desired location. (This is only atomic if the
-        # temp directory is on the same filesystem).
-        shutil.move(saved.name, args.filename)
+        os.replace(saved.name, filename)
         saved = None
     finally:
         if saved is not None:
@@ -38,6 +84,45 @@ def main():
                 os.remove(saved.name)
             except OSError:
                 pass
+    return result
+
+
+def serve():
+    """Handles one JSON request per line until stdin is closed
+
+    Each request holds a url and a folder, and optionally the etag,
+    lastModified and hash of an earlier download. Each response holds either
+    an error message or the result, and it is written only after the image has
+    been saved.
+    """
+    for line in sys.stdin:
+        try:
+            request = json.loads(line)
+            response = retrieve(
+                request['url'],
+                request['folder'],
+                request.get('etag'),
+                request.get('lastModified'),
+                request.get('hash'))
+        except Exception as e:
+            response = {'error': '{}: {}'.format(type(e).__name__, e)}
+        sys.stdout.write(json.dumps(response) + '\n')
+        sys.stdout.flush()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--serve', action='store_true')
+    parser.add_argument('url', nargs='?')
+    parser.add_argument('folder', nargs='?')
+    args = parser.parse_args()
+
+    if args.serve:
+        serve()
+    elif args.url is None or args.folder is None:
+        parser.error('the url and folder are required')
+    else:
+        print(retrieve(args.url, args.folder)['thumb'])
 
 
 if __name__ == "__main__":
@@ -1,18 +1,32 @@
 import http.server
 import collections
 import email.message
+import functools
+import gzip
+import hashlib
 import html
 import json
 import os
+import queue
 import re
+import select
+import shlex
+import signal
+import socket
+import subprocess
+import sys
 import threading
+import time
 import urllib.parse
 import xml.etree.ElementTree
+import zlib
 
 import xbmc
 import xbmcaddon
 import xbmcvfs
 
+import atomicfile
+
 
 # These libraries must be installed manually instead of through a Kodi module
 # because they are platform-dependent. The user will be shown a warning if they
@@ -40,6 +54,27 @@ except ImportError:
 
 
 MINIMUM_RAM_REQUIREMENT = 1.5 * 2**30  # 1.5 GB
+WARM_POOL_INTERVAL = 1  # seconds
+WARM_BROWSER_SETTLE_DELAY = 5  # seconds
+WARM_BROWSER_EXIT_DELAY = 3  # seconds
+WARM_BROWSER_FLAGS = ['--no-startup-window']
+LAUNCHER_EXIT_DELAY = 3  # seconds
+LINKCAST_SERVER_THREADS = 8
+LINKCAST_QUEUE_SIZE = 32
+# How long a client may take to send a request once it has started.
+LINKCAST_TIMEOUT = 5  # seconds
+# An idle keep-alive connection holds on to one of the threads until then,
+# unless another connection is waiting for a thread.
+LINKCAST_KEEPALIVE_TIMEOUT = 2  # seconds
+LINKCAST_IDLE_POLL_INTERVAL = 0.05  # seconds
+TEMPLATE_VARIABLE_PATTERN = re.compile('{{([^{}]+)}}')
+PAGE_CACHE_SIZE = 32
+# In order of preference. The gzip header's timestamp is zeroed, so that the
+# same page always compresses to the same bytes under its ETag.
+CONTENT_CODINGS = (
+    ('gzip', functools.partial(gzip.compress, mtime=0)),
+    ('deflate', zlib.compress),
+)
 
 
 DetectedDefaults = collections.namedtuple(
@@ -53,19 +88,454 @@ class LinkcastMonitor(xbmc.Monitor):
         self.addon = addon
 
     def onSettingsChanged(self):
+        self.addon.templateCache.clear()
         self.addon.reloadLinkcastServer()
+        self.addon.warmPool.reload()
+
+
+def isChromium(browserPath):
+    name = os.path.basename(browserPath).lower()
+    return 'chrome' in name or 'chromium' in name
+
+
+class WarmBrowserPool(object):
+    """Keeps one spare browser started in the background
+
+    Only Chromium can start without opening a window and later open the URL
+    from a second invocation. The spare is stopped once it settles, and its
+    pidfile is published for the plugin to claim. The wrapper then owns the
+    spare, and a replacement is started after the browsing session ends.
+    """
+
+    def __init__(self, addon):
+        self.addon = addon
+        self.lock = threading.Lock()
+        self.sparePath = os.path.join(addon.profileFolder, 'spare.json')
+        self.browserLockPath = os.path.join(addon.profileFolder, 'browser.pid')
+        self.settings = None
+        self.spare = None
+        self.spareStartTime = None
+        self.isSpareReady = False
+
+    def getSettings(self):
+        if not self.addon.unmarshalBool(self.addon.getSetting('warmPoolEnabled')):
+            return None
+        browserPath = self.addon.getSetting('browserPath')
+        if not isChromium(browserPath):
+            xbmc.log('The warm browser requires Chromium', xbmc.LOGINFO)
+            return None
+        if psutil is None or not self.addon.isMemorySufficient():
+            xbmc.log(
+                'Not keeping a warm browser without enough memory',
+                xbmc.LOGWARNING)
+            return None
+        if not hasattr(os, 'pidfd_open'):
+            xbmc.log('The warm browser requires pidfd support', xbmc.LOGINFO)
+            return None
+        return (browserPath, self.addon.getSetting('browserArgs'))
+
+    def clearSparefile(self):
+        """Clears the pidfile in case the last shutdown was not clean"""
+        try:
+            os.remove(self.sparePath)
+        except OSError:
+            pass
+
+    def reload(self):
+        settings = self.getSettings()
+        xbmc.log('Warm browser settings: ' + str(settings), xbmc.LOGDEBUG)
+        with self.lock:
+            if settings != self.settings:
+                self.stopSpare()
+                self.settings = settings
+
+    def maintain(self):
+        with self.lock:
+            if self.spare is not None and self.spare.poll() is not None:
+                xbmc.log('Reaped the warm browser', xbmc.LOGDEBUG)
+                if not self.isSpareReady:
+                    # Avoid restarting a browser that cannot stay up.
+                    xbmc.log(
+                        'Warm browser exited while starting, errno=' +
+                        str(self.spare.returncode), xbmc.LOGWARNING)
+                    self.settings = None
+                self.spare = None
+                self.clearSparefile()
+            if self.spare is None:
+                # A replacement must wait until the browsing session is over.
+                if (self.settings is not None and
+                        not os.path.exists(self.browserLockPath)):
+                    self.startSpare()
+            elif not self.isSpareReady:
+                if (time.monotonic() - self.spareStartTime >=
+                        WARM_BROWSER_SETTLE_DELAY):
+                    self.publishSpare()
+
+    def startSpare(self):
+        (browserPath, browserArgs) = self.settings
+        browserCmd = (
+            [browserPath] + shlex.split(browserArgs) + WARM_BROWSER_FLAGS)
+        xbmc.log(
+            'Starting warm browser: ' +
+            ' '.join(shlex.quote(arg) for arg in browserCmd),
+            xbmc.LOGINFO)
+        try:
+            self.spare = subprocess.Popen(
+                browserCmd,
+                close_fds=True,
+                start_new_session=True,
+                stdin=subprocess.DEVNULL,
+                stdout=subprocess.DEVNULL,
+                stderr=subprocess.DEVNULL)
+        except OSError as e:
+            xbmc.log('Could not start warm browser: ' + str(e), xbmc.LOGERROR)
+            self.settings = None
+            return
+        self.spareStartTime = time.monotonic()
+        self.isSpareReady = False
+
+    def publishSpare(self):
+        # An idle spare should not take any CPU away from Kodi.
+        os.killpg(self.spare.pid, signal.SIGSTOP)
+        (browserPath, browserArgs) = self.settings
+        spare = {
+            'pid': self.spare.pid,
+            'browserPath': browserPath,
+            'browserArgs': browserArgs,
+        }
+        with atomicfile.atomicWrite(self.sparePath, 'w') as spareFile:
+            json.dump(spare, spareFile)
+        self.isSpareReady = True
+        xbmc.log('Warm browser is ready', xbmc.LOGDEBUG)
+
+    def stopSpare(self):
+        if self.spare is None:
+            return
+        if self.isSpareReady:
+            try:
+                os.remove(self.sparePath)
+            except OSError:
+                # The plugin has claimed the spare, so the wrapper owns it.
+                return
+        xbmc.log('Stopping warm browser', xbmc.LOGINFO)
+        try:
+            os.killpg(self.spare.pid, signal.SIGTERM)
+            os.killpg(self.spare.pid, signal.SIGCONT)
+        except OSError:
+            pass
+        try:
+            self.spare.wait(WARM_BROWSER_EXIT_DELAY)
+        except subprocess.TimeoutExpired:
+            xbmc.log('Forcibly killing warm browser', xbmc.LOGINFO)
+            try:
+                os.killpg(self.spare.pid, signal.SIGKILL)
+            except OSError:
+                pass
+            self.spare.wait()
+        self.spare = None
+
+    def shutdown(self):
+        with self.lock:
+            self.stopSpare()
+            self.settings = None
+
+
+def slurpLauncherLog(stream):
+    for line in iter(stream.readline, b''):
+        xbmc.log('LAUNCHER: ' + line.decode('utf_8'), xbmc.LOGDEBUG)
+    stream.close()
+
+
+def chooseContentCoding(acceptEncoding, available):
+    """Picks the content coding that the client prefers among those available"""
+    if acceptEncoding is None:
+        return 'identity'
+    qualities = {}
+    for item in acceptEncoding.split(','):
+        (coding, separator, params) = item.partition(';')
+        quality = 1.0
+        for param in params.split(';'):
+            (name, separator, value) = param.partition('=')
+            if name.strip().lower() == 'q':
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        qualities[coding.strip().lower()] = quality
+    candidates = [
+        (qualities.get(coding, qualities.get('*', 0.0)), -preference, coding)
+        for (preference, (coding, compress)) in enumerate(CONTENT_CODINGS)
+        if coding in available]
+    best = max(candidates, default=None)
+    if best is None or best[0] <= 0:
+        return 'identity'
+    return best[2]
+
+
+def matchesEtag(ifNoneMatch, etag):
+    # If-None-Match uses the weak comparison.
+    if ifNoneMatch.strip() == '*':
+        return True
+    return any(
+        tag.strip().replace('W/', '', 1) == etag
+        for tag in ifNoneMatch.split(','))
+
+
+class RenderedPage(object):
+    """A rendered page with a variant for each useful content coding
+
+    Each variant has its own strong ETag, which is derived from the body and
+    the language that it was rendered in.
+    """
+
+    def __init__(self, body, language):
+        digest = hashlib.sha256(
+            language.encode('utf_8') + b'\n' + body).hexdigest()[:32]
+        self.variants = {'identity': ('"{}"'.format(digest), body)}
+        for (coding, compress) in CONTENT_CODINGS:
+            compressed = compress(body)
+            if len(compressed) < len(body):
+                self.variants[coding] = (
+                    '"{}-{}"'.format(digest, coding), compressed)
+
+
+class Template(object):
+    """A template that is split into literal and placeholder segments
+
+    Even segments are literal UTF-8 bytes and odd segments are variable
+    names, so rendering is a single join.
+    """
+
+    def __init__(self, segments):
+        self.segments = segments
+
+    @classmethod
+    def parse(cls, text):
+        segments = TEMPLATE_VARIABLE_PATTERN.split(text)
+        segments[::2] = [literal.encode('utf_8') for literal in segments[::2]]
+        return cls(segments)
+
+    def bind(self, variables):
+        """Returns a template with some of the variables filled in"""
+        segments = [self.segments[0]]
+        for (name, literal) in zip(self.segments[1::2], self.segments[2::2]):
+            if name in variables:
+                segments[-1] += variables[name].encode('utf_8') + literal
+            else:
+                segments += [name, literal]
+        return Template(segments)
+
+    def render(self, variables):
+        parts = list(self.segments)
+        parts[1::2] = [
+            variables[name].encode('utf_8') for name in self.segments[1::2]]
+        return b''.join(parts)
+
+
+class TemplateCache(object):
+    """Keeps the linkcast templates parsed and localized in memory
+
+    Everything but the per-request variables is filled in once. A template is
+    reloaded when its file or Kodi's language changes, and the cache is
+    cleared when the settings change. The most recently rendered pages are
+    kept as well, so that they are only hashed and compressed once.
+    """
+
+    def __init__(self, addon):
+        self.addon = addon
+        self.lock = threading.Lock()
+        self.templates = {}
+        self.pages = collections.OrderedDict()
+
+    def clear(self):
+        with self.lock:
+            self.templates.clear()
+            self.pages.clear()
+
+    def getStaticVariables(self):
+        return {
+            'LEFT_CURLY_BRACKET': '{{',
+            'RIGHT_CURLY_BRACKET': '}}',
+            'TITLE_HTML': html.escape(self.addon.getLocalizedString(30032)),
+            'SUBTITLE_HTML': html.escape(
+                self.addon.getLocalizedString(30033)),
+            'SUBMIT_ATTR': html.escape(
+                self.addon.getLocalizedString(30035), quote=True),
+            'INSTRUCTIONS_HTML': html.escape(
+                self.addon.getLocalizedString(30036)),
+            'UNSUPPORTED_SCHEME_CSTR': json.dumps(
+                self.addon.getLocalizedString(30037)),
+        }
+
+    def getTemplate(self, name):
+        """Returns a compiled template along with what it depends on"""
+        path = os.path.join(self.addon.addonFolder, 'resources/data', name)
+        key = (os.stat(path).st_mtime_ns, xbmc.getLanguage())
+        with self.lock:
+            cached = self.templates.get(name)
+            if cached is not None and cached[0] == key:
+                return cached
+            xbmc.log('Compiling template: ' + name, xbmc.LOGDEBUG)
+            with open(path) as template_file:
+                template = Template.parse(template_file.read()).bind(
+                    self.getStaticVariables())
+            self.templates[name] = (key, template)
+            return (key, template)
+
+    def getPage(self, name, variables):
+        (key, template) = self.getTemplate(name)
+        (mtime, language) = key
+        pageKey = (name, key, tuple(sorted(variables.items())))
+        with self.lock:
+            page = self.pages.get(pageKey)
+            if page is not None:
+                self.pages.move_to_end(pageKey)
+                return page
+        page = RenderedPage(template.render(variables), language)
+        with self.lock:
+            self.pages[pageKey] = page
+            while len(self.pages) > PAGE_CACHE_SIZE:
+                self.pages.popitem(last=False)
+        return page
 
 
 class LinkcastServer(http.server.HTTPServer):
+    """Serves each connection on one of a fixed pool of threads
+
+    Accepted connections wait in a bounded queue for a free thread. When the
+    queue is full, new connections are closed straight away, so that a flood
+    of clients can't pile up in the service. The threads are daemons, and
+    closing the server only waits so long for them, so that a stuck client
+    can't hold up Kodi's shutdown.
+    """
+
+    # Clients that were handed back reconnect right away, and the default
+    # listen backlog would drop their SYNs.
+    request_queue_size = LINKCAST_QUEUE_SIZE
 
     def __init__(self, addon, server_address):
         http.server.HTTPServer.__init__(
             self, server_address, LinkcastRequestHandler)
         self.addon = addon
+        self.connectionQueue = queue.Queue(LINKCAST_QUEUE_SIZE)
+        self.isClosing = threading.Event()
+        self.workers = []
+        for _ in range(LINKCAST_SERVER_THREADS):
+            worker = threading.Thread(
+                target=self.serveConnections, daemon=True)
+            worker.start()
+            self.workers.append(worker)
+
+    def isConnectionWaiting(self):
+        return self.isClosing.is_set() or not self.connectionQueue.empty()
+
+    def serveConnections(self):
+        while True:
+            connection = self.connectionQueue.get()
+            if connection is None:
+                return
+            (request, client_address) = connection
+            try:
+                self.finish_request(request, client_address)
+            except Exception:
+                self.handle_error(request, client_address)
+            finally:
+                self.shutdown_request(request)
+
+    def process_request(self, request, client_address):
+        try:
+            self.connectionQueue.put_nowait((request, client_address))
+        except queue.Full:
+            xbmc.log(
+                'Dropping linkcast connection because the server is busy',
+                xbmc.LOGINFO)
+            self.shutdown_request(request)
+
+    def server_close(self):
+        http.server.HTTPServer.server_close(self)
+        self.isClosing.set()
+        # Connections that are still queued are dropped.
+        while True:
+            try:
+                connection = self.connectionQueue.get_nowait()
+            except queue.Empty:
+                break
+            if connection is not None:
+                self.shutdown_request(connection[0])
+        for _ in self.workers:
+            self.connectionQueue.put(None)
+        # A request in progress may take until its timeout to finish.
+        deadline = time.monotonic() + LINKCAST_TIMEOUT
+        for worker in self.workers:
+            worker.join(max(0, deadline - time.monotonic()))
+            if worker.is_alive():
+                xbmc.log(
+                    'Abandoning a busy linkcast server thread',
+                    xbmc.LOGWARNING)
+        self.workers = []
 
 
 class LinkcastRequestHandler(http.server.BaseHTTPRequestHandler):
 
+    # Phones tend to make several requests in a row, so connections are kept
+    # alive. Every response must then carry a Content-Length.
+    protocol_version = 'HTTP/1.1'
+    timeout = LINKCAST_TIMEOUT
+    # The headers and body are written separately, so Nagle's algorithm
+    # would hold back the body until the client acknowledges the headers.
+    disable_nagle_algorithm = True
+
+    def handle(self):
+        self.close_connection = True
+        self.handle_one_request()
+        while not self.close_connection and self.waitForRequest():
+            self.handle_one_request()
+
+    def end_headers(self):
+        # A busy keep-alive client never leaves its thread idle, so the
+        # connection is handed back after each response while another one is
+        # waiting for a thread. The client learns that it must reconnect.
+        if not self.close_connection and self.server.isConnectionWaiting():
+            self.send_header('Connection', 'close')
+        http.server.BaseHTTPRequestHandler.end_headers(self)
+
+    def hasBufferedRequest(self):
+        """Tells whether a pipelined request was already read into rfile"""
+        # A non-blocking peek only returns what is buffered or already
+        # arrived, or an empty string if the client hung up.
+        self.connection.settimeout(0)
+        try:
+            return bool(self.rfile.peek(1))
+        except OSError:
+            return False
+        finally:
+            self.connection.settimeout(self.timeout)
+
+    def waitForRequest(self):
+        """Waits for the next request on a keep-alive connection
+
+        An idle connection gives up its thread once another connection is
+        waiting for one, and otherwise after a short keep-alive timeout. It is
+        always given one poll interval first, since a busy client sends its
+        next request right away.
+        """
+        if self.hasBufferedRequest():
+            return True
+        deadline = time.monotonic() + LINKCAST_KEEPALIVE_TIMEOUT
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            (readable, _, _) = select.select(
+                [self.connection], [], [],
+                min(remaining, LINKCAST_IDLE_POLL_INTERVAL))
+            if readable:
+                return True
+            if self.server.isConnectionWaiting():
+                break
+        xbmc.log('Closing idle linkcast connection', xbmc.LOGDEBUG)
+        return False
+
     def do_GET(self):
         xbmc.log('Received GET request: ' + self.path, xbmc.LOGINFO)
         components = urllib.parse.urlparse(self.path)
@@ -97,9 +567,10 @@ class LinkcastRequestHandler(http.server.BaseHTTPRequestHandler):
         if ctype != 'application/x-www-form-urlencoded':
             self.send_error(400, 'Unsupported content type: {}'.format(ctype))
             return
-        length = int(self.headers.get('Content-Length'))
+        length = int(self.headers.get('Content-Length', 0))
         payload = self.rfile.read(length)
-        params = urllib.parse.parse_qs(payload, keep_blank_values=True)
+        params = urllib.parse.parse_qs(
+            payload.decode('utf_8'), keep_blank_values=True)
 
         handler(self, params)
 
@@ -111,10 +582,6 @@ class LinkcastRequestHandler(http.server.BaseHTTPRequestHandler):
         """Serves a human-friendly webpage"""
         url = next(iter(params.get('url', [])), None)
 
-        self.send_response(200)
-        self.send_header('Content-Type', 'text/html; charset=utf-8')
-        self.end_headers()
-
         if url is None:
             url = ''
             status = ''
@@ -122,22 +589,13 @@ class LinkcastRequestHandler(http.server.BaseHTTPRequestHandler):
             status = '<div id="status">{}</div>\n'.format(
                 html.escape(self.server.addon.getLocalizedString(30034)))
 
-        indexPath = os.path.join(
-            self.server.addon.addonFolder, 'resources/data/index.html')
-        self.serveTemplate(indexPath, {
-            'TITLE_HTML': html.escape(
-                self.server.addon.getLocalizedString(30032)),
-            'SUBTITLE_HTML': html.escape(
-                self.server.addon.getLocalizedString(30033)),
+        page = self.server.addon.templateCache.getPage('index.html', {
             'STATUS': status,
             'URL_ATTR': html.escape(url, quote=True),
-            'SUBMIT_ATTR': html.escape(
-                self.server.addon.getLocalizedString(30035), quote=True),
-            'INSTRUCTIONS_HTML': html.escape(
-                self.server.addon.getLocalizedString(30036)),
-            'UNSUPPORTED_SCHEME_CSTR': json.dumps(
-                self.server.addon.getLocalizedString(30037)),
         })
+        # The page may be stored, but it must be revalidated, since it
+        # changes with the language.
+        self.servePage(page, 'no-cache')
 
     def serveCloseLinkcast(self, params):
         """Serves a webpage that automatically closes itself
@@ -155,16 +613,9 @@ class LinkcastRequestHandler(http.server.BaseHTTPRequestHandler):
 
         self.linkcast(url)
 
-        self.send_response(200)
-        self.send_header('Content-Type', 'text/html; charset=utf-8')
-        self.end_headers()
-
-        closePath = os.path.join(
-            self.server.addon.addonFolder, 'resources/data/close.html')
-        self.serveTemplate(closePath, {
-            'TITLE_HTML': html.escape(
-                self.server.addon.getLocalizedString(30032)),
-        })
+        page = self.server.addon.templateCache.getPage('close.html', {})
+        # A stored copy would be of no use, since every visit is a linkcast.
+        self.servePage(page, 'no-store')
 
     def serveXhpLinkcast(self, params):
         """Serves an XmlHttpRpc response for CORS requests"""
@@ -175,14 +626,16 @@ class LinkcastRequestHandler(http.server.BaseHTTPRequestHandler):
 
         self.linkcast(url)
 
+        body = '{}'.encode('utf_8')
         self.send_response(200)
         self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
         origin = self.headers.get('Origin')
         if origin is not None:
             self.send_header('Access-Control-Allow-Origin', origin)
         self.end_headers()
 
-        self.wfile.write('{}'.encode('utf_8'))
+        self.wfile.write(body)
 
     def serveHtmlLinkcast(self, params):
         url = next(iter(params.get('url', [])), None)
@@ -193,30 +646,35 @@ class LinkcastRequestHandler(http.server.BaseHTTPRequestHandler):
         self.linkcast(url)
 
         self.send_response(302)
-        location = urllib.parse.ParseResult(
-            scheme=None,
-            netloc=None,
-            path=self.INDEX_PATH,
-            params=None,
-            query=urllib.parse.urlencode({'url': url}),
-            fragment=None).geturl()
+        location = self.INDEX_PATH + '?' + urllib.parse.urlencode({'url': url})
         self.send_header('Location', location)
+        self.send_header('Content-Length', '0')
         self.end_headers()
 
-    def serveTemplate(self, path, params):
-        META_VARIABLES = {
-            'LEFT_CURLY_BRACKET': '{{',
-            'RIGHT_CURLY_BRACKET': '}}',
-        }
-        template_vars = dict(list(META_VARIABLES.items()) + list(params.items()))
-
-        def repl(match):
-            return template_vars[match.group(1)]
+    def servePage(self, page, cacheControl):
+        coding = chooseContentCoding(
+            self.headers.get('Accept-Encoding'), page.variants)
+        (etag, body) = page.variants[coding]
+
+        ifNoneMatch = self.headers.get('If-None-Match')
+        if ifNoneMatch is not None and matchesEtag(ifNoneMatch, etag):
+            self.send_response(304)
+            self.send_header('ETag', etag)
+            self.send_header('Cache-Control', cacheControl)
+            self.send_header('Vary', 'Accept-Encoding')
+            self.end_headers()
+            return
 
-        with open(path) as template_file:
-            template = template_file.read()
-        expanded = re.sub('{{([^{}]+)}}', repl, template)
-        self.wfile.write(expanded.encode('utf_8'))
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/html; charset=utf-8')
+        if coding != 'identity':
+            self.send_header('Content-Encoding', coding)
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('ETag', etag)
+        self.send_header('Cache-Control', cacheControl)
+        self.send_header('Vary', 'Accept-Encoding')
+        self.end_headers()
+        self.wfile.write(body)
 
     def linkcast(self, url):
         plugin = self.server.addon.buildPluginUrl(
@@ -258,6 +716,10 @@ class RemoteControlBrowserService(xbmcaddon.Addon):
         self.isShutdown = False
         self.linkcastServer = None
         self.linkcastServerThread = None
+        self.warmPool = WarmBrowserPool(self)
+        self.templateCache = TemplateCache(self)
+        self.launcher = None
+        self.launcherLogThread = None
 
     def clearBrowserLock(self):
         """Clears the pidfile in case the last shutdown was not clean"""
@@ -267,6 +729,50 @@ class RemoteControlBrowserService(xbmcaddon.Addon):
         except OSError:
             pass
 
+    def startLauncher(self):
+        """Starts a resident process that forks each browser wrapper
+
+        The plugin would otherwise start a fresh interpreter and import the
+        wrapper's dependencies on every launch. It still does so whenever the
+        launcher is unavailable.
+        """
+        if not hasattr(socket, 'send_fds'):
+            xbmc.log('Not starting the launcher', xbmc.LOGDEBUG)
+            return
+        launcherPath = os.path.join(self.addonFolder, 'launcher.py')
+        socketPath = os.path.join(self.profileFolder, 'launcher.sock')
+        xbmc.log('Starting launcher on ' + socketPath)
+        try:
+            os.makedirs(self.profileFolder, exist_ok=True)
+            self.launcher = subprocess.Popen(
+                [sys.executable, launcherPath, '--socket', socketPath],
+                close_fds=True,
+                # Closing stdin will inform the launcher of the service's
+                # death.
+                stdin=subprocess.PIPE,
+                stderr=subprocess.PIPE)
+        except OSError as e:
+            xbmc.log('Could not start launcher: ' + str(e), xbmc.LOGERROR)
+            return
+        threadStarting = threading.Thread(
+            target=slurpLauncherLog, args=(self.launcher.stderr,))
+        threadStarting.start()
+        self.launcherLogThread = threadStarting
+
+    def stopLauncher(self):
+        if self.launcher is not None:
+            xbmc.log('Stopping launcher')
+            self.launcher.stdin.close()
+            try:
+                self.launcher.wait(LAUNCHER_EXIT_DELAY)
+            except subprocess.TimeoutExpired:
+                self.launcher.kill()
+                self.launcher.wait()
+            self.launcher = None
+        if self.launcherLogThread is not None:
+            self.launcherLogThread.join()
+            self.launcherLogThread = None
+
     def buildPluginUrl(self, query):
         return urllib.parse.ParseResult(
             scheme='plugin',
@@ -372,15 +878,20 @@ class RemoteControlBrowserService(xbmcaddon.Addon):
             xbmc.log('Could not start linkcast server: ' + str(e), xbmc.LOGERROR)
 
     def stopLinkcastServer(self):
-        if self.linkcastServer is not None:
+        linkcastServer = self.linkcastServer
+        if linkcastServer is not None:
             xbmc.log('Stopping linkcast server')
-            self.linkcastServer.shutdown()
+            linkcastServer.shutdown()
             self.linkcastServer = None
         if self.linkcastServerThread is not None:
             xbmc.log('Joining linkcast server thread', xbmc.LOGDEBUG)
             self.linkcastServerThread.join()
             xbmc.log('Joined linkcast server thread', xbmc.LOGDEBUG)
             self.linkcastServerThread = None
+        if linkcastServer is not None:
+            xbmc.log('Closing linkcast server', xbmc.LOGDEBUG)
+            linkcastServer.server_close()
+            xbmc.log('Closed linkcast server', xbmc.LOGDEBUG)
 
     def shutdownLinkcastServer(self):
         xbmc.log('Shutting down linkcast server', xbmc.LOGDEBUG)
@@ -392,13 +903,19 @@ class RemoteControlBrowserService(xbmcaddon.Addon):
 def main():
     service = RemoteControlBrowserService()
     service.clearBrowserLock()
+    service.warmPool.clearSparefile()
     service.storeDefaults()
+    service.startLauncher()
     monitor = LinkcastMonitor(service)
     service.reloadLinkcastServer()
+    service.warmPool.reload()
 
-    monitor.waitForAbort()
+    while not monitor.waitForAbort(WARM_POOL_INTERVAL):
+        service.warmPool.maintain()
 
+    service.warmPool.shutdown()
     service.shutdownLinkcastServer()
+    service.stopLauncher()
 
 
 if __name__ == "__main__":
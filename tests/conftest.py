@@ -0,0 +1,13 @@
+import os
+import sys
+
+
+TESTS_FOLDER = os.path.dirname(os.path.abspath(__file__))
+ADDON_FOLDER = os.path.join(
+    os.path.dirname(TESTS_FOLDER), 'plugin.program.remote.control.browser')
+# Stand-ins for the Kodi modules, which only exist inside Kodi.
+STUBS_FOLDER = os.path.join(TESTS_FOLDER, 'stubs')
+
+# The add-on's modules live in its root folder rather than in a package.
+sys.path.insert(0, ADDON_FOLDER)
+sys.path.append(STUBS_FOLDER)
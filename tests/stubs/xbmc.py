@@ -0,0 +1,64 @@
+"""Stands in for Kodi's xbmc module"""
+import os
+import sys
+import time
+
+LOGDEBUG = 0
+LOGINFO = 1
+LOGWARNING = 2
+LOGERROR = 3
+LOGFATAL = 4
+
+ENGLISH_NAME = 0
+
+
+def log(msg, level=LOGDEBUG):
+    if level >= int(os.environ.get('KODI_STUB_LOG_LEVEL', LOGWARNING)):
+        print(msg, file=sys.stderr)
+
+
+def executebuiltin(function, wait=False):
+    pass
+
+
+def executeJSONRPC(jsonrpccommand):
+    return '{"jsonrpc": "2.0", "id": 0, "result": {}}'
+
+
+def getCondVisibility(condition):
+    return False
+
+
+def getLanguage(format=ENGLISH_NAME, region=False):
+    return 'English'
+
+
+class Monitor(object):
+    def abortRequested(self):
+        return False
+
+    def waitForAbort(self, timeout=None):
+        time.sleep(timeout or 0)
+        return False
+
+
+class Player(object):
+    def isPlaying(self):
+        return False
+
+    def pause(self):
+        pass
+
+
+class Keyboard(object):
+    def __init__(self, line='', heading='', hidden=False):
+        self.line = line
+
+    def doModal(self, autoclose=0):
+        pass
+
+    def isConfirmed(self):
+        return False
+
+    def getText(self):
+        return self.line
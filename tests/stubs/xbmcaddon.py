@@ -0,0 +1,45 @@
+"""Stands in for Kodi's xbmcaddon module
+
+The profile folder is read from KODI_STUB_PROFILE. Settings default to those
+in the add-on's settings.xml, and KODI_STUB_SETTINGS may override them with a
+JSON object.
+"""
+import json
+import os
+
+ADDON_ID = 'plugin.program.remote.control.browser'
+ADDON_FOLDER = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(
+        __file__)))),
+    ADDON_ID)
+
+
+def readDefaultSettings():
+    # The parser is imported here to keep it out of the plugin's import time.
+    import xml.etree.ElementTree
+
+    tree = xml.etree.ElementTree.parse(
+        os.path.join(ADDON_FOLDER, 'resources', 'settings.xml'))
+    return {
+        setting.get('id'): setting.get('default', '')
+        for setting in tree.iter('setting') if setting.get('id')}
+
+
+class Addon(object):
+    def getAddonInfo(self, id):
+        return {
+            'id': ADDON_ID,
+            'path': ADDON_FOLDER,
+            'profile': os.environ['KODI_STUB_PROFILE'],
+        }[id]
+
+    def getLocalizedString(self, id):
+        return 'String {:d}'.format(id)
+
+    def getSetting(self, id):
+        settings = readDefaultSettings()
+        settings.update(json.loads(os.environ.get('KODI_STUB_SETTINGS', '{}')))
+        return settings.get(id, '')
+
+    def openSettings(self):
+        pass
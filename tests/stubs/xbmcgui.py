@@ -0,0 +1,50 @@
+"""Stands in for Kodi's xbmcgui module"""
+
+
+class Window(object):
+    def __init__(self, existingWindowId=-1):
+        pass
+
+    def show(self):
+        pass
+
+    def close(self):
+        pass
+
+
+class Dialog(object):
+    def ok(self, heading, message):
+        return True
+
+    def yesno(self, heading, message, *args, **kwargs):
+        return False
+
+    def browse(self, type, heading, shares, *args, **kwargs):
+        return ''
+
+
+class DialogProgress(object):
+    def create(self, heading, message=''):
+        pass
+
+    def update(self, percent, message=''):
+        pass
+
+    def iscanceled(self):
+        return False
+
+    def close(self):
+        pass
+
+
+class ListItem(object):
+    def __init__(self, label='', label2='', path='', offscreen=False):
+        self.label = label
+        self.art = {}
+        self.contextMenuItems = []
+
+    def setArt(self, values):
+        self.art.update(values)
+
+    def addContextMenuItems(self, items, replaceItems=False):
+        self.contextMenuItems.extend(items)
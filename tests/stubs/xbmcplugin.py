@@ -0,0 +1,14 @@
+"""Stands in for Kodi's xbmcplugin module"""
+
+# Every listed item is kept, so that a caller can inspect the directory.
+directoryItems = []
+
+
+def addDirectoryItems(handle, items, totalItems=0):
+    directoryItems.extend(items)
+    return True
+
+
+def endOfDirectory(handle, succeeded=True, updateListing=False,
+                   cacheToDisc=True):
+    pass
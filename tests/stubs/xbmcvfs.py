@@ -0,0 +1,13 @@
+"""Stands in for Kodi's xbmcvfs module"""
+import os
+
+SPECIAL_HOME = os.path.dirname(os.path.dirname(os.path.dirname(
+    os.path.abspath(__file__))))
+
+
+def translatePath(path):
+    # The add-on is laid out as if the repository were Kodi's addons folder.
+    prefix = 'special://home/addons/'
+    if path.startswith(prefix):
+        return os.path.join(SPECIAL_HOME, path[len(prefix):])
+    return path
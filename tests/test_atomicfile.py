@@ -0,0 +1,26 @@
+import os
+
+import pytest
+
+import atomicfile
+
+
+def test_file_is_replaced_once_fully_written(tmp_path):
+    path = tmp_path / 'cache'
+    path.write_text('old')
+    with atomicfile.atomicWrite(str(path), 'w') as cacheFile:
+        cacheFile.write('new')
+        assert path.read_text() == 'old'
+    assert path.read_text() == 'new'
+    assert os.listdir(str(tmp_path)) == ['cache']
+
+
+def test_failed_write_keeps_the_old_file(tmp_path):
+    path = tmp_path / 'cache'
+    path.write_text('old')
+    with pytest.raises(RuntimeError):
+        with atomicfile.atomicWrite(str(path), 'w') as cacheFile:
+            cacheFile.write('partial')
+            raise RuntimeError()
+    assert path.read_text() == 'old'
+    assert os.listdir(str(tmp_path)) == ['cache']
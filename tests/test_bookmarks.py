@@ -0,0 +1,60 @@
+import contextlib
+import os
+
+import bookmarks
+
+
+LEGACY_XML = '''<?xml version='1.0' encoding='UTF-8'?>
+<bookmarks version="1.0">
+    <bookmark id="1d0f8a9e-0000-4000-8000-000000000001" title="Example"
+        url="https://example.com/" lircrc="browser.lirc" />
+</bookmarks>
+'''
+
+
+def openStore(folder):
+    legacyPath = os.path.join(folder, 'bookmarks.xml')
+    if not os.path.exists(legacyPath):
+        with open(legacyPath, 'w') as legacyFile:
+            legacyFile.write(LEGACY_XML)
+    store = bookmarks.BookmarkStore(
+        os.path.join(folder, 'bookmarks.db'), [legacyPath])
+    store.open()
+    return store
+
+
+def test_migration_keeps_bookmarks_with_missing_fields(tmp_path):
+    (tmp_path / 'bookmarks.xml').write_text(
+        '<bookmarks version="1.0">'
+        '<bookmark id="1d0f8a9e-0000-4000-8000-000000000002" '
+        'url="https://example.com/" />'
+        '<bookmark title="No URL" />'
+        '</bookmarks>')
+    with contextlib.closing(openStore(str(tmp_path))) as store:
+        migrated = store.list()
+    assert [(bookmark.title, bookmark.url) for bookmark in migrated] == [
+        ('', 'https://example.com/'), ('No URL', '')]
+    assert all(bookmark.id for bookmark in migrated)
+
+
+def test_current_store_opens_without_the_write_lock(tmp_path, monkeypatch):
+    store = openStore(str(tmp_path))
+    with contextlib.closing(store), store.transaction():
+        # Another process holds the write lock, which must not block readers.
+        monkeypatch.setattr(bookmarks, 'BUSY_TIMEOUT', 0)
+        reader = bookmarks.BookmarkStore(store.path, store.legacyPaths)
+        with contextlib.closing(reader):
+            reader.open()
+            assert [bookmark.title for bookmark in reader.list()] == [
+                'Example']
+
+
+def test_new_store_starts_at_the_first_schema_version(tmp_path):
+    with contextlib.closing(openStore(str(tmp_path))) as store:
+        assert store.getSchemaVersion() == bookmarks.SCHEMA_VERSION == 1
+        assert store.getGeneration() == 0
+    # Reopening finds the schema in place and migrates nothing again.
+    store = bookmarks.BookmarkStore(store.path, [])
+    with contextlib.closing(store):
+        store.open()
+        assert [bookmark.title for bookmark in store.list()] == ['Example']
@@ -0,0 +1,167 @@
+import contextlib
+import datetime
+import os
+import socket
+import subprocess
+import sys
+import time
+
+import pytest
+
+import browse
+
+
+def test_due_timers_fire_in_deadline_order():
+    timers = browse.TimerScheduler()
+    fired = []
+    now = time.monotonic()
+    timers.scheduleAt(now - 1, lambda: fired.append('second'))
+    timers.scheduleAt(now - 2, lambda: fired.append('first'))
+    timers.scheduleAt(now - 1, lambda: fired.append('third'))
+    timers.scheduleAt(now + 60, lambda: fired.append('pending'))
+
+    timers.fire()
+    assert fired == ['first', 'second', 'third']
+    assert 59 < timers.getTimeout() <= 60
+
+
+def test_cancelled_timers_neither_fire_nor_shorten_the_wait():
+    timers = browse.TimerScheduler()
+    fired = []
+    now = time.monotonic()
+    timers.scheduleAt(now - 1, lambda: fired.append('cancelled')).cancel()
+    timers.scheduleAt(now + 1, lambda: fired.append('soon')).cancel()
+    assert timers.getTimeout() is None
+
+    timers.fire()
+    assert fired == []
+
+
+def test_timer_scheduled_by_a_callback_waits_for_the_next_fire():
+    timers = browse.TimerScheduler()
+    fired = []
+
+    def reschedule():
+        fired.append('first')
+        timers.scheduleAt(
+            time.monotonic() + 60, lambda: fired.append('second'))
+    timers.scheduleAt(time.monotonic() - 1, reschedule)
+
+    timers.fire()
+    assert fired == ['first']
+    assert timers.getTimeout() > 0
+
+
+class EchoSource(object):
+    def __init__(self, sock, received):
+        self.sock = sock
+        self.received = received
+
+    def fileno(self):
+        return self.sock.fileno()
+
+    def onReadable(self, loop):
+        self.received.append(self.sock.recv(4096))
+
+
+def test_loop_dispatches_sources_then_timers_until_stopped():
+    (sink, source) = socket.socketpair()
+    (exitSink, exitSource) = socket.socketpair()
+    loop = browse.EventLoop()
+    with contextlib.closing(loop), sink, source, exitSink, exitSource:
+        received = []
+        loop.register(EchoSource(sink, received))
+        loop.register(browse.ExitSource(exitSink, 'the test is over'))
+        events = []
+        loop.timers.schedule(
+            datetime.timedelta(milliseconds=20),
+            lambda: (events.append('timer'), source.send(b'ping')))
+        loop.timers.schedule(
+            datetime.timedelta(milliseconds=60),
+            lambda: exitSource.send(b'\0'))
+
+        startTime = time.monotonic()
+        loop.run(lambda: events.append('dispatched'))
+        duration = time.monotonic() - startTime
+
+    assert received == [b'ping']
+    assert events[0] == 'timer'
+    assert events.count('dispatched') >= 2
+    # The loop sleeps until the next deadline instead of polling.
+    assert len(events) <= 4
+    assert 0.05 <= duration < 1
+
+
+def test_unregistered_source_is_no_longer_dispatched():
+    (sink, source) = socket.socketpair()
+    loop = browse.EventLoop()
+    with contextlib.closing(loop), sink, source:
+        received = []
+        echoSource = EchoSource(sink, received)
+        loop.register(echoSource)
+        loop.unregister(echoSource)
+        source.send(b'ping')
+        loop.timers.schedule(datetime.timedelta(0), loop.stop)
+        loop.run(lambda: None)
+    assert received == []
+
+
+@pytest.fixture(params=['pidfd', 'sigchld'])
+def watchMode(request, monkeypatch):
+    if request.param == 'pidfd':
+        if not hasattr(os, 'pidfd_open'):
+            pytest.skip('os.pidfd_open is unavailable')
+    else:
+        monkeypatch.delattr(os, 'pidfd_open', raising=False)
+    return request.param
+
+
+def startSleeper(seconds):
+    return subprocess.Popen(
+        [sys.executable, '-c', 'import time; time.sleep({})'.format(seconds)])
+
+
+def runUntilExit(proc, timeout):
+    """Runs a loop watching proc and returns how long it took to stop"""
+    loop = browse.EventLoop()
+    exitSource = browse.ProcessExitSource(proc, 'the child exited')
+    with contextlib.closing(loop), contextlib.closing(exitSource):
+        exitSource.open()
+        loop.register(exitSource)
+        timedOut = []
+        loop.timers.schedule(
+            timeout, lambda: (timedOut.append(True), loop.stop()))
+        startTime = time.monotonic()
+        loop.run(lambda: None)
+        duration = time.monotonic() - startTime
+    assert not timedOut
+    return duration
+
+
+def test_loop_stops_when_the_child_exits(watchMode):
+    proc = startSleeper(0.2)
+    try:
+        duration = runUntilExit(proc, datetime.timedelta(seconds=5))
+        assert proc.poll() is not None
+        assert 0.1 <= duration < 2
+    finally:
+        proc.kill()
+        proc.wait()
+
+
+def test_child_that_already_exited_stops_the_loop(watchMode):
+    proc = startSleeper(0)
+    proc.wait()
+    assert runUntilExit(proc, datetime.timedelta(seconds=5)) < 1
+
+
+def test_other_children_exiting_do_not_stop_the_loop(watchMode):
+    proc = startSleeper(0.5)
+    other = startSleeper(0)
+    try:
+        runUntilExit(proc, datetime.timedelta(seconds=5))
+        assert proc.poll() is not None
+    finally:
+        other.wait()
+        proc.kill()
+        proc.wait()
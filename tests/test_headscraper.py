@@ -0,0 +1,115 @@
+import contextlib
+import http.server
+import threading
+import urllib.request
+
+import pytest
+
+import headscraper
+
+
+BODY_SIZE = 8 * 2**20
+HEAD = (
+    b'<!DOCTYPE html><html><head>'
+    b'<link rel="shortcut icon" href="/favicon.ico">'
+    b'<link rel="icon" type="image/png" sizes="192x192" href="/icon.png">'
+    b'<title>Large page</title></head>')
+PAGES = {
+    '/large': (
+        'text/html; charset=utf-8', HEAD + b'<body>' + b'x' * BODY_SIZE),
+    '/headless': ('text/html', b'<html><p>' + b'x' * BODY_SIZE),
+    '/meta-charset': (
+        'text/html',
+        '<html><head><meta charset="windows-1252"><title>Caf\xe9</title>'
+        '</head><body></body></html>'.encode('cp1252')),
+    '/http-equiv': (
+        'text/html',
+        '<html><head><meta http-equiv="Content-Type" '
+        'content="text/html; charset=ISO-8859-15"><title>€</title>'
+        '</head></html>'.encode('iso-8859-15')),
+    '/header-charset': (
+        'text/html; charset=utf-8',
+        '<html><head><meta charset="windows-1252"><title>été</title>'
+        '</head></html>'.encode('utf-8')),
+}
+
+
+class PageHandler(http.server.BaseHTTPRequestHandler):
+    def do_GET(self):
+        (contentType, body) = PAGES[self.path]
+        self.send_response(200)
+        self.send_header('Content-Type', contentType)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        try:
+            self.wfile.write(body)
+        except (BrokenPipeError, ConnectionResetError):
+            # The scraper hangs up once it has the head.
+            pass
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture(scope='module')
+def serverUrl():
+    server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), PageHandler)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.start()
+    try:
+        yield 'http://127.0.0.1:{}'.format(server.server_address[1])
+    finally:
+        server.shutdown()
+        server.server_close()
+        thread.join()
+
+
+class CountingResponse(object):
+    """Counts how many bytes of a response the scraper reads"""
+
+    def __init__(self, response):
+        self.response = response
+        self.headers = response.headers
+        self.byteCount = 0
+
+    def read(self, size):
+        return self.read1(size)
+
+    def read1(self, size):
+        data = self.response.read1(size)
+        self.byteCount += len(data)
+        return data
+
+
+def scrape(url, byteCap=headscraper.HEAD_BYTE_CAP):
+    titles = []
+    with contextlib.closing(urllib.request.urlopen(url)) as webpage:
+        response = CountingResponse(webpage)
+        head = headscraper.scrapeHead(
+            response, titles.append, threading.Event(), byteCap)
+    return (head, titles, response.byteCount)
+
+
+def test_large_page_is_read_only_up_to_its_head(serverUrl):
+    (head, titles, byteCount) = scrape(serverUrl + '/large')
+    assert titles == ['Large page']
+    assert headscraper.getBestIcon(head.icons).href == '/icon.png'
+    assert byteCount < len(HEAD) + headscraper.CHUNK_SIZE
+
+
+def test_page_without_a_head_is_cut_at_the_byte_cap(serverUrl):
+    byteCap = 100 * 2**10
+    (head, titles, byteCount) = scrape(serverUrl + '/headless', byteCap)
+    assert titles == []
+    assert byteCount <= byteCap
+
+
+@pytest.mark.parametrize(('path', 'title'), [
+    ('/meta-charset', 'Café'),
+    ('/http-equiv', '€'),
+    ('/header-charset', 'été'),
+])
+def test_charset_is_taken_from_the_header_or_else_a_meta_tag(
+        serverUrl, path, title):
+    (head, titles, byteCount) = scrape(serverUrl + path)
+    assert titles == [title]
@@ -0,0 +1,88 @@
+import contextlib
+import os
+import textwrap
+
+import pytest
+
+import imageworker
+import plugin
+
+
+# Stands in for retrieve.py --serve. Each response names the worker's pid.
+FAKE_RETRIEVE = textwrap.dedent('''\
+    import json
+    import os
+    import sys
+    import time
+
+    for line in sys.stdin:
+        request = json.loads(line)
+        if request['url'] == 'crash':
+            sys.exit(1)
+        if request['url'] == 'hang':
+            time.sleep(60)
+        print(json.dumps({
+            'etag': None,
+            'lastModified': None,
+            'hash': request['url'],
+            'thumb': 'pid{}'.format(os.getpid()),
+        }), flush=True)
+''')
+
+
+@pytest.fixture
+def retrievePath(tmp_path):
+    retrievePath = tmp_path / 'retrieve.py'
+    retrievePath.write_text(FAKE_RETRIEVE)
+    return str(retrievePath)
+
+
+@pytest.fixture
+def worker(retrievePath):
+    worker = imageworker.ImageWorker(retrievePath, timeout=0.5)
+    with contextlib.closing(worker):
+        yield worker
+
+
+def retrieve(worker, url):
+    return worker.retrieve(url, '/thumbs')['thumb']
+
+
+def test_requests_share_one_process(worker):
+    assert retrieve(worker, 'a') == retrieve(worker, 'b')
+
+
+def test_crashed_worker_is_replaced(worker):
+    thumb = retrieve(worker, 'a')
+    proc = worker.proc
+    with pytest.raises(imageworker.ImageWorkerError, match='crashed'):
+        retrieve(worker, 'crash')
+    assert worker.proc is None
+    assert proc.returncode == 1
+    assert retrieve(worker, 'b') not in (None, thumb)
+
+
+def test_hung_worker_is_killed_and_replaced(worker):
+    thumb = retrieve(worker, 'a')
+    proc = worker.proc
+    with pytest.raises(imageworker.ImageWorkerError, match='timed out'):
+        retrieve(worker, 'hang')
+    # The hung process was reaped rather than left running.
+    assert proc.returncode is not None
+    assert retrieve(worker, 'b') not in (None, thumb)
+
+
+def test_plugin_keeps_one_worker_for_the_session(
+        tmp_path, monkeypatch, retrievePath):
+    monkeypatch.setenv('KODI_STUB_PROFILE', str(tmp_path / 'profile'))
+    addon = plugin.RemoteControlBrowserPlugin(1)
+    addon.addonFolder = os.path.dirname(retrievePath)
+    with contextlib.closing(addon):
+        thumbs = [
+            addon.retrieveThumb(url, None)
+            for url in ('https://a/icon.png', 'https://b/icon.png')]
+        worker = addon.imageWorker
+        assert thumbs[0] == thumbs[1]
+        assert worker.proc.poll() is None
+    assert addon.imageWorker is None
+    assert worker.proc is None
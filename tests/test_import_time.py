@@ -0,0 +1,84 @@
+import json
+import os
+import subprocess
+import sys
+import urllib.parse
+
+import pytest
+
+import conftest
+
+
+# Kodi starts a fresh interpreter for each call, so the plugin's imports are
+# paid on every directory listing and launch.
+IMPORT_BUDGET = 0.15  # seconds
+MODE_BUDGET = 0.4  # seconds
+RUNS = 3
+DRIVER = r'''
+import json
+import sys
+import time
+
+startTime = time.perf_counter()
+import plugin
+importedTime = time.perf_counter()
+import xbmcplugin
+sys.argv = ['plugin.py'] + sys.argv[1:]
+plugin.main()
+json.dump({
+    'importSeconds': importedTime - startTime,
+    'modeSeconds': time.perf_counter() - startTime,
+    'modules': sorted(sys.modules),
+    'urls': [url for (url, listItem) in xbmcplugin.directoryItems],
+}, sys.stdout)
+'''
+# Modules that only the modes which need them should load.
+LAZY_MODULES = (
+    'concurrent.futures', 'headscraper', 'html.parser', 'http.client',
+    'httpcache', 'imageworker', 'keymap', 'urllib.request', 'xml.dom.minidom')
+
+
+def runPlugin(profileFolder, query):
+    env = dict(
+        os.environ,
+        PYTHONPATH=os.pathsep.join(
+            (conftest.STUBS_FOLDER, conftest.ADDON_FOLDER)),
+        KODI_STUB_PROFILE=profileFolder)
+    output = subprocess.run(
+        [sys.executable, '-c', DRIVER, '1', '?' + query],
+        env=env,
+        stdout=subprocess.PIPE,
+        check=True).stdout
+    return json.loads(output)
+
+
+def runFastest(profileFolder, query):
+    return min(
+        (runPlugin(profileFolder, query) for _ in range(RUNS)),
+        key=lambda result: result['modeSeconds'])
+
+
+@pytest.fixture
+def profileFolder(tmp_path):
+    # The first call migrates the default bookmarks and builds the listing.
+    runPlugin(str(tmp_path), 'mode=index')
+    return str(tmp_path)
+
+
+def test_index_fits_the_budget(profileFolder):
+    result = runFastest(profileFolder, 'mode=index')
+    assert result['urls']
+    assert result['importSeconds'] < IMPORT_BUDGET
+    assert result['modeSeconds'] < MODE_BUDGET
+    assert not set(LAZY_MODULES) & set(result['modules'])
+
+
+def test_launch_bookmark_fits_the_budget(profileFolder):
+    url = runPlugin(profileFolder, 'mode=index')['urls'][0]
+    query = urllib.parse.urlparse(url).query
+    assert 'mode=launchBookmark' in query
+    # Without a browser path, the launch stops at the settings dialog.
+    result = runFastest(profileFolder, query)
+    assert result['importSeconds'] < IMPORT_BUDGET
+    assert result['modeSeconds'] < MODE_BUDGET
+    assert not set(LAZY_MODULES) & set(result['modules'])
@@ -0,0 +1,129 @@
+import os
+
+import pytest
+
+import keymap
+
+
+@pytest.mark.parametrize('config', ['CLICK 0', 'CLICK 6', 'CLICK -1'])
+def test_click_outside_the_pointer_buttons_is_rejected(config):
+    with pytest.raises(keymap.KeymapError):
+        keymap.compileCommand(config)
+
+
+@pytest.mark.parametrize(('config', 'button'), [
+    ('CLICK', 1), ('CLICK 3', 3), ('CLICK 5', 5)])
+def test_click_accepts_the_pointer_buttons(config, button):
+    assert keymap.compileCommand(config) == keymap.LircCommand(
+        'CLICK', (button,))
+
+
+LIRCRC = '''\
+begin
+    prog = browser
+    button = KEY_OK
+    config = CLICK
+end
+begin
+    prog = browser
+    button = KEY_UP
+    repeat = 1
+    config = MOUSE 0 -1 curve=linear
+end
+include "extra.lircrc"
+'''
+EXTRA_LIRCRC = '''\
+begin
+    prog = browser
+    button = KEY_1
+    config = MULTITAP 1 a b c
+end
+'''
+
+
+@pytest.fixture
+def lircrcPath(tmp_path):
+    (tmp_path / 'extra.lircrc').write_text(EXTRA_LIRCRC)
+    path = tmp_path / 'browser.lircrc'
+    path.write_text(LIRCRC)
+    return str(path)
+
+
+def test_commands_are_compiled_once():
+    command = keymap.compileCommand('MOUSE 1 0 curve=exp')
+    assert command == keymap.LircCommand('MOUSE', (1, 0, 'exp'))
+    assert keymap.compileCommand('MOUSE 1 0 curve=exp') is command
+
+
+@pytest.mark.parametrize('config', [
+    '', 'JUMP', 'KEY', 'MOUSE 1', 'MOUSE 1 0 curve=cubic', 'EXIT now'])
+def test_invalid_commands_are_rejected(config):
+    with pytest.raises(keymap.KeymapError):
+        keymap.compileCommand(config)
+
+
+def test_lircrc_bindings_and_includes_are_parsed(lircrcPath):
+    parser = keymap.LircrcParser()
+    parser.parseFile(lircrcPath)
+    assert [binding.buttons for binding in parser.bindings] == [
+        ('KEY_OK',), ('KEY_UP',), ('KEY_1',)]
+    assert parser.bindings[1].repeat == 1
+    assert len(parser.sources) == 2
+
+
+@pytest.mark.parametrize(('contents', 'lineNumber'), [
+    ('begin\n    prog = browser\n    config = CLICK\n', 1),
+    ('begin\n    prog = browser\n    colour = red\nend\n', 3),
+    ('begin\n    config = CLICK\nend\n', 1),
+    ('end\n', 1),
+])
+def test_malformed_lircrc_reports_the_line(tmp_path, contents, lineNumber):
+    path = tmp_path / 'broken.lircrc'
+    path.write_text(contents)
+    with pytest.raises(keymap.KeymapError, match=':{}:'.format(lineNumber)):
+        keymap.LircrcParser().parseFile(str(path))
+
+
+def test_cache_round_trips_the_keymap(lircrcPath, tmp_path):
+    loaded = keymap.parseKeymap(lircrcPath)
+    cachePath = str(tmp_path / 'cache' / 'keymap.json')
+    keymap.writeCache(cachePath, loaded)
+    assert keymap.readCache(cachePath) == loaded
+
+
+def test_cache_is_stale_once_an_include_changes(lircrcPath, tmp_path):
+    cachePath = str(tmp_path / 'cache' / 'keymap.json')
+    keymap.writeCache(cachePath, keymap.parseKeymap(lircrcPath))
+    (tmp_path / 'extra.lircrc').write_text(
+        EXTRA_LIRCRC.replace('MULTITAP 1 a b c', 'MULTITAP 2 d e f'))
+    assert keymap.readCache(cachePath) is None
+
+
+def test_reload_replaces_the_stale_cache_entry(lircrcPath, tmp_path):
+    cacheFolder = str(tmp_path / 'cache')
+    keymap.loadKeymap(lircrcPath, cacheFolder)
+    (firstEntry,) = os.listdir(cacheFolder)
+    # A fresh entry is reused as is.
+    keymap.loadKeymap(lircrcPath, cacheFolder)
+    assert os.listdir(cacheFolder) == [firstEntry]
+
+    with open(lircrcPath, 'a') as lircrcFile:
+        lircrcFile.write(
+            'begin\n    prog = browser\n    button = KEY_EXIT\n'
+            '    config = EXIT\nend\n')
+    reloaded = keymap.loadKeymap(lircrcPath, cacheFolder)
+    assert 'EXIT' in reloaded.commands
+    (secondEntry,) = os.listdir(cacheFolder)
+    assert secondEntry != firstEntry
+    assert secondEntry.split('-')[0] == firstEntry.split('-')[0]
+
+
+def test_entries_of_other_keymaps_are_kept(lircrcPath, tmp_path):
+    cacheFolder = tmp_path / 'cache'
+    cacheFolder.mkdir()
+    otherEntry = cacheFolder / '{}-x.json'.format(
+        '0' * keymap.CACHE_PATH_DIGEST_LENGTH)
+    otherEntry.write_text('{}')
+    keymap.loadKeymap(lircrcPath, str(cacheFolder))
+    assert otherEntry.exists()
+    assert len(os.listdir(str(cacheFolder))) == 2
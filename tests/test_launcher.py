@@ -0,0 +1,80 @@
+import contextlib
+import os
+import socket
+import subprocess
+import sys
+import time
+
+import pytest
+
+import conftest
+import plugin
+
+
+LAUNCHER_PATH = os.path.join(conftest.ADDON_FOLDER, 'launcher.py')
+START_TIMEOUT = 10  # seconds
+
+pytestmark = pytest.mark.skipif(
+    not hasattr(socket, 'send_fds'), reason='needs socket.send_fds')
+
+
+def waitForListener(launcher, socketPath):
+    # The socket file appears on bind, slightly before the launcher listens.
+    deadline = time.monotonic() + START_TIMEOUT
+    while True:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as probe:
+            try:
+                probe.connect(socketPath)
+                return
+            except (FileNotFoundError, ConnectionRefusedError):
+                pass
+        assert launcher.poll() is None
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+
+
+@pytest.fixture
+def socketPath(tmp_path):
+    socketPath = str(tmp_path / 'launcher.sock')
+    launcher = subprocess.Popen(
+        [sys.executable, LAUNCHER_PATH, '--socket', socketPath],
+        stdin=subprocess.PIPE,
+        stderr=subprocess.DEVNULL)
+    try:
+        waitForListener(launcher, socketPath)
+        yield socketPath
+    finally:
+        # Closing stdin tells the launcher that the service stopped.
+        launcher.stdin.close()
+        assert launcher.wait(START_TIMEOUT) == 0
+        assert not os.path.exists(socketPath)
+
+
+def test_wrapper_reports_its_pid_stderr_and_exit_status(socketPath):
+    proc = plugin.LaunchedProcess.launch(socketPath, ['--kodi-pid', 'x'])
+    with contextlib.closing(proc.stdin), contextlib.closing(proc.stderr):
+        assert proc.pid > 0
+        # The usage error reaches the client through the passed stderr.
+        assert b'--kodi-pid' in proc.stderr.read()
+        assert proc.wait() == 2
+    assert proc.poll() == 2
+
+
+def test_each_request_forks_its_own_wrapper(socketPath):
+    procs = [
+        plugin.LaunchedProcess.launch(socketPath, []) for _ in range(3)]
+    for proc in procs:
+        with contextlib.closing(proc.stdin), contextlib.closing(proc.stderr):
+            assert proc.wait() == 2
+    assert len(set(proc.pid for proc in procs)) == 3
+
+
+def test_malformed_request_is_ignored(socketPath):
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as connection:
+        connection.connect(socketPath)
+        connection.sendall(b'not json\n')
+        assert connection.recv(4096) == b''
+    # The launcher keeps serving.
+    proc = plugin.LaunchedProcess.launch(socketPath, [])
+    with contextlib.closing(proc.stdin), contextlib.closing(proc.stderr):
+        assert proc.wait() == 2
@@ -0,0 +1,162 @@
+import contextlib
+import http.client
+import socket
+import threading
+import time
+import urllib.parse
+
+import pytest
+
+import service
+
+
+URL = 'https://example.com/watch?v=1&t=2'
+FORM_HEADERS = {'Content-Type': 'application/x-www-form-urlencoded'}
+
+
+@pytest.fixture
+def linkcasts(monkeypatch):
+    linkcasts = []
+    monkeypatch.setattr(
+        service.xbmc, 'executebuiltin',
+        lambda function, wait=False: linkcasts.append(function))
+    return linkcasts
+
+
+@pytest.fixture
+def server(tmp_path, monkeypatch, linkcasts):
+    monkeypatch.setenv('KODI_STUB_PROFILE', str(tmp_path))
+    addon = service.RemoteControlBrowserService()
+    server = service.LinkcastServer(addon, ('127.0.0.1', 0))
+    thread = threading.Thread(target=server.serve_forever)
+    thread.start()
+    try:
+        yield server
+    finally:
+        server.shutdown()
+        thread.join()
+        server.server_close()
+
+
+def connect(server):
+    return contextlib.closing(http.client.HTTPConnection(
+        '127.0.0.1', server.server_address[1], timeout=10))
+
+
+def request(connection, method, path, body=None, headers={}):
+    connection.request(method, path, body, headers)
+    response = connection.getresponse()
+    return (response, response.read())
+
+
+def test_html_linkcast_redirects_to_the_index(server, linkcasts):
+    with connect(server) as connection:
+        (response, body) = request(
+            connection, 'POST', '/linkcast.html',
+            urllib.parse.urlencode({'url': URL}), FORM_HEADERS)
+        assert response.status == 302
+        location = response.getheader('Location')
+        assert location == '/?' + urllib.parse.urlencode({'url': URL})
+        assert len(linkcasts) == 1
+        assert urllib.parse.quote_plus(URL) in linkcasts[0]
+
+        # The redirect is followed on the same connection.
+        (response, body) = request(connection, 'GET', location)
+        assert response.status == 200
+        assert 'value="{}"'.format(URL.replace('&', '&amp;')) in body.decode(
+            'utf_8')
+
+
+def test_xhp_linkcast_allows_the_origin(server, linkcasts):
+    with connect(server) as connection:
+        (response, body) = request(
+            connection, 'POST', '/linkcast.xhp',
+            urllib.parse.urlencode({'url': URL}),
+            dict(FORM_HEADERS, Origin='https://example.com'))
+    assert response.status == 200
+    assert body == b'{}'
+    assert response.getheader(
+        'Access-Control-Allow-Origin') == 'https://example.com'
+    assert len(linkcasts) == 1
+
+
+def test_pipelined_requests_are_served(server):
+    port = server.server_address[1]
+    with socket.create_connection(('127.0.0.1', port), timeout=10) as client:
+        client.sendall(b'GET / HTTP/1.1\r\nHost: x\r\n\r\n' * 2)
+        responses = b''
+        while responses.count(b'HTTP/1.1 200') < 2:
+            data = client.recv(65536)
+            assert data
+            responses += data
+
+
+def test_idle_connections_yield_their_threads(server):
+    with contextlib.ExitStack() as stack:
+        # Every thread is left holding an idle keep-alive connection.
+        for _ in range(service.LINKCAST_SERVER_THREADS):
+            connection = stack.enter_context(connect(server))
+            (response, body) = request(connection, 'GET', '/')
+            assert response.status == 200
+        with connect(server) as connection:
+            startTime = time.monotonic()
+            (response, body) = request(connection, 'GET', '/')
+            assert response.status == 200
+        assert time.monotonic() - startTime < (
+            service.LINKCAST_KEEPALIVE_TIMEOUT / 2)
+
+        startTime = time.monotonic()
+        server.shutdown()
+        server.server_close()
+        assert time.monotonic() - startTime < (
+            service.LINKCAST_KEEPALIVE_TIMEOUT / 2)
+
+
+def keepBusy(server, isStopping, handoffs):
+    connection = None
+    while not isStopping.is_set():
+        if connection is None:
+            connection = http.client.HTTPConnection(
+                '127.0.0.1', server.server_address[1], timeout=10)
+        (response, body) = request(connection, 'GET', '/')
+        assert response.status == 200
+        if response.will_close:
+            handoffs.append(True)
+            connection.close()
+            connection = None
+    if connection is not None:
+        connection.close()
+
+
+def test_busy_connections_yield_their_threads(server):
+    isStopping = threading.Event()
+    handoffs = []
+    # Every thread is kept busy by a keep-alive client that never pauses.
+    clients = [
+        threading.Thread(target=keepBusy, args=(server, isStopping, handoffs))
+        for _ in range(service.LINKCAST_SERVER_THREADS)]
+    for client in clients:
+        client.start()
+    try:
+        time.sleep(0.1)
+        with connect(server) as connection:
+            startTime = time.monotonic()
+            (response, body) = request(connection, 'GET', '/')
+            assert response.status == 200
+        assert time.monotonic() - startTime < (
+            service.LINKCAST_KEEPALIVE_TIMEOUT / 2)
+    finally:
+        isStopping.set()
+        for client in clients:
+            client.join()
+    assert handoffs
+
+
+def test_compressed_pages_are_reproducible():
+    body = b'<html><body>' + b'linkcast ' * 100 + b'</body></html>'
+    (etag, compressed) = service.RenderedPage(body, 'English').variants['gzip']
+    # Bytes 4 to 8 of a gzip header hold its timestamp (see RFC 1952).
+    assert compressed[:2] == b'\x1f\x8b'
+    assert compressed[4:8] == b'\0\0\0\0'
+    assert service.RenderedPage(body, 'English').variants['gzip'] == (
+        etag, compressed)
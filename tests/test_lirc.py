@@ -0,0 +1,85 @@
+import contextlib
+import datetime
+import socket
+import time
+
+import pytest
+
+import browse
+
+
+READ_TIMEOUT = 2  # seconds
+REPEAT_HORIZON = datetime.timedelta(milliseconds=50)
+UNMAPPED = 'unmapped'
+
+
+class FakePylirc(object):
+    """Reads one code per line, like pylirc with a single binding per button
+
+    A line that matches no binding yields None, as pylirc does for a button
+    that is missing from its configuration.
+    """
+
+    def __init__(self, lircSocket):
+        self.lircSocket = lircSocket
+
+    def nextcode(self, extended):
+        try:
+            data = self.lircSocket.recv(4096, socket.MSG_PEEK)
+        except BlockingIOError:
+            return None
+        (line, separator, rest) = data.partition(b'\n')
+        if not separator:
+            return None
+        self.lircSocket.recv(len(line) + 1)
+        (config, repeat) = line.decode('ascii').split()
+        if config == UNMAPPED:
+            return None
+        return [{'config': config, 'repeat': int(repeat)}]
+
+
+@pytest.fixture
+def lircSocket(monkeypatch):
+    (lircSocket, remote) = socket.socketpair()
+    lircSocket.setblocking(False)
+    monkeypatch.setattr(browse, 'pylirc', FakePylirc(lircSocket))
+    with contextlib.closing(lircSocket), contextlib.closing(remote):
+        yield remote
+
+
+def receiveCodes(source, count):
+    """Collects codes from the source as the event loop would"""
+    codes = []
+    source.onCodes = codes.extend
+    deadline = time.monotonic() + READ_TIMEOUT
+    while len(codes) < count and time.monotonic() < deadline:
+        time.sleep(0.01)
+        source.onReadable(None)
+    return codes
+
+
+def test_unmapped_button_does_not_stop_the_drain(lircSocket):
+    source = browse.LircSource(browse.pylirc.lircSocket.fileno(), None)
+    with contextlib.closing(source):
+        lircSocket.sendall(b'Up 0\nunmapped 0\nDown 0\nLeft 0\n')
+        codes = receiveCodes(source, 3)
+    assert [code.config for (code, receivedTime) in codes] == [
+        'Up', 'Down', 'Left']
+
+
+def test_repeats_are_stamped_on_arrival_and_dropped_when_stale(lircSocket):
+    source = browse.LircSource(browse.pylirc.lircSocket.fileno(), None)
+    coalescer = browse.InputCoalescer(REPEAT_HORIZON)
+    with contextlib.closing(source):
+        lircSocket.sendall(b'Up 0\nUp 1\nUp 2\n')
+        codes = receiveCodes(source, 3)
+        # The loop is busy injecting while more repeats arrive.
+        lircSocket.sendall(b'Up 3\n')
+        time.sleep(2 * REPEAT_HORIZON.total_seconds())
+        codes.extend(receiveCodes(source, 1))
+        now = time.monotonic()
+        kept = [
+            code for (code, receivedTime) in codes
+            if not coalescer.isStale(code, receivedTime, now)]
+    assert coalescer.droppedCount > 0
+    assert [code.repeat for code in kept] == [0]
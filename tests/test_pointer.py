@@ -0,0 +1,51 @@
+import pytest
+
+import browse
+
+
+REPEAT_INTERVAL = 0.1  # seconds
+HOLD_SECONDS = 1.0
+
+
+def holdRight(curveName):
+    """Holds the right button down and returns the moves by time"""
+    accelerator = browse.PointerAccelerator()
+    moves = [(0., accelerator.press(1, 0, curveName, False, 0.))]
+    repeatTimes = [
+        REPEAT_INTERVAL * index
+        for index in range(1, int(HOLD_SECONDS / REPEAT_INTERVAL) + 1)]
+    now = 0.
+    while now < HOLD_SECONDS + 1:
+        now = round(now + 0.004, 3)
+        if repeatTimes and now >= repeatTimes[0]:
+            repeatTimes.pop(0)
+            assert accelerator.press(1, 0, curveName, True, now) is None
+        move = accelerator.tick(now)
+        if move is not None:
+            moves.append((now, move))
+    return (accelerator, moves)
+
+
+@pytest.mark.parametrize('curveName', sorted(browse.PointerAccelerator.CURVES))
+def test_held_button_speeds_up_then_stops(curveName):
+    (accelerator, moves) = holdRight(curveName)
+    assert moves[0] == (0., browse.MoveInput(browse.POINTER_PRESS_STEP, 0))
+    assert all(move.vertical == 0 for (_, move) in moves)
+
+    firstHalf = sum(
+        move.horizontal for (now, move) in moves[1:]
+        if now <= HOLD_SECONDS / 2)
+    secondHalf = sum(
+        move.horizontal for (now, move) in moves
+        if now > HOLD_SECONDS / 2)
+    assert 0 < firstHalf < secondHalf
+
+    # The pointer stops once a repeat is overdue.
+    holdDeadline = HOLD_SECONDS + REPEAT_INTERVAL * 1.5
+    assert moves[-1][0] <= holdDeadline + 0.016
+    assert accelerator.getNextTickTime() is None
+
+
+def test_unknown_curve_is_rejected():
+    with pytest.raises(ValueError):
+        browse.PointerAccelerator().press(1, 0, 'cubic', False, 0.)
@@ -0,0 +1,58 @@
+import http.client
+import os
+import sqlite3
+
+import pytest
+
+import bookmarks
+import plugin
+
+
+@pytest.fixture
+def addon(tmp_path, monkeypatch):
+    monkeypatch.setenv('KODI_STUB_PROFILE', str(tmp_path))
+    addon = plugin.RemoteControlBrowserPlugin(1)
+    plugin.makedirs(addon.thumbsFolder)
+    return addon
+
+
+def writeThumb(addon, thumbId):
+    with open(addon.getThumbPath(thumbId), 'wb') as thumbFile:
+        thumbFile.write(b'png')
+
+
+def test_failed_bookmarks_do_not_stop_the_refresh(addon, monkeypatch):
+    with addon.openBookmarks() as store:
+        bookmarkList = store.list()[:3]
+        for (index, bookmark) in enumerate(bookmarkList):
+            store.update(bookmark.id, thumb='old{}'.format(index))
+            writeThumb(addon, 'old{}'.format(index))
+    (failed, locked, refreshed) = bookmarkList
+
+    def refreshThumb(bookmark, isAborting, imagePool):
+        if bookmark.id == failed.id:
+            raise http.client.IncompleteRead(b'')
+        if bookmark.id in (locked.id, refreshed.id):
+            writeThumb(addon, 'new-' + bookmark.id)
+            return 'new-' + bookmark.id
+        return None
+    monkeypatch.setattr(addon, 'refreshThumb', refreshThumb)
+
+    update = bookmarks.BookmarkStore.update
+    def lockedUpdate(store, bookmarkId, **fields):
+        if bookmarkId == locked.id:
+            raise sqlite3.OperationalError('database is locked')
+        return update(store, bookmarkId, **fields)
+    monkeypatch.setattr(bookmarks.BookmarkStore, 'update', lockedUpdate)
+
+    addon.refreshThumbs()
+
+    with addon.openBookmarks() as store:
+        thumbs = dict(
+            (bookmark.id, bookmark.thumb) for bookmark in store.list())
+    assert thumbs[failed.id] == 'old0'
+    assert thumbs[locked.id] == 'old1'
+    assert thumbs[refreshed.id] == 'new-' + refreshed.id
+    # The replaced thumbnail and the one that could not be saved are removed.
+    assert sorted(os.listdir(addon.thumbsFolder)) == sorted([
+        'old0.png', 'old1.png', 'new-{}.png'.format(refreshed.id)])
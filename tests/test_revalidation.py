@@ -0,0 +1,131 @@
+import collections
+import contextlib
+import email.utils
+import hashlib
+import http.server
+import io
+import threading
+
+import pytest
+
+import plugin
+
+
+Image = pytest.importorskip('PIL.Image')
+
+FIRST_MODIFIED = 1792195200  # Sat, 17 Oct 2026 00:00:00 GMT
+
+
+def makePng(color):
+    image = Image.new('RGBA', (64, 64), color)
+    output = io.BytesIO()
+    image.save(output, 'PNG')
+    return output.getvalue()
+
+
+class CountingServer(http.server.ThreadingHTTPServer):
+    """Serves content and counts the responses by path and status
+
+    Replaced content gets a later Last-Modified date, like a file on disk.
+    """
+
+    def __init__(self, useEtag):
+        super(CountingServer, self).__init__(
+            ('127.0.0.1', 0), CountingHandler)
+        self.useEtag = useEtag
+        self.counts = collections.Counter()
+        self.content = {
+            '/page.html': (
+                'text/html; charset=utf-8',
+                b'<html><head><title>Page</title>'
+                b'<link rel="icon" type="image/png" href="/icon.png">'
+                b'</head><body>'),
+            '/icon.png': ('image/png', makePng('red')),
+        }
+        self.modifiedTimes = dict.fromkeys(self.content, FIRST_MODIFIED)
+
+    def replace(self, path, body):
+        (contentType, _) = self.content[path]
+        self.content[path] = (contentType, body)
+        self.modifiedTimes[path] += 1
+
+
+class CountingHandler(http.server.BaseHTTPRequestHandler):
+    def do_GET(self):
+        (contentType, body) = self.server.content[self.path]
+        if self.server.useEtag:
+            validator = ('ETag', '"{}"'.format(hashlib.sha1(body).hexdigest()))
+            isUnchanged = self.headers.get('If-None-Match') == validator[1]
+        else:
+            validator = ('Last-Modified', email.utils.formatdate(
+                self.server.modifiedTimes[self.path], usegmt=True))
+            isUnchanged = self.headers.get('If-Modified-Since') == validator[1]
+        if isUnchanged:
+            self.server.counts[(self.path, 304)] += 1
+            self.send_response(304)
+            self.send_header(*validator)
+            self.end_headers()
+            return
+        self.server.counts[(self.path, 200)] += 1
+        self.send_response(200)
+        self.send_header('Content-Type', contentType)
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header(*validator)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture(params=[True, False], ids=['etag', 'last-modified'])
+def server(request):
+    server = CountingServer(request.param)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.start()
+    try:
+        yield server
+    finally:
+        server.shutdown()
+        server.server_close()
+        thread.join()
+
+
+@pytest.fixture
+def addon(tmp_path, monkeypatch):
+    monkeypatch.setenv('KODI_STUB_PROFILE', str(tmp_path))
+    addon = plugin.RemoteControlBrowserPlugin(1)
+    with contextlib.closing(addon):
+        yield addon
+
+
+def scrape(addon, server):
+    url = 'http://127.0.0.1:{}/page.html'.format(server.server_address[1])
+    titles = []
+    thumbId = addon.scrapeWebpage(
+        url, threading.Event(), threading.Event(), titles)
+    return (thumbId, titles)
+
+
+def test_unchanged_page_and_icon_are_not_downloaded_again(addon, server):
+    (thumbId, titles) = scrape(addon, server)
+    assert thumbId is not None
+    assert titles == ['Page']
+
+    for _ in range(2):
+        assert scrape(addon, server) == (thumbId, ['Page'])
+    assert server.counts == {
+        ('/page.html', 200): 1,
+        ('/page.html', 304): 2,
+        ('/icon.png', 200): 1,
+        ('/icon.png', 304): 2,
+    }
+
+
+def test_changed_icon_is_downloaded_again(addon, server):
+    (thumbId, titles) = scrape(addon, server)
+    server.replace('/icon.png', makePng('blue'))
+    (changedThumbId, titles) = scrape(addon, server)
+    assert changedThumbId not in (None, thumbId)
+    assert server.counts[('/icon.png', 200)] == 2
+    assert server.counts[('/page.html', 304)] == 1
@@ -0,0 +1,100 @@
+import contextlib
+import http.server
+import io
+import os
+import threading
+
+import pytest
+
+import plugin
+
+
+Image = pytest.importorskip('PIL.Image')
+retrieve = pytest.importorskip('retrieve')
+
+
+def makePng(size, color):
+    image = Image.new('RGBA', size, color)
+    output = io.BytesIO()
+    image.save(output, 'PNG')
+    return output.getvalue()
+
+
+ICON = makePng((64, 64), 'red')
+IMAGES = {
+    '/icon.png': ICON,
+    '/same-icon.png': ICON,
+    '/banner.png': makePng((1024, 512), 'blue'),
+}
+
+
+class ImageHandler(http.server.BaseHTTPRequestHandler):
+    def do_GET(self):
+        body = IMAGES[self.path]
+        self.send_response(200)
+        self.send_header('Content-Type', 'image/png')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture(scope='module')
+def serverUrl():
+    server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), ImageHandler)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.start()
+    try:
+        yield 'http://127.0.0.1:{}'.format(server.server_address[1])
+    finally:
+        server.shutdown()
+        server.server_close()
+        thread.join()
+
+
+def test_identical_images_are_stored_once(serverUrl, tmp_path):
+    first = retrieve.retrieve(serverUrl + '/icon.png', str(tmp_path))
+    second = retrieve.retrieve(serverUrl + '/same-icon.png', str(tmp_path))
+    assert first['thumb'] == second['thumb']
+    assert os.listdir(str(tmp_path)) == [first['thumb'] + '.png']
+
+
+def test_large_images_are_downsampled(serverUrl, tmp_path):
+    result = retrieve.retrieve(serverUrl + '/banner.png', str(tmp_path))
+    with Image.open(str(tmp_path / (result['thumb'] + '.png'))) as thumb:
+        assert thumb.size == (retrieve.THUMB_SIZE, retrieve.THUMB_SIZE // 2)
+
+
+def test_unchanged_content_is_not_saved_again(serverUrl, tmp_path):
+    first = retrieve.retrieve(serverUrl + '/icon.png', str(tmp_path))
+    os.remove(str(tmp_path / (first['thumb'] + '.png')))
+    second = retrieve.retrieve(
+        serverUrl + '/icon.png', str(tmp_path), contentHash=first['hash'])
+    assert second['unchanged']
+    assert os.listdir(str(tmp_path)) == []
+
+
+@pytest.fixture
+def addon(tmp_path, monkeypatch):
+    monkeypatch.setenv('KODI_STUB_PROFILE', str(tmp_path))
+    addon = plugin.RemoteControlBrowserPlugin(1)
+    plugin.makedirs(addon.thumbsFolder)
+    with contextlib.closing(addon):
+        yield addon
+
+
+def test_shared_thumbnail_outlives_all_but_its_last_bookmark(addon):
+    with addon.openBookmarks() as store:
+        (first, second) = store.list()[:2]
+        for bookmark in (first, second):
+            store.update(bookmark.id, thumb='shared')
+    thumbPath = addon.getThumbPath('shared')
+    with open(thumbPath, 'wb') as thumbFile:
+        thumbFile.write(ICON)
+
+    addon.removeBookmark(first.id)
+    assert os.path.isfile(thumbPath)
+    addon.removeBookmark(second.id)
+    assert not os.path.exists(thumbPath)
@@ -0,0 +1,142 @@
+import contextlib
+import glob
+import os
+import time
+
+import pytest
+
+import browse
+
+
+INPUT_EVENT = browse.UinputInjector.INPUT_EVENT
+EVENT_NODE_TIMEOUT = 2  # seconds
+
+
+def decodeEvents(data):
+    """Returns the (type, code, value) of each input_event in a buffer"""
+    return [
+        (eventType, code, value)
+        for (seconds, microseconds, eventType, code, value)
+        in INPUT_EVENT.iter_unpack(data)]
+
+
+def withoutSync(events):
+    return [
+        event for event in events if event[0] != browse.UinputInjector.EV_SYN]
+
+
+EVENTS = [
+    browse.KeyInput(('a', 'Shift+Left')),
+    browse.ClickInput(1),
+    browse.MoveInput(5, -3),
+]
+EXPECTED = [
+    (browse.UinputInjector.EV_KEY, 30, 1),
+    (browse.UinputInjector.EV_KEY, 30, 0),
+    (browse.UinputInjector.EV_KEY, 42, 1),
+    (browse.UinputInjector.EV_KEY, 105, 1),
+    (browse.UinputInjector.EV_KEY, 105, 0),
+    (browse.UinputInjector.EV_KEY, 42, 0),
+    (browse.UinputInjector.EV_KEY, browse.UinputInjector.BTN_LEFT, 1),
+    (browse.UinputInjector.EV_KEY, browse.UinputInjector.BTN_LEFT, 0),
+    (browse.UinputInjector.EV_REL, browse.UinputInjector.REL_X, 5),
+    (browse.UinputInjector.EV_REL, browse.UinputInjector.REL_Y, -3),
+]
+
+
+def test_batch_is_written_at_once():
+    (readFd, writeFd) = os.pipe()
+    with contextlib.closing(os.fdopen(readFd, 'rb', buffering=0)) as reader:
+        injector = browse.UinputInjector(writeFd)
+        try:
+            injector.inject(EVENTS)
+        finally:
+            os.close(writeFd)
+        data = reader.read()
+    events = decodeEvents(data)
+    assert withoutSync(events) == EXPECTED
+    # Every key press, click and move ends with its own report.
+    assert events[-1] == (browse.UinputInjector.EV_SYN, 0, 0)
+
+
+def injectThroughPipe(injector, events):
+    (readFd, writeFd) = os.pipe()
+    with contextlib.closing(os.fdopen(readFd, 'rb', buffering=0)) as reader:
+        injector.fd = writeFd
+        try:
+            injector.inject(events)
+        finally:
+            os.close(writeFd)
+        return withoutSync(decodeEvents(reader.read()))
+
+
+@pytest.mark.parametrize(('button', 'expected'), [
+    (2, [
+        (browse.UinputInjector.EV_KEY, browse.UinputInjector.BTN_MIDDLE, 1),
+        (browse.UinputInjector.EV_KEY, browse.UinputInjector.BTN_MIDDLE, 0),
+    ]),
+    (3, [
+        (browse.UinputInjector.EV_KEY, browse.UinputInjector.BTN_RIGHT, 1),
+        (browse.UinputInjector.EV_KEY, browse.UinputInjector.BTN_RIGHT, 0),
+    ]),
+    (4, [(browse.UinputInjector.EV_REL, browse.UinputInjector.REL_WHEEL, 1)]),
+    (5, [(browse.UinputInjector.EV_REL, browse.UinputInjector.REL_WHEEL, -1)]),
+])
+def test_buttons_follow_the_x_numbering(button, expected):
+    injector = browse.UinputInjector(None)
+    assert injectThroughPipe(injector, [browse.ClickInput(button)]) == expected
+
+
+def test_unknown_keys_are_reported_once_and_skipped(caplog):
+    injector = browse.UinputInjector(None)
+    injector.checkKeys(['Hyper_Q', 'a'])
+    assert caplog.text.count('Skipping key sequence') == 1
+    events = injectThroughPipe(
+        injector, [browse.KeyInput(('Hyper_Q', 'a'))])
+    assert events == [
+        (browse.UinputInjector.EV_KEY, 30, 1),
+        (browse.UinputInjector.EV_KEY, 30, 0),
+    ]
+    assert caplog.text.count('Skipping key sequence') == 1
+
+
+def findEventNode(sysname):
+    deadline = time.monotonic() + EVENT_NODE_TIMEOUT
+    while time.monotonic() < deadline:
+        for eventFolder in glob.glob(
+                '/sys/devices/virtual/input/{}/event*'.format(sysname)):
+            node = os.path.join('/dev/input', os.path.basename(eventFolder))
+            if os.access(node, os.R_OK):
+                return node
+        time.sleep(0.05)
+    return None
+
+
+@pytest.mark.skipif(
+    not os.access(browse.UINPUT_PATH, os.W_OK),
+    reason='needs write access to ' + browse.UINPUT_PATH)
+def test_events_read_back_from_evdev_node():
+    injector = browse.UinputInjector.create()
+    with contextlib.closing(injector):
+        node = findEventNode(injector.getSysname())
+        if node is None:
+            pytest.skip('the evdev node of the virtual device did not appear')
+        fd = os.open(node, os.O_RDONLY | os.O_NONBLOCK)
+        try:
+            injector.inject(EVENTS)
+            events = []
+            deadline = time.monotonic() + EVENT_NODE_TIMEOUT
+            while (len(withoutSync(events)) < len(EXPECTED) and
+                    time.monotonic() < deadline):
+                try:
+                    data = os.read(fd, INPUT_EVENT.size * 64)
+                except BlockingIOError:
+                    time.sleep(0.01)
+                    continue
+                events.extend(decodeEvents(data))
+        finally:
+            os.close(fd)
+    # The kernel may add scan code (EV_MSC) events of its own.
+    assert [
+        event for event in withoutSync(events)
+        if event[0] != 0x04] == EXPECTED
@@ -0,0 +1,93 @@
+import os
+import signal
+import time
+
+import pytest
+
+import plugin
+import service
+
+
+@pytest.fixture
+def addon(tmp_path, monkeypatch):
+    profileFolder = tmp_path / 'profile'
+    profileFolder.mkdir()
+    monkeypatch.setenv('KODI_STUB_PROFILE', str(profileFolder))
+    monkeypatch.setattr(service, 'WARM_BROWSER_SETTLE_DELAY', 0)
+    return service.RemoteControlBrowserService()
+
+
+def writeBrowser(tmp_path, body):
+    browserPath = tmp_path / 'chromium'
+    browserPath.write_text('#!/bin/sh\n' + body + '\n')
+    browserPath.chmod(0o755)
+    return str(browserPath)
+
+
+def waitForStop(pid):
+    deadline = time.monotonic() + 5
+    while time.monotonic() < deadline:
+        with open('/proc/{}/stat'.format(pid)) as statFile:
+            if statFile.read().rpartition(')')[2].split()[0] == 'T':
+                return True
+        time.sleep(0.01)
+    return False
+
+
+def waitForExit(proc):
+    deadline = time.monotonic() + 5
+    while proc.poll() is None and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+
+@pytest.fixture
+def pool(addon):
+    pool = service.WarmBrowserPool(addon)
+    try:
+        yield pool
+    finally:
+        pool.shutdown()
+
+
+def test_settled_spare_is_stopped_and_claimed_once(tmp_path, pool):
+    browserPath = writeBrowser(tmp_path, 'exec sleep 60')
+    pool.settings = (browserPath, '--kiosk')
+    pool.maintain()
+    pool.maintain()
+    spare = pool.spare
+    assert waitForStop(spare.pid)
+
+    launcher = plugin.RemoteControlBrowserPlugin(1)
+    # A spare started with other settings stays with the service.
+    assert launcher.claimWarmBrowser(browserPath, '') is None
+    assert launcher.claimWarmBrowser(browserPath, '--kiosk') == spare.pid
+    assert launcher.claimWarmBrowser(browserPath, '--kiosk') is None
+
+    # The claimed spare belongs to the wrapper, so the service leaves it be.
+    pool.shutdown()
+    try:
+        assert spare.poll() is None
+    finally:
+        os.killpg(spare.pid, signal.SIGKILL)
+        spare.wait()
+
+
+def test_spare_that_exits_while_starting_is_not_restarted(tmp_path, pool):
+    pool.settings = (writeBrowser(tmp_path, 'exit 1'), '')
+    pool.maintain()
+    waitForExit(pool.spare)
+    pool.maintain()
+    assert pool.spare is None
+    assert pool.settings is None
+
+
+def test_replacement_waits_for_the_browsing_session(tmp_path, pool):
+    pool.settings = (writeBrowser(tmp_path, 'exec sleep 60'), '')
+    with open(pool.browserLockPath, 'w') as lockFile:
+        lockFile.write(str(os.getpid()))
+    pool.maintain()
+    assert pool.spare is None
+
+    os.remove(pool.browserLockPath)
+    pool.maintain()
+    assert pool.spare is not None
@@ -0,0 +1,31 @@
+import stat
+import sys
+
+import browse
+
+
+FAKE_XDOTOOL = '''#!{}
+import sys
+with open(sys.argv[0] + '.log', 'a') as logFile:
+    logFile.write(repr(sys.argv[1:]) + '\\n')
+'''
+
+
+def test_each_command_runs_before_inject_returns(tmp_path):
+    xdotoolPath = tmp_path / 'xdotool'
+    xdotoolPath.write_text(FAKE_XDOTOOL.format(sys.executable))
+    xdotoolPath.chmod(xdotoolPath.stat().st_mode | stat.S_IXUSR)
+    logPath = tmp_path / 'xdotool.log'
+
+    injector = browse.XdotoolInjector(str(xdotoolPath))
+    injector.inject([browse.KeyInput(('a', 'ctrl+c'))])
+    # The command must not wait for the injector to be closed.
+    assert logPath.read_text().splitlines() == [
+        repr(['key', '--clearmodifiers', '--', 'a', 'ctrl+c'])]
+
+    injector.inject([browse.ClickInput(1), browse.MoveInput(-3, 4)])
+    injector.close()
+    assert logPath.read_text().splitlines()[1:] == [
+        repr(['click', '--clearmodifiers', '1']),
+        repr(['mousemove_relative', '--', '-3', '4']),
+    ]
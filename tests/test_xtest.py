@@ -0,0 +1,45 @@
+import types
+
+import browse
+import keymap
+
+
+KEYSYMS = {'a': 97, 'A': 65, 'Shift_L': 65505}
+KEYCODES = {97: [(38, 0)], 65: [(38, 1)], 65505: [(50, 0)]}
+
+
+class FakeDisplay(object):
+    def keysym_to_keycodes(self, keysym):
+        return iter(KEYCODES.get(keysym, []))
+
+    def sync(self):
+        pass
+
+
+def makeFakeXlib(fakeInputs):
+    return types.SimpleNamespace(
+        X=types.SimpleNamespace(NoSymbol=0, KeyPress=2, KeyRelease=3),
+        XK=types.SimpleNamespace(
+            string_to_keysym=lambda name: KEYSYMS.get(name, 0)),
+        ext=types.SimpleNamespace(xtest=types.SimpleNamespace(
+            fake_input=lambda display, eventType, detail: fakeInputs.append(
+                (eventType, detail)))))
+
+
+def test_unknown_keys_are_reported_once_at_keymap_load(monkeypatch, caplog):
+    fakeInputs = []
+    monkeypatch.setattr(browse, 'Xlib', makeFakeXlib(fakeInputs))
+    injector = browse.XtestInjector(FakeDisplay())
+    loadedKeymap = keymap.Keymap(
+        sources=[], startupMode=None, bindings=[], commands={
+            'KEY Hyper_Q': keymap.LircCommand('KEY', ('Hyper_Q',)),
+            'MULTITAP A a': keymap.LircCommand('MULTITAP', ('A', 'a')),
+            'CLICK 1': keymap.LircCommand('CLICK', (1,)),
+        })
+
+    browse.checkKeymapKeys(injector, loadedKeymap)
+    assert caplog.text.count('Skipping key sequence') == 1
+
+    injector.inject([browse.KeyInput(('Hyper_Q', 'A'))])
+    assert fakeInputs == [(2, 50), (2, 38), (3, 38), (3, 50)]
+    assert caplog.text.count('Skipping key sequence') == 1